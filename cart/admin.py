@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import CartItem
 
 # Register your models here.
+@admin.register(CartItem)
+class CartItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'product', 'quantity', 'updated_at')
+    raw_id_fields = ('user', 'product')
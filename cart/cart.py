@@ -1,39 +1,43 @@
 
 from decimal import Decimal
-from store.models import Product,Profile
+from store.models import Product
+from .models import CartItem
+
+# Session entry marking carts already in the current {'product id': {'quantity': n}} format
+CART_FORMAT_KEY = 'cart_format'
+CART_FORMAT = 2
+
+def get_cart(request):
+    """
+    Return the request's Cart, created on first use.
+
+    Views, the context processor and templates all share this one instance, so
+    the session is read and the cart's products are queried once per request.
+    """
+    if not hasattr(request, '_cart'):
+        request._cart = Cart(request)
+    return request._cart
 
 class Cart(): 
     def __init__(self, request): 
         self.session = request.session 
         #Get request
         self.request = request
-        cart = self.session.get("session_key")
-        #if the user is new, no session key! create one
-        if 'session_key' not in request.session:
-            cart = self.session["session_key"] = {}
-        #Make sure cart is available on all pages of the site
-        self.cart = cart
-        
-        # Temporary fix for legacy cart data that stored quantity as int directly
-        # checks if key is int and converts to dictionary if so
-        changed = False
+        #New visitors get an empty cart; it is only stored in the session once something is added
+        self.cart = self.session.get("session_key", {})
+        #Products of the cart, loaded by the first method that needs them, and their ids
+        self._products = None
+        self._product_ids = None
+        if self.cart and self.session.get(CART_FORMAT_KEY) != CART_FORMAT:
+            self.upgrade()
+
+    def upgrade(self):
+        # One-time conversion of legacy session carts that stored the quantity as an int
         for key, value in self.cart.items():
             if isinstance(value, int):
                 self.cart[key] = {'quantity': value}
-                changed = True
-        if changed:
-            self.save()
-    def db_add(self, product, quantity): 
-        product_id = str(product )
-        product_qty = str(quantity)
-        if product_id in self.cart:
-            #self.cart[product_id]['quantity'] += int(product_qty)
-            pass
-        else:
-            self.cart[product_id] = {'quantity': int(product_qty)} 
-        self.save() 
-    
-    
+        self.save()
+
     def add(self, product, quantity): 
         product_id = str(product.id)
         product_qty = str(quantity)
@@ -41,29 +45,58 @@ class Cart():
             pass
         else:
             self.cart[product_id] = {'quantity': int(product_qty)} 
+            self.persist([product_id])
         self.save() 
-        #Deal with logged in users
-        if self.request.user.is_authenticated:
-            #Get the current user profile
-            current_user = Profile.objects.filter(user__id=self.request.user.id)
-            #Convert
-            cart_user = str(self.cart)
-            cart_user = cart_user.replace("\'", "\"")
-            #Save our carty to the profile model
-            current_user.update(old_cart=str(cart_user))
-            
+
+    def persist(self, product_ids):
+        #Deal with logged in users: upsert only the changed items into their saved cart
+        if not product_ids or not self.request.user.is_authenticated:
+            return
+        CartItem.objects.bulk_create(
+            [
+                CartItem(user=self.request.user, product_id=int(product_id), quantity=self.cart[product_id]['quantity'])
+                for product_id in product_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['user', 'product'],
+            update_fields=['quantity', 'updated_at'],
+        )
+
+    def merge_saved(self):
+        """
+        Merge the saved cart of the user who just logged in with the session cart.
+
+        Items only in the saved cart are added to the session; items in the session
+        cart (which win when both have a product) are saved with one bulk upsert.
+        """
+        user = self.request.user
+        saved = {
+            str(product_id): quantity
+            for product_id, quantity in CartItem.objects.filter(user=user).values_list('product_id', 'quantity')
+        }
+        changed = [product_id for product_id, item in self.cart.items() if saved.get(product_id) != item['quantity']]
+        if changed:
+            #Products may have been deleted since they were put in the session cart
+            existing = set(Product.objects.filter(id__in=changed).values_list('id', flat=True))
+            self.persist([product_id for product_id in changed if int(product_id) in existing])
+        for product_id, quantity in saved.items():
+            if product_id not in self.cart:
+                self.cart[product_id] = {'quantity': quantity}
+        self.save()
            
     def save(self): 
         self.session["session_key"] = self.cart
+        self.session[CART_FORMAT_KEY] = CART_FORMAT
         self.session.modified = True
     def remove(self, product): 
         product_id = str(product.id)
         if product_id in self.cart: 
             del self.cart[product_id]
             self.save()
+            if self.request.user.is_authenticated:
+                CartItem.objects.filter(user=self.request.user, product_id=product.id).delete()
     def __iter__(self): 
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
+        products = self.get_prods()
         cart = self.cart.copy()
         for key in cart:
             cart[key] = cart[key].copy()
@@ -84,12 +117,15 @@ class Cart():
         #return sum(item['quantity'] for item in self.cart.values())
         return len(self.cart)
     def get_prods(self):
-        #Get ids of products in cart
-        product_ids = self.cart.keys()
-        #Use ids to look up products in db
-        products = Product.objects.filter(id__in=product_ids)
-        #Return those looked up products
-        return products
+        #One query for the products in the cart, shared by __iter__ and car_total;
+        #repeated only if products were added or removed since
+        product_ids = set(self.cart.keys())
+        if self._products is None or product_ids != self._product_ids:
+            products = Product.objects.filter(id__in=product_ids)
+            #Evaluate now: later iteration, len() and count() reuse the loaded rows
+            len(products)
+            self._products, self._product_ids = products, product_ids
+        return self._products
     def get_quants(self):
         quantities = self.cart
         return quantities
@@ -105,14 +141,12 @@ class Cart():
         # Update the quantity in the cart
         if product_id in self.cart:
             self.cart[product_id]['quantity'] = product_qty
+            self.persist([product_id])
             
         self.save()
         return self.cart
     def car_total(self):
-        # Get products IDs from cart keys
-        product_ids = self.cart.keys()
-        # Use ids to look up products in db
-        products = Product.objects.filter(id__in=product_ids)
+        products = self.get_prods()
         
         total = Decimal('0')
         for product in products:
@@ -126,5 +160,8 @@ class Cart():
         return total
 
     def clear(self): 
-        del self.session["session_key"]
-        self.session.modified = True  
\ No newline at end of file
+        self.session.pop("session_key", None)
+        self.session.modified = True
+        self.cart = {}
+        if self.request.user.is_authenticated:
+            CartItem.objects.filter(user=self.request.user).delete()
\ No newline at end of file
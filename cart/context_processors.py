@@ -1,8 +1,10 @@
-from .cart import Cart
+from django.utils.functional import SimpleLazyObject
+from .cart import get_cart
 
 # Create context processor so our Cart can work on all pages of the site
 # This will make the cart available to all templates
 # This is a function that returns a dictionary
+# The cart is lazy: the session and the products are only read by templates that use it
 def cart(request):
     # Return the cart object
-    return {'cart': Cart(request)}
\ No newline at end of file
+    return {'cart': SimpleLazyObject(lambda: get_cart(request))}
\ No newline at end of file
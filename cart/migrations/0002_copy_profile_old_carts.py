@@ -0,0 +1,43 @@
+# Generated by Django 5.2.10 on 2026-10-19 15:01
+
+import json
+from django.db import migrations
+
+
+def copy_old_carts(apps, schema_editor):
+    """Create CartItem rows from the JSON carts saved in Profile.old_cart."""
+    Profile = apps.get_model('store', 'Profile')
+    Product = apps.get_model('store', 'Product')
+    CartItem = apps.get_model('cart', 'CartItem')
+
+    saved = {}
+    for user_id, old_cart in Profile.objects.exclude(old_cart__isnull=True).exclude(old_cart='').values_list('user_id', 'old_cart'):
+        try:
+            cart = json.loads(old_cart)
+        except ValueError:
+            # Carts longer than the 255-character column were stored truncated
+            continue
+        if isinstance(cart, dict):
+            saved[user_id] = cart
+
+    product_ids = {int(key) for cart in saved.values() for key in cart if str(key).isdigit()}
+    existing = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+    items = []
+    for user_id, cart in saved.items():
+        for key, value in cart.items():
+            # Legacy carts stored the quantity itself instead of {'quantity': n}
+            quantity = value.get('quantity') if isinstance(value, dict) else value
+            if str(key).isdigit() and int(key) in existing and isinstance(quantity, int) and quantity > 0:
+                items.append(CartItem(user_id=user_id, product_id=int(key), quantity=quantity))
+    CartItem.objects.bulk_create(items, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_old_carts, migrations.RunPython.noop),
+    ]
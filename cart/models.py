@@ -1,3 +1,23 @@
 from django.db import models
+from django.contrib.auth.models import User
+from store.models import Product
 
 # Create your models here.
+
+# Saved cart of a logged-in user: one row per product, written by Cart with upserts
+class CartItem(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Cart Item'
+        verbose_name_plural = 'Cart Items'
+        constraints = [
+            # Upsert target; its (user, product) index also serves the per-user cart read
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_cart_item_per_user'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id} for {self.user_id}'
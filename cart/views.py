@@ -1,5 +1,5 @@
 from django.shortcuts import render, get_object_or_404
-from .cart import Cart
+from .cart import get_cart
 from store.models import Product
 from django.http import JsonResponse 
 from django.contrib import messages
@@ -7,7 +7,7 @@ from django.contrib import messages
 # Create your views here.
 def cart_summary(request):
     #Get cart instance
-    cart = Cart(request)
+    cart = get_cart(request)
     #Get products in cart
     cart_products = cart.get_prods()
     quantities = cart.get_quants()
@@ -15,7 +15,7 @@ def cart_summary(request):
     totals = cart.car_total()
     return render(request, 'cart_summary.html',{'cart_products': cart_products  , 'quantities': quantities, 'totals': totals, 'cart': cart})
 def cart_add(request):
-    cart = Cart(request)
+    cart = get_cart(request)
     if request.POST.get('action') == 'post':
         product_id = int(request.POST.get('product_id'))
         product_qty = int(request.POST.get('product_qty'))
@@ -27,7 +27,7 @@ def cart_add(request):
         return response
     
 def cart_delete(request):
-    cart = Cart(request)
+    cart = get_cart(request)
     if request.POST.get('action') == 'post':
         product_id = int(request.POST.get('product_id'))
         # product_qty = int(request.POST.get('product_qty')) # Not needed for delete
@@ -37,7 +37,7 @@ def cart_delete(request):
         messages.success(request, 'Product removed from cart')  
         return response
 def cart_update(request):
-    cart = Cart(request)
+    cart = get_cart(request)
     if request.POST.get('action') == 'post':
         product_id = int(request.POST.get('product_id'))
         product_qty = int(request.POST.get('product_qty'))
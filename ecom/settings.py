@@ -26,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'store',
     'cart',
     'payment',
@@ -54,6 +55,7 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 MIDDLEWARE = [
+    'recommendations.instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -134,6 +136,11 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'postgres'),
         'HOST': os.getenv('POSTGRES_HOST', 'db'),      # ← service name!
         'PORT': os.getenv('POSTGRES_PORT', '5432'),
+        'OPTIONS': {
+            # pgvector >= 0.8: keep scanning the HNSW index until filtered queries
+            # (excluded purchases, embedding version) have enough rows, in exact order
+            'options': '-c hnsw.iterative_scan=strict_order',
+        },
     }
 }
 
@@ -167,3 +174,63 @@ TIME_ZONE = 'UTC'
 USE_I18N = True
 
 USE_TZ = False
+
+
+# Products per page on the storefront home page (further pages load on scroll)
+STORE_PAGE_SIZE = int(os.getenv('STORE_PAGE_SIZE', '24'))
+# Search-box autocomplete: browser/CDN cache lifetime of a suggestion list, and how
+# often each process rebuilds its prefix index to pick up other processes' changes
+STORE_AUTOCOMPLETE_CACHE_SECONDS = int(os.getenv('STORE_AUTOCOMPLETE_CACHE_SECONDS', '300'))
+STORE_AUTOCOMPLETE_REFRESH_SECONDS = int(os.getenv('STORE_AUTOCOMPLETE_REFRESH_SECONDS', '300'))
+# Rendered fragments: product cards (keyed by product version, so long-lived) and
+# category listings (invalidated by product/category signals; see store/fragments.py)
+STORE_CARD_CACHE_SECONDS = int(os.getenv('STORE_CARD_CACHE_SECONDS', str(60 * 60 * 24)))
+STORE_LISTING_CACHE_SECONDS = int(os.getenv('STORE_LISTING_CACHE_SECONDS', '600'))
+# Full-page cache of anonymous storefront pages (store/page_cache.py); 0 disables it
+STORE_PAGE_CACHE_SECONDS = int(os.getenv('STORE_PAGE_CACHE_SECONDS', '600'))
+# Part of the ETag of cached pages: change it when a deploy changes their templates
+STORE_PAGE_VERSION = os.getenv('STORE_PAGE_VERSION', '1')
+
+# Recommendations (RAG)
+# Vector column used for similarity search: 'full' (float32), 'half' (float16 halfvec)
+# or 'binary' (bit-quantized coarse pass re-ranked with the float32 vectors)
+RAG_VECTOR_REPRESENTATION = os.getenv('RAG_VECTOR_REPRESENTATION', 'full')
+# Size of the binary candidate pool as a multiple of top_k
+RAG_BINARY_RERANK_FACTOR = int(os.getenv('RAG_BINARY_RERANK_FACTOR', '10'))
+# Maximal-marginal-relevance re-ranking: 1.0 = relevance only, 0.0 = diversity only
+RAG_MMR_LAMBDA = float(os.getenv('RAG_MMR_LAMBDA', '0.7'))
+# Size of the MMR candidate pool as a multiple of top_k
+RAG_MMR_POOL_FACTOR = int(os.getenv('RAG_MMR_POOL_FACTOR', '5'))
+# Prompt context budget (estimated tokens) per retrieved book and for the whole context
+RAG_CONTEXT_BOOK_TOKENS = int(os.getenv('RAG_CONTEXT_BOOK_TOKENS', '120'))
+RAG_CONTEXT_TOTAL_TOKENS = int(os.getenv('RAG_CONTEXT_TOTAL_TOKENS', '800'))
+# Ollama chat model used for the recommendation text
+OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+# Chat models, fastest first and most capable last, e.g. 'llama3.2:1b,llama3.1:8b'
+RAG_LLM_MODELS = [model.strip() for model in os.getenv('RAG_LLM_MODELS', 'llama3.1:8b').split(',') if model.strip()]
+# Number of recent calls per model used for the routing p50/p95
+RAG_LLM_LATENCY_WINDOW = int(os.getenv('RAG_LLM_LATENCY_WINDOW', '100'))
+# Latency budget (seconds) of interactive pages; they get the best model whose p95 fits
+RAG_INTERACTIVE_LATENCY_BUDGET = float(os.getenv('RAG_INTERACTIVE_LATENCY_BUDGET', '3'))
+# How long Ollama keeps the model loaded after a request
+RAG_LLM_KEEP_ALIVE = os.getenv('RAG_LLM_KEEP_ALIVE', '30m')
+# Pooled keep-alive HTTP connections per client
+RAG_LLM_MAX_CONNECTIONS = int(os.getenv('RAG_LLM_MAX_CONNECTIONS', '10'))
+# Default per-call deadline (seconds) and HTTP timeout for abandoned calls
+RAG_LLM_DEADLINE = float(os.getenv('RAG_LLM_DEADLINE', '20'))
+RAG_LLM_TIMEOUT = float(os.getenv('RAG_LLM_TIMEOUT', '60'))
+# Circuit breaker (one per model): open when this share of the last WINDOW calls failed or took
+# longer than SLOW_CALL_SECONDS (after MIN_CALLS calls); probe again after RESET_SECONDS
+RAG_LLM_BREAKER_FAILURE_RATE = float(os.getenv('RAG_LLM_BREAKER_FAILURE_RATE', '0.5'))
+RAG_LLM_BREAKER_SLOW_CALL_SECONDS = float(os.getenv('RAG_LLM_BREAKER_SLOW_CALL_SECONDS', '10'))
+RAG_LLM_BREAKER_WINDOW = int(os.getenv('RAG_LLM_BREAKER_WINDOW', '20'))
+RAG_LLM_BREAKER_MIN_CALLS = int(os.getenv('RAG_LLM_BREAKER_MIN_CALLS', '5'))
+RAG_LLM_BREAKER_RESET_SECONDS = float(os.getenv('RAG_LLM_BREAKER_RESET_SECONDS', '30'))
+# LLM record/replay: 'passthrough' (default), 'record' (store every answer) or
+# 'replay' (answer only from the store, never call the model); see recommendations/replay.py
+RAG_LLM_REPLAY_MODE = os.getenv('RAG_LLM_REPLAY_MODE', 'passthrough')
+RAG_LLM_REPLAY_PATH = os.getenv('RAG_LLM_REPLAY_PATH', str(BASE_DIR / 'llm_responses.jsonl'))
+# How recommendations are explained: 'llm' (generated text) or 'template' (LLM-free, from book features)
+RAG_EXPLANATION_MODE = os.getenv('RAG_EXPLANATION_MODE', 'llm')
+# Bearer token for scraping /recommendations/metrics/; without one the endpoint is staff-only
+RAG_METRICS_TOKEN = os.getenv('RAG_METRICS_TOKEN', '')
@@ -1,2 +1,3 @@
 -- init-pgvector.sql
 CREATE EXTENSION IF NOT EXISTS vector;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
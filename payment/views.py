@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.shortcuts import render
-from cart.cart import Cart
+from cart.cart import get_cart
 
 from payment.forms import ShippingForm
 from payment.models import ShippingAddress
@@ -7,14 +8,16 @@ from payment.models import ShippingAddress
 from recommendations.rag import get_recommendations_by_book_title, get_recommendations
 # Create your views here.
 def checkout(request):
-    cart = Cart(request)
+    cart = get_cart(request)
     cart_products = cart.get_prods()
     quantities = cart.get_quants()
     totals = cart.car_total()
     
     
     #recommendations = get_recommendations_by_book_title("Estudio del Quijote")
-    recommendations = get_recommendations(request.user.id)
+    recommendations = get_recommendations(
+        request.user.id, latency_budget=settings.RAG_INTERACTIVE_LATENCY_BUDGET
+    )
     if request.user.is_authenticated: 
          
         form = ShippingForm(request.POST or None,instance=ShippingAddress.objects.get(user=request.user))
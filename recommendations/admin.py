@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Book, Purchase
+from .models import Book, Purchase, EmbeddingModel
 
 # Register your models here.
 #admin.site.register(Book)
@@ -19,3 +19,10 @@ class PurchaseAdmin(admin.ModelAdmin):
     #search_fields = ('user__username', 'book__title')
     #date_hierarchy = 'purchase_date'
     #ordering = ('-purchase_date',)
+
+
+@admin.register(EmbeddingModel)
+class EmbeddingModelAdmin(admin.ModelAdmin):
+    list_display = ('name', 'version', 'dimensions', 'status', 'activated_at')
+    # Status changes go through `manage.py embedding_model activate` so the flip stays atomic
+    readonly_fields = ('status', 'activated_at')
@@ -1,14 +1,63 @@
 from rest_framework import viewsets, status
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from ..models import Book
 from .serializers import BookSerializer
+from ..explanations import EXPLANATION_MODES
+from ..structured import OUTPUT_FORMATS
 from ..rag import get_recommendations, get_recommendations_by_book_title, get_recommendations_by_query
 
+def book_list_version(request, *args, **kwargs):
+    """
+    Validators of the book list: the latest update and the number of books (so
+    deletions count too), from one aggregate query served by the updated_at index.
+    Memoized on the request, which both the ETag and Last-Modified functions use.
+    """
+    if not hasattr(request, 'book_list_version'):
+        request.book_list_version = Book.objects.aggregate(latest=Max('updated_at'), count=Count('id'))
+    return request.book_list_version
+
+
+def book_list_etag(request, *args, **kwargs):
+    version = book_list_version(request)
+    latest = int(version['latest'].timestamp() * 1_000_000) if version['latest'] else 0
+    # The same URL renders as JSON or as the browsable API depending on Accept
+    return f'"books-{request.accepted_renderer.format}-{version["count"]}-{latest}"'
+
+
+def book_list_last_modified(request, *args, **kwargs):
+    return book_list_version(request)['latest']
+
+
+def book_updated_at(request, *args, **kwargs):
+    if not hasattr(request, 'book_updated_at'):
+        try:
+            request.book_updated_at = Book.objects.filter(pk=kwargs['pk']).values_list('updated_at', flat=True).first()
+        except ValueError:
+            # Not an id at all: no validators, and retrieve answers 404
+            request.book_updated_at = None
+    return request.book_updated_at
+
+
+def book_etag(request, *args, **kwargs):
+    updated_at = book_updated_at(request, *args, **kwargs)
+    if updated_at is None:
+        return None
+    return f'"book-{request.accepted_renderer.format}-{kwargs["pk"]}-{int(updated_at.timestamp() * 1_000_000)}"'
+
+
 class BookViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows books to be viewed, created, updated or deleted.
+
+    GETs carry ETag and Last-Modified validators computed from Book.updated_at
+    and answer 304 Not Modified, without serializing, when the client's copy is current.
     """
     queryset = Book.objects.all().order_by('-id')
     serializer_class = BookSerializer
@@ -18,6 +67,29 @@ class BookViewSet(viewsets.ModelViewSet):
     search_fields = ['title', 'reference', 'author', 'category']
     ordering_fields = ['price', 'title', 'id']
 
+    @method_decorator(cache_control(no_cache=True))
+    @method_decorator(condition(etag_func=book_list_etag, last_modified_func=book_list_last_modified))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(cache_control(no_cache=True))
+    @method_decorator(condition(etag_func=book_etag, last_modified_func=book_updated_at))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+def recommendations_response(recommendations, output):
+    """
+    Wrap a result of the rag functions.
+
+    Structured payloads are returned as they are; messages (no purchases, unknown
+    book, ...) become {"items": [], "message": ...} so clients always get `items`.
+    """
+    if output != 'structured':
+        return Response({"recommendations": recommendations})
+    if isinstance(recommendations, dict):
+        return Response(recommendations)
+    return Response({"items": [], "message": recommendations})
+
 @api_view(['GET', 'POST'])
 @permission_classes([AllowAny])
 def recommend_by_user(request):
@@ -29,8 +101,14 @@ def recommend_by_user(request):
         return Response({"error": "user_id is required"}, status=status.HTTP_400_BAD_REQUEST)
     
     top_k = int(request.data.get('top_k', 3))
-    recommendations = get_recommendations(user_id, top_k=top_k)
-    return Response({"recommendations": recommendations})
+    mode = request.data.get('mode') or request.query_params.get('mode')
+    if mode and mode not in EXPLANATION_MODES:
+        return Response({"error": f"mode must be one of {EXPLANATION_MODES}"}, status=status.HTTP_400_BAD_REQUEST)
+    output = request.data.get('output') or request.query_params.get('output')
+    if output and output not in OUTPUT_FORMATS:
+        return Response({"error": f"output must be one of {OUTPUT_FORMATS}"}, status=status.HTTP_400_BAD_REQUEST)
+    recommendations = get_recommendations(user_id, top_k=top_k, mode=mode, output=output)
+    return recommendations_response(recommendations, output)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -43,8 +121,17 @@ def recommend_by_title(request):
         return Response({"error": "title is required"}, status=status.HTTP_400_BAD_REQUEST)
     
     top_k = int(request.data.get('top_k', 5))
-    recommendations = get_recommendations_by_book_title(title, top_k=top_k)
-    return Response({"recommendations": recommendations})
+    mode = request.data.get('mode')
+    if mode and mode not in EXPLANATION_MODES:
+        return Response({"error": f"mode must be one of {EXPLANATION_MODES}"}, status=status.HTTP_400_BAD_REQUEST)
+    output = request.data.get('output')
+    if output and output not in OUTPUT_FORMATS:
+        return Response({"error": f"output must be one of {OUTPUT_FORMATS}"}, status=status.HTTP_400_BAD_REQUEST)
+    # Short "by title" explanations go to the fastest model that fits the interactive budget
+    recommendations = get_recommendations_by_book_title(
+        title, top_k=top_k, latency_budget=settings.RAG_INTERACTIVE_LATENCY_BUDGET, mode=mode, output=output
+    )
+    return recommendations_response(recommendations, output)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -57,5 +144,11 @@ def recommend_by_query(request):
         return Response({"error": "query is required"}, status=status.HTTP_400_BAD_REQUEST)
     
     top_k = int(request.data.get('top_k', 5))
-    recommendations = get_recommendations_by_query(query, top_k=top_k)
-    return Response({"recommendations": recommendations})
\ No newline at end of file
+    mode = request.data.get('mode')
+    if mode and mode not in EXPLANATION_MODES:
+        return Response({"error": f"mode must be one of {EXPLANATION_MODES}"}, status=status.HTTP_400_BAD_REQUEST)
+    output = request.data.get('output')
+    if output and output not in OUTPUT_FORMATS:
+        return Response({"error": f"output must be one of {OUTPUT_FORMATS}"}, status=status.HTTP_400_BAD_REQUEST)
+    recommendations = get_recommendations_by_query(query, top_k=top_k, mode=mode, output=output)
+    return recommendations_response(recommendations, output)
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+Circuit breaker for calls to the LLM host.
+
+The breaker tracks the outcome of the last `window` calls. Once at least
+`min_calls` have been recorded and the share of failed or slow calls reaches
+`failure_rate`, it opens. While it is open, calls are rejected immediately so
+callers can serve their fallback without waiting for a timeout. After
+`reset_timeout` seconds a single probe call is let through (half-open). If the
+probe succeeds the breaker closes; if it fails the breaker opens again.
+
+`before_call` hands out a ticket naming the state the call started in. Results
+reported with a ticket from an earlier state are dropped, so a slow call that
+began before the breaker opened can neither close it nor re-open it while the
+half-open probe is running: only the probe decides.
+"""
+import threading
+import time
+from collections import deque
+
+
+class LLMUnavailableError(Exception):
+    """The LLM could not produce an answer in time; serve the non-LLM fallback."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """The call was rejected because the circuit breaker is open."""
+
+
+class LLMTimeoutError(LLMUnavailableError):
+    """The call did not finish within its deadline."""
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate=0.5, slow_call_seconds=10.0, window=20, min_calls=5, reset_timeout=30.0,
+                 clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.outcomes = deque(maxlen=window)  # True for a failed or slow call
+        self.state = self.CLOSED
+        self.generation = 0  # Bumped on every state change; calls are tagged with it
+        self.opened_at = None
+        self.probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Check whether a call may proceed.
+
+        Returns:
+            int: Ticket to pass to record_success/record_failure
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half-open with a probe already running
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError('LLM circuit breaker is open')
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self.probe_in_flight:
+                    raise CircuitOpenError('LLM circuit breaker is half-open, probe in progress')
+                self.probe_in_flight = True
+            return self.generation
+
+    def record_success(self, duration, ticket=None):
+        """Record a completed call; calls slower than slow_call_seconds count as failures."""
+        self._record(duration >= self.slow_call_seconds, ticket)
+
+    def record_failure(self, ticket=None):
+        """Record a failed or timed-out call."""
+        self._record(True, ticket)
+
+    def _record(self, failed, ticket):
+        with self._lock:
+            if ticket is not None and ticket != self.generation:
+                # Started in an earlier state: its outcome says nothing about the current one
+                return
+            if self.state == self.HALF_OPEN:
+                self.probe_in_flight = False
+                if failed:
+                    self._open()
+                else:
+                    self._set_state(self.CLOSED)
+                    self.outcomes.clear()
+                return
+
+            self.outcomes.append(failed)
+            if (self.state == self.CLOSED and len(self.outcomes) >= self.min_calls
+                    and sum(self.outcomes) / len(self.outcomes) >= self.failure_rate):
+                self._open()
+
+    def _open(self):
+        self._set_state(self.OPEN)
+        self.opened_at = self.clock()
+        self.outcomes.clear()
+
+    def _set_state(self, state):
+        self.state = state
+        self.generation += 1
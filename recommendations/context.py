@@ -0,0 +1,140 @@
+"""
+Token-budgeted context for the RAG prompts.
+
+Book descriptions vary from a line to several thousand characters. The context
+builder caps every book at a per-book budget (trimming at sentence boundaries)
+and stops adding books once the total budget is spent, so prompt size - and with
+it time-to-first-token - stays bounded whatever the catalog contains.
+
+Token counts are estimated from the character length; it is deliberately cheap
+and slightly pessimistic compared to the Llama tokenizer on Spanish/English text.
+Trimmed summaries are cached per book and invalidated by its `updated_at`.
+"""
+import math
+import re
+from django.conf import settings
+from django.core.cache import cache
+
+CHARS_PER_TOKEN = 4
+SUMMARY_CACHE_TIMEOUT = 60 * 60 * 24
+NO_DESCRIPTION = "No description available."
+UNKNOWN_AUTHOR = "Unknown Author"
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…])\s+')
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in text without running a tokenizer."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def trim_to_sentences(text, max_tokens):
+    """
+    Trim text to at most max_tokens, cutting at a sentence boundary.
+
+    If even the first sentence is over budget it is cut at the last whole word
+    and an ellipsis is appended.
+
+    Args:
+        text (str): Text to trim
+        max_tokens (int): Token budget
+
+    Returns:
+        str: The text itself if it fits, otherwise its longest sentence prefix that does
+    """
+    text = ' '.join((text or '').split())
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    kept = []
+    used = 0
+    for sentence in SENTENCE_BOUNDARY.split(text):
+        # +1 for the joining space
+        cost = estimate_tokens(sentence) + (1 if kept else 0)
+        if used + cost > max_tokens:
+            break
+        kept.append(sentence)
+        used += cost
+
+    if kept:
+        return ' '.join(kept)
+
+    max_chars = max(max_tokens * CHARS_PER_TOKEN - 1, 0)
+    cut = text[:max_chars].rsplit(' ', 1)[0]
+    return cut + '…'
+
+
+def summary_cache_key(book, max_tokens):
+    """Cache key of a book's trimmed description; changes whenever the book is saved."""
+    version = book.updated_at.timestamp() if book.updated_at else 0
+    return f"book_summary_{book.id}_{version}_{max_tokens}"
+
+
+def get_book_summaries(books, max_tokens):
+    """
+    Return the trimmed description of each book, using the cache where possible.
+
+    Args:
+        books (list[Book]): Books to summarize
+        max_tokens (int): Per-book token budget
+
+    Returns:
+        dict: book id -> trimmed description
+    """
+    keys = {book.id: summary_cache_key(book, max_tokens) for book in books}
+    cached = cache.get_many(keys.values())
+
+    summaries = {}
+    missing = {}
+    for book in books:
+        key = keys[book.id]
+        if key in cached:
+            summaries[book.id] = cached[key]
+        else:
+            summaries[book.id] = trim_to_sentences(book.description or NO_DESCRIPTION, max_tokens)
+            missing[key] = summaries[book.id]
+
+    if missing:
+        cache.set_many(missing, SUMMARY_CACHE_TIMEOUT)
+    return summaries
+
+
+def format_book(book, summary, with_id=False):
+    """Format one book as a context entry, optionally prefixed with its id for structured answers."""
+    entry = f"Title: {book.title}\nAuthor: {book.author or UNKNOWN_AUTHOR}\nDescription: {summary}\n"
+    return f"Book id: {book.id}\n{entry}" if with_id else entry
+
+
+def build_context(books, book_tokens=None, total_tokens=None, with_ids=False):
+    """
+    Build the prompt context for a ranked list of books within a token budget.
+
+    Books are added in rank order until the total budget is spent; the first
+    book is always included.
+
+    Args:
+        books (list[Book]): Retrieved books, best first
+        book_tokens (int): Per-book description budget (default: settings.RAG_CONTEXT_BOOK_TOKENS)
+        total_tokens (int): Budget for the whole context (default: settings.RAG_CONTEXT_TOTAL_TOKENS)
+        with_ids (bool): Prefix each entry with "Book id: <id>" so the model can refer to it
+
+    Returns:
+        str: Context string for the prompt
+    """
+    book_tokens = book_tokens or getattr(settings, 'RAG_CONTEXT_BOOK_TOKENS', 120)
+    total_tokens = total_tokens or getattr(settings, 'RAG_CONTEXT_TOTAL_TOKENS', 800)
+
+    summaries = get_book_summaries(books, book_tokens)
+    entries = []
+    used = 0
+    for book in books:
+        entry = format_book(book, summaries[book.id], with_ids)
+        cost = estimate_tokens(entry)
+        if entries and used + cost > total_tokens:
+            break
+        entries.append(entry)
+        used += cost
+
+    return "\n".join(entries)
@@ -0,0 +1,169 @@
+"""
+Compact binary dump of the embedding corpus.
+
+File layout (the whole stream is zstd-compressed):
+
+    MAGIC
+    uint32 header length + JSON header (model name, version, dimensions)
+    repeated chunks: uint32 row count, int64 book ids[n], float32 vectors[n, dimensions]
+    uint32 0 (end marker)
+
+On the database side vectors move with Postgres binary COPY. Rows are fixed-size,
+so whole buffers are (de)serialized at once with NumPy structured dtypes rather
+than row by row in Python.
+"""
+import json
+import struct
+import numpy as np
+import zstandard
+
+MAGIC = b'AZEMB\x01'
+DEFAULT_CHUNK_SIZE = 10000
+
+# Postgres binary COPY framing
+PGCOPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+PGCOPY_HEADER = PGCOPY_SIGNATURE + struct.pack('>ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('>h', -1)
+
+
+def copy_row_dtype(dimensions):
+    """Binary COPY layout of one (book_id bigint, embedding vector(dimensions)) row."""
+    return np.dtype([
+        ('field_count', '>i2'),
+        ('id_length', '>i4'),
+        ('book_id', '>i8'),
+        ('vector_length', '>i4'),
+        ('dimensions', '>u2'),
+        ('unused', '>u2'),
+        ('vector', '>f4', (dimensions,)),
+    ])
+
+
+def encode_copy_rows(book_ids, vectors):
+    """Serialize ids and vectors into binary COPY tuples (without header/trailer)."""
+    dimensions = vectors.shape[1]
+    rows = np.empty(len(book_ids), dtype=copy_row_dtype(dimensions))
+    rows['field_count'] = 2
+    rows['id_length'] = 8
+    rows['book_id'] = book_ids
+    rows['vector_length'] = 4 + 4 * dimensions
+    rows['dimensions'] = dimensions
+    rows['unused'] = 0
+    rows['vector'] = vectors
+    return rows.tobytes()
+
+
+class CopyBinaryParser:
+    """
+    File-like sink for `COPY ... TO STDOUT WITH (FORMAT binary)`.
+
+    psycopg2 calls write() once per COPY message (roughly one per row); the data is
+    buffered and decoded in batches of chunk_size rows, each handed to on_chunk(ids, vectors).
+    """
+
+    def __init__(self, dimensions, on_chunk, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.row_dtype = copy_row_dtype(dimensions)
+        self.on_chunk = on_chunk
+        self.chunk_bytes = chunk_size * self.row_dtype.itemsize
+        self.buffer = bytearray()
+        self.header_read = False
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_bytes:
+            self._drain()
+
+    def close(self):
+        self._drain()
+        if bytes(self.buffer) != PGCOPY_TRAILER:
+            raise ValueError('Unexpected data at the end of the COPY stream (NULL or mis-sized vectors?)')
+
+    def _drain(self):
+        if not self.header_read:
+            if len(self.buffer) < len(PGCOPY_HEADER):
+                return
+            if not self.buffer.startswith(PGCOPY_SIGNATURE):
+                raise ValueError('Not a binary COPY stream')
+            extension_length = struct.unpack_from('>i', self.buffer, len(PGCOPY_SIGNATURE) + 4)[0]
+            del self.buffer[:len(PGCOPY_HEADER) + extension_length]
+            self.header_read = True
+
+        count = len(self.buffer) // self.row_dtype.itemsize
+        if not count:
+            return
+        rows = np.frombuffer(bytes(self.buffer[:count * self.row_dtype.itemsize]), dtype=self.row_dtype)
+        del self.buffer[:count * self.row_dtype.itemsize]
+        self.on_chunk(rows['book_id'].astype('<i8'), rows['vector'].astype('<f4'))
+
+
+class IterableReader:
+    """Minimal read()-able wrapper around an iterator of bytes, for `COPY ... FROM STDIN`."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.pending) < size:
+            try:
+                self.pending += next(self.chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self.pending = self.pending, b''
+        else:
+            data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+class EmbeddingDumpWriter:
+    """Write a compressed embedding dump chunk by chunk."""
+
+    def __init__(self, fileobj, header, level=3):
+        self.stream = zstandard.ZstdCompressor(level=level).stream_writer(fileobj, closefd=False)
+        self.dimensions = header['dimensions']
+        self.rows = 0
+        encoded = json.dumps(header).encode('utf-8')
+        self.stream.write(MAGIC + struct.pack('<I', len(encoded)) + encoded)
+
+    def write_chunk(self, book_ids, vectors):
+        if not len(book_ids):
+            return
+        self.stream.write(struct.pack('<I', len(book_ids)))
+        self.stream.write(np.ascontiguousarray(book_ids, dtype='<i8').tobytes())
+        self.stream.write(np.ascontiguousarray(vectors, dtype='<f4').tobytes())
+        self.rows += len(book_ids)
+
+    def close(self):
+        self.stream.write(struct.pack('<I', 0))
+        self.stream.close()
+
+
+class EmbeddingDumpReader:
+    """Read a compressed embedding dump: `header`, then iterate (book_ids, vectors) chunks."""
+
+    def __init__(self, fileobj):
+        self.stream = zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+        if self._read_exact(len(MAGIC)) != MAGIC:
+            raise ValueError('Not an embedding dump file')
+        header_length = struct.unpack('<I', self._read_exact(4))[0]
+        self.header = json.loads(self._read_exact(header_length))
+        self.dimensions = self.header['dimensions']
+
+    def __iter__(self):
+        while True:
+            count = struct.unpack('<I', self._read_exact(4))[0]
+            if count == 0:
+                return
+            book_ids = np.frombuffer(self._read_exact(8 * count), dtype='<i8')
+            vectors = np.frombuffer(self._read_exact(4 * count * self.dimensions), dtype='<f4')
+            yield book_ids, vectors.reshape(count, self.dimensions)
+
+    def _read_exact(self, size):
+        data = b''
+        while len(data) < size:
+            piece = self.stream.read(size - len(data))
+            if not piece:
+                raise ValueError('Truncated embedding dump')
+            data += piece
+        return data
@@ -0,0 +1,126 @@
+"""
+Embedding model registry helpers.
+
+Every place that needs a SentenceTransformer or "the embeddings currently being
+served" goes through this module, so upgrading the model is a registry change
+(register -> backfill with `embed_books` -> activate) rather than a code change.
+"""
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from sentence_transformers import SentenceTransformer
+from .models import EmbeddingModel
+import logging
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_MODEL_CACHE_KEY = 'embedding_model_active'
+ACTIVE_MODEL_CACHE_TIMEOUT = 60
+
+# Loaded SentenceTransformer instances, keyed by model name
+_transformer_cache = {}
+
+
+def load_sentence_transformer(name):
+    """
+    Get or create a cached SentenceTransformer for the given model name.
+    Uses a module-level cache to avoid reloading on every request.
+    """
+    if name not in _transformer_cache:
+        logger.info(f"Loading SentenceTransformer model '{name}'...")
+        _transformer_cache[name] = SentenceTransformer(name)
+        logger.info("Model loaded successfully")
+    return _transformer_cache[name]
+
+
+def get_active_embedding_model():
+    """
+    Return the registry entry currently served by rag.py.
+
+    Cached briefly so the lookup does not cost a query per request; after a flip,
+    other processes pick up the new version within ACTIVE_MODEL_CACHE_TIMEOUT.
+
+    Raises:
+        EmbeddingModel.DoesNotExist: If no version is active
+    """
+    embedding_model = cache.get(ACTIVE_MODEL_CACHE_KEY)
+    if embedding_model is None:
+        embedding_model = EmbeddingModel.objects.get(status=EmbeddingModel.ACTIVE)
+        cache.set(ACTIVE_MODEL_CACHE_KEY, embedding_model, ACTIVE_MODEL_CACHE_TIMEOUT)
+    return embedding_model
+
+
+def get_write_embedding_models():
+    """Return the versions that receive new embeddings: the active one plus any being backfilled."""
+    return list(
+        EmbeddingModel.objects.filter(status__in=[EmbeddingModel.ACTIVE, EmbeddingModel.PENDING]).order_by('version')
+    )
+
+
+def register_embedding_model(name, dimensions=None):
+    """
+    Register a new PENDING version of a model, detecting its dimensions if not given.
+
+    Returns:
+        EmbeddingModel: The new registry entry
+    """
+    if dimensions is None:
+        dimensions = load_sentence_transformer(name).get_sentence_embedding_dimension()
+    last = EmbeddingModel.objects.filter(name=name).order_by('-version').first()
+    return EmbeddingModel.objects.create(
+        name=name,
+        dimensions=dimensions,
+        version=(last.version + 1) if last else 1,
+    )
+
+
+def book_embedding_text(book):
+    """Combine title, author, description, and subjects for richer embeddings."""
+    return f"Title: {book.title}. Author: {book.author}. infantil: {book.infantil}. Category: {book.category}. Description: {book.description}. Subjects: {book.subjects}."
+
+
+def vector_index_statements(embedding_model, concurrently=True):
+    """
+    SQL for the partial HNSW indexes used to search one version's vectors.
+
+    The side table columns are untyped, so the indexes are built on a cast to the
+    version's dimensions; retrieval.py casts the same way so the planner can use them.
+    """
+    model_id = embedding_model.id
+    dimensions = embedding_model.dimensions
+    concurrently = 'CONCURRENTLY ' if concurrently else ''
+    return [
+        f"CREATE INDEX {concurrently}IF NOT EXISTS bookembedding_half_hnsw_{model_id} "
+        f"ON recommendations_bookembedding USING hnsw ((embedding_half::halfvec({dimensions})) halfvec_cosine_ops) "
+        f"WHERE model_id = {model_id}",
+        f"CREATE INDEX {concurrently}IF NOT EXISTS bookembedding_bin_hnsw_{model_id} "
+        f"ON recommendations_bookembedding USING hnsw ((embedding_binary::bit({dimensions})) bit_hamming_ops) "
+        f"WHERE model_id = {model_id}",
+    ]
+
+
+def create_vector_indexes(embedding_model):
+    """Build a version's partial indexes without blocking writes (must run outside a transaction)."""
+    with connection.cursor() as cursor:
+        for statement in vector_index_statements(embedding_model):
+            cursor.execute(statement)
+
+
+def activate_embedding_model(embedding_model):
+    """
+    Atomically make embedding_model the served version and retire the previous one.
+
+    Only registry rows are updated, so the flip is instant and takes no lock on
+    recommendations_book or the side table.
+    """
+    with transaction.atomic():
+        EmbeddingModel.objects.select_for_update().filter(status=EmbeddingModel.ACTIVE).exclude(
+            id=embedding_model.id
+        ).update(status=EmbeddingModel.RETIRED)
+        EmbeddingModel.objects.filter(id=embedding_model.id).update(
+            status=EmbeddingModel.ACTIVE, activated_at=timezone.now()
+        )
+    cache.delete(ACTIVE_MODEL_CACHE_KEY)
+    embedding_model.refresh_from_db()
+    logger.info(f"Activated embedding model {embedding_model}")
+    return embedding_model
@@ -0,0 +1,133 @@
+"""
+Deterministic, LLM-free explanations for recommended books.
+
+Each book's matching features (normalized author, category and subjects) are
+precomputed into `Book.explanation_features` by Book.save and, for rows written
+in bulk, by `embed_books`. The "why" snippet
+for a recommendation is built from what it shares with the reference - the
+purchased books or the book the customer enjoyed - plus its similarity score.
+
+The output follows the same contract the LLM prompts ask for:
+
+    <ul><li><strong>Title</strong> by Author - reason</li>...</ul>
+"""
+from django.conf import settings
+from django.utils.html import escape
+from .context import UNKNOWN_AUTHOR
+
+EXPLANATION_MODES = ('llm', 'template')
+# Book fields the features are computed from
+FEATURE_FIELDS = ('author', 'category', 'subjects')
+MAX_SHARED_SUBJECTS = 3
+
+
+def get_explanation_mode(mode=None):
+    """
+    Resolve the explanation mode, falling back to settings.RAG_EXPLANATION_MODE.
+
+    Raises:
+        ValueError: If the mode is not one of EXPLANATION_MODES
+    """
+    mode = mode or getattr(settings, 'RAG_EXPLANATION_MODE', 'llm')
+    if mode not in EXPLANATION_MODES:
+        raise ValueError(f"Unknown explanation mode '{mode}'. Choose from {EXPLANATION_MODES}.")
+    return mode
+
+
+def normalize(value):
+    """Normalize a feature value for comparison (case and whitespace)."""
+    return ' '.join((value or '').split()).casefold()
+
+
+def extract_features(book):
+    """
+    Compute the matching features of a book.
+
+    Returns:
+        dict: {'author': str, 'category': str, 'subjects': {normalized: display}}
+    """
+    subjects = {}
+    for subject in (book.subjects or '').split(','):
+        subject = ' '.join(subject.split())
+        if subject:
+            subjects.setdefault(normalize(subject), subject)
+    return {
+        'author': normalize(book.author),
+        'category': normalize(book.category),
+        'subjects': subjects,
+    }
+
+
+def get_features(book):
+    """Return the precomputed features of a book, computing them for rows that predate them."""
+    return book.explanation_features or extract_features(book)
+
+
+def merge_features(books):
+    """
+    Combine the features of several books (e.g. a purchase history) into one reference.
+
+    Returns:
+        dict: {'authors': set, 'categories': set, 'subjects': set}
+    """
+    reference = {'authors': set(), 'categories': set(), 'subjects': set()}
+    for book in books:
+        features = get_features(book)
+        if features['author']:
+            reference['authors'].add(features['author'])
+        if features['category']:
+            reference['categories'].add(features['category'])
+        reference['subjects'].update(features['subjects'])
+    return reference
+
+
+def explain(book, reference=None):
+    """
+    Build the reason a book is recommended.
+
+    Args:
+        book (Book): Recommended book, optionally annotated with `distance` (cosine)
+        reference (dict): Output of merge_features for what the customer liked, if any
+
+    Returns:
+        str: A short, plain-text reason
+    """
+    features = get_features(book)
+    reasons = []
+    if reference:
+        if features['author'] and features['author'] in reference['authors']:
+            reasons.append(f"another book by {' '.join(book.author.split())}, an author you already enjoyed")
+        shared = [display for key, display in features['subjects'].items() if key in reference['subjects']]
+        if shared:
+            reasons.append(f"shares the themes {', '.join(shared[:MAX_SHARED_SUBJECTS])}")
+        if features['category'] and features['category'] in reference['categories'] and len(reasons) < 2:
+            reasons.append(f"also in {' '.join(book.category.split())}")
+
+    distance = getattr(book, 'distance', None)
+    if distance is not None:
+        similarity = max(0.0, 1 - distance) * 100
+        reasons.append(f"{similarity:.0f}% match with your interests")
+
+    if not reasons:
+        return "A close match from our catalog."
+    reason = '; '.join(reasons)
+    return reason[0].upper() + reason[1:] + '.'
+
+
+def render_explanations(books, reference=None):
+    """
+    Render recommendations as the HTML list the LLM prompts produce.
+
+    Args:
+        books (list[Book]): Recommended books, best first
+        reference (dict): Output of merge_features, if any
+
+    Returns:
+        str: `<ul>` with one `<li>` per book; all book data is escaped
+    """
+    items = [
+        f"<li><strong>{escape(book.title)}</strong> by {escape(book.author or UNKNOWN_AUTHOR)}"
+        f" - {escape(explain(book, reference))}</li>"
+        for book in books
+    ]
+    return "<ul>" + "".join(items) + "</ul>"
@@ -0,0 +1,80 @@
+"""
+factory_boy factories for synthetic catalogs (benchmarks, evaluation, tests).
+
+Books get random unit vectors. For large catalogs, build instances with
+`build_batch` and persist them with `bulk_create_books`, which also fills the
+BookEmbedding side table the way embed_books would.
+"""
+import factory
+import numpy as np
+from django.contrib.auth.models import User
+from .models import Book, BookEmbedding, Purchase
+from .explanations import extract_features
+
+CATEGORIES = ['Novela', 'Historia', 'Ensayo', 'Poesía', 'Arte', 'Ciencia', 'Infantil', 'Filosofía']
+SUBJECTS = [
+    'Guerra Civil', 'Madrid', 'Quijote', 'Mar', 'Viajes', 'Religión', 'Política', 'Cocina',
+    'Arquitectura', 'Música', 'Teatro', 'Medicina', 'América', 'Toros', 'Botánica', 'Fotografía',
+]
+
+
+def random_unit_vector(dimensions=384, rng=None):
+    """Return a random vector of unit length as a float32 array."""
+    rng = rng or np.random.default_rng()
+    vector = rng.standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class UserFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = User
+
+    username = factory.Sequence(lambda n: f'synthetic_user_{n}')
+    email = factory.LazyAttribute(lambda user: f'{user.username}@example.com')
+    password = '!'  # Unusable; skips password hashing for bulk creation
+
+
+class BookFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Book
+
+    title = factory.Faker('sentence', nb_words=4, locale='es_ES')
+    author = factory.Faker('name', locale='es_ES')
+    category = factory.Faker('random_element', elements=CATEGORIES)
+    subjects = factory.LazyFunction(lambda: ', '.join(np.random.choice(SUBJECTS, 2, replace=False)))
+    description = factory.Faker('paragraph', nb_sentences=6, locale='es_ES')
+    price = factory.Faker('pydecimal', left_digits=2, right_digits=2, positive=True)
+    stock = 1
+    embedding = factory.LazyFunction(lambda: random_unit_vector())
+
+
+class PurchaseFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Purchase
+
+    user = factory.SubFactory(UserFactory)
+    book = factory.SubFactory(BookFactory)
+
+
+def bulk_create_books(books, embedding_model, batch_size=1000):
+    """
+    Insert unsaved Book instances in bulk, with their side-table embeddings.
+
+    Book.save() is bypassed, so the BookEmbedding rows for embedding_model, the
+    explanation features and, for the legacy version, the Book.embedding mirror
+    are written here. Each book's `embedding` must have embedding_model's dimensions.
+
+    Returns:
+        list[Book]: The created books
+    """
+    vectors = [book.embedding for book in books]
+    for book in books:
+        if not embedding_model.is_legacy:
+            book.embedding = None
+        book.explanation_features = extract_features(book)
+    created = Book.objects.bulk_create(books, batch_size=batch_size)
+    BookEmbedding.objects.bulk_upsert(
+        [BookEmbedding(book=book, model=embedding_model, embedding=vector) for book, vector in zip(created, vectors)],
+        batch_size=batch_size,
+    )
+    return created
@@ -0,0 +1,209 @@
+"""
+Local stand-in for the Ollama HTTP API, for load, latency and failure testing.
+
+Implements the endpoints the recommendation stack uses:
+
+- POST /api/chat and /api/generate, streamed as NDJSON (or a single JSON
+  object with "stream": false)
+- GET /api/tags and /api/version
+
+Behaviour is configurable: time to first token, token rate, error rate. The reply
+is deterministic: an HTML list of the "Title:"/"Author:" entries found in the
+prompt, i.e. the contract the RAG prompts ask the real model for, or with
+"format": "json" the structured answer for the "Book id:" entries.
+
+Run it with `python manage.py fake_ollama`, or in tests:
+
+    with FakeOllamaServer(ttft=0.05) as server:
+        with override_settings(OLLAMA_BASE_URL=server.url):
+            ...
+"""
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_MODEL = 'fake-llama:latest'
+TOKEN_PATTERN = re.compile(r'\S+\s*|\s+')
+BOOK_PATTERN = re.compile(r'^Title: (?P<title>.+)\nAuthor: (?P<author>.+)$', re.MULTILINE)
+BOOK_ID_PATTERN = re.compile(r'^Book id: (?P<id>\d+)\nTitle: (?P<title>.+)$', re.MULTILINE)
+
+
+def fake_reply(prompt, output_format=None):
+    """Build the deterministic reply for a prompt."""
+    if output_format == 'json':
+        return json.dumps({'items': [
+            {'book_id': int(book_id), 'reason': f"{title.strip()} is recommended by the fake Ollama server."}
+            for book_id, title in BOOK_ID_PATTERN.findall(prompt)
+        ]})
+    books = BOOK_PATTERN.findall(prompt)
+    if not books:
+        return "<ul><li><strong>Fake Book</strong> by Fake Author - Served by the fake Ollama server.</li></ul>"
+    items = "".join(
+        f"<li><strong>{title.strip()}</strong> by {author.strip()} - Recommended by the fake Ollama server.</li>"
+        for title, author in books
+    )
+    return f"<ul>{items}</ul>"
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._send_json({'models': [{'name': FAKE_MODEL, 'model': FAKE_MODEL, 'size': 0, 'digest': 'fake'}]})
+        elif self.path == '/api/version':
+            self._send_json({'version': '0.0.0-fake'})
+        else:
+            self._send_json({'error': 'not found'}, status=404)
+
+    def do_POST(self):
+        if self.path not in ('/api/chat', '/api/generate'):
+            self._send_json({'error': 'not found'}, status=404)
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        self.server.record_request(self.path, body)
+
+        if self.server.should_fail():
+            self._send_json({'error': 'fake ollama: injected failure'}, status=500)
+            return
+
+        if self.path == '/api/chat':
+            prompt = '\n'.join(message.get('content') or '' for message in body.get('messages', []))
+        else:
+            prompt = body.get('prompt', '')
+        reply = fake_reply(prompt, body.get('format'))
+        tokens = TOKEN_PATTERN.findall(reply)
+        model = body.get('model', FAKE_MODEL)
+
+        start = time.monotonic()
+        time.sleep(self.server.ttft)
+        if body.get('stream', True):
+            self._stream(model, tokens, start, prompt)
+        else:
+            time.sleep(len(tokens) * self.server.token_delay)
+            self._send_json(self._final_chunk(model, reply, len(tokens), start, prompt))
+
+    def _stream(self, model, tokens, start, prompt):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for index, token in enumerate(tokens):
+                if index:
+                    time.sleep(self.server.token_delay)
+                self._write_chunk(self._chunk(model, token, done=False))
+            self._write_chunk(self._final_chunk(model, '', len(tokens), start, prompt))
+            self.wfile.write(b'0\r\n\r\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (deadline, cancelled stream); nothing left to do
+            self.close_connection = True
+
+    def _chunk(self, model, text, done):
+        chunk = {
+            'model': model,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'done': done,
+        }
+        if self.path == '/api/chat':
+            chunk['message'] = {'role': 'assistant', 'content': text}
+        else:
+            chunk['response'] = text
+        return chunk
+
+    def _final_chunk(self, model, text, token_count, start, prompt):
+        chunk = self._chunk(model, text, done=True)
+        chunk.update({
+            'done_reason': 'stop',
+            'total_duration': int((time.monotonic() - start) * 1e9),
+            'load_duration': 0,
+            'prompt_eval_count': len(TOKEN_PATTERN.findall(prompt)),
+            'prompt_eval_duration': int(self.server.ttft * 1e9),
+            'eval_count': token_count,
+            'eval_duration': int(token_count * self.server.token_delay * 1e9),
+        })
+        return chunk
+
+    def _write_chunk(self, payload):
+        data = json.dumps(payload).encode('utf-8') + b'\n'
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """
+    Threaded fake Ollama server.
+
+    Args:
+        host (str): Interface to bind
+        port (int): Port to bind; 0 picks a free one (see `url`)
+        ttft (float): Seconds before the first token
+        tokens_per_second (float): Streaming rate after the first token (0 = unthrottled)
+        error_rate (float): Share of generation requests answered with HTTP 500
+        seed (int): Seed for the error injection
+        verbose (bool): Log each request to stderr
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, ttft=0.0, tokens_per_second=0, error_rate=0.0, seed=None,
+                 verbose=False):
+        super().__init__((host, port), FakeOllamaHandler)
+        self.ttft = ttft
+        self.token_delay = 1 / tokens_per_second if tokens_per_second else 0
+        self.error_rate = error_rate
+        self.verbose = verbose
+        self.requests = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def record_request(self, path, body):
+        with self._lock:
+            self.requests.append((path, body))
+
+    def start(self):
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-ollama', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,163 @@
+"""
+Per-stage timing of recommendation requests.
+
+Code on the RAG path wraps each stage in `span(name)`. Every measurement goes
+into two places:
+
+- the current request's trace (a contextvar set up by ServerTimingMiddleware),
+  returned to the client as a `Server-Timing` header
+- process-wide histograms, served in Prometheus text format by the metrics view
+
+Traces only exist inside a request that went through the middleware. Elsewhere
+(management commands, shell) spans only feed the histograms.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from .circuit_breaker import CircuitOpenError, LLMTimeoutError
+from .replay import ReplayMissError
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+
+_current_trace = contextvars.ContextVar('rag_trace', default=None)
+
+
+class RequestTrace:
+    """Spans and annotations recorded while serving one request."""
+
+    def __init__(self):
+        self.spans = []  # (name, seconds, description)
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, description=None):
+        with self._lock:
+            self.spans.append((name, seconds, description))
+
+    def server_timing(self):
+        """Render the spans as a Server-Timing header value."""
+        entries = []
+        with self._lock:
+            spans = list(self.spans)
+        for name, seconds, description in spans:
+            entry = name
+            if description:
+                entry += f';desc="{description}"'
+            if seconds is not None:
+                entry += f';dur={seconds * 1000:.1f}'
+            entries.append(entry)
+        return ', '.join(entries)
+
+
+class Histograms:
+    """Thread-safe cumulative histograms of stage durations plus fallback counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.buckets = {}
+            self.sums = {}
+            self.counts = {}
+            self.fallbacks = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            buckets = self.buckets.setdefault(stage, [0] * len(BUCKETS))
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    buckets[index] += 1
+                    break
+            self.sums[stage] = self.sums.get(stage, 0.0) + seconds
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def count_fallback(self, reason):
+        with self._lock:
+            self.fallbacks[reason] = self.fallbacks.get(reason, 0) + 1
+
+    def render(self):
+        """Render in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                '# HELP rag_stage_duration_seconds Duration of recommendation request stages.',
+                '# TYPE rag_stage_duration_seconds histogram',
+            ]
+            for stage in sorted(self.buckets):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, self.buckets[stage]):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'rag_stage_duration_seconds_sum{{stage="{stage}"}} {self.sums[stage]}')
+                lines.append(f'rag_stage_duration_seconds_count{{stage="{stage}"}} {self.counts[stage]}')
+            lines += [
+                '# HELP rag_fallback_total Recommendations served without the LLM, by reason.',
+                '# TYPE rag_fallback_total counter',
+            ]
+            for reason in sorted(self.fallbacks):
+                lines.append(f'rag_fallback_total{{reason="{reason}"}} {self.fallbacks[reason]}')
+        return '\n'.join(lines) + '\n'
+
+
+histograms = Histograms()
+
+
+def record(name, seconds, description=None):
+    """Record a stage duration measured elsewhere (e.g. reported by the model server)."""
+    histograms.observe(name, seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds, description)
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as stage `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def annotate(name, description):
+    """Attach a duration-less annotation (e.g. cache hit/miss) to the current request."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, None, description)
+
+
+def record_fallback(error):
+    """Count a fallback to the non-LLM answer and note its reason on the current request."""
+    if isinstance(error, CircuitOpenError):
+        reason = 'circuit_open'
+    elif isinstance(error, LLMTimeoutError):
+        reason = 'timeout'
+    elif isinstance(error, ReplayMissError):
+        reason = 'replay_miss'
+    else:
+        reason = 'llm_error'
+    histograms.count_fallback(reason)
+    annotate('fallback', reason)
+    return reason
+
+
+class ServerTimingMiddleware:
+    """Collect the spans recorded while serving a request into a Server-Timing header."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_trace.reset(token)
+        if trace.spans:
+            response['Server-Timing'] = trace.server_timing()
+        return response
@@ -0,0 +1,256 @@
+"""
+Single entry point for talking to the Ollama chat model.
+
+`llm_gateway` keeps one ChatOllama client per (model, temperature) for the life
+of the process, so requests reuse its pooled keep-alive HTTP connections instead
+of opening a new one per call, and asks Ollama to keep the model loaded
+(`keep_alive`) between requests.
+
+Prompts built with `build_prompt` start with the same system message, followed by
+the task's fixed instructions, with the per-request data last. Ollama can then
+reuse the KV cache for the shared prefix and only has to process the tail.
+
+Every call runs under a deadline and through its model's circuit breaker (see
+circuit_breaker.py): when the host is slow or down, callers get an
+LLMUnavailableError quickly and serve their non-LLM fallback. Breakers are kept
+per model, so a slow large model doesn't cut off the fast one the router falls
+back to.
+
+Unless a model is named, the gateway's ModelRouter (see routing.py) picks one
+from settings.RAG_LLM_MODELS according to the caller's latency budget.
+
+With settings.RAG_LLM_REPLAY_MODE set to 'record' or 'replay', answers are
+written to or served from a ResponseStore (see replay.py) keyed by the rendered
+prompt, so the rest of the chain runs unchanged without a model server.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import httpx
+from django.conf import settings
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_ollama import ChatOllama
+from .circuit_breaker import CircuitBreaker, LLMTimeoutError
+from .routing import ModelRouter
+from .instrumentation import record
+from .replay import REPLAY_MODES, ResponseStore, prompt_key
+
+SYSTEM_PREFIX = """You are a knowledgeable bookstore assistant for an online bookshop.
+You only recommend books from the catalog excerpt given to you, never books outside it.
+
+Return ONLY a valid HTML snippet containing an unordered list of recommendations.
+Use this exact structure:
+- Start directly with <ul>
+- Each book as <li><strong>Title</strong> by Author - reason for the recommendation</li>
+- End with </ul>
+
+Do NOT include any text outside the HTML.
+Do NOT use markdown, code blocks, or backticks.
+Do NOT add headings, paragraphs, or explanations.
+Do NOT wrap in ```html tags."""
+
+# System prefix of the structured (JSON) prompts, see structured.py (braces doubled for the template)
+JSON_SYSTEM_PREFIX = """You are a knowledgeable bookstore assistant for an online bookshop.
+You explain why books from the catalog excerpt given to you suit a customer.
+
+Return ONLY a JSON object with this exact structure:
+{{"items": [{{"book_id": <the book's id from the excerpt>, "reason": "<one short sentence>"}}]}}
+
+Include one item per book in the excerpt and use the ids exactly as given.
+Do NOT include any text outside the JSON."""
+
+
+def build_prompt(instructions, system=SYSTEM_PREFIX):
+    """
+    Build a chat prompt: shared system prefix, then the task instructions, then the variable data.
+
+    Args:
+        instructions (str): Task template; its placeholders should come at the end
+        system (str): System prefix (default: the HTML contract, SYSTEM_PREFIX)
+
+    Returns:
+        ChatPromptTemplate: Prompt to pass to LLMGateway.generate
+    """
+    return ChatPromptTemplate.from_messages([
+        ("system", system),
+        ("human", instructions),
+    ])
+
+
+class LLMGateway:
+    """Process-wide pool of ChatOllama clients."""
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._parser = StrOutputParser()
+        self._executor = None
+        self._store = None
+        self._breakers = {}
+        self.router = self._create_router()
+
+    def _create_router(self):
+        return ModelRouter(
+            getattr(settings, 'RAG_LLM_MODELS', ['llama3.1:8b']),
+            window=getattr(settings, 'RAG_LLM_LATENCY_WINDOW', 100),
+        )
+
+    def _create_breaker(self):
+        return CircuitBreaker(
+            failure_rate=getattr(settings, 'RAG_LLM_BREAKER_FAILURE_RATE', 0.5),
+            slow_call_seconds=getattr(settings, 'RAG_LLM_BREAKER_SLOW_CALL_SECONDS', 10.0),
+            window=getattr(settings, 'RAG_LLM_BREAKER_WINDOW', 20),
+            min_calls=getattr(settings, 'RAG_LLM_BREAKER_MIN_CALLS', 5),
+            reset_timeout=getattr(settings, 'RAG_LLM_BREAKER_RESET_SECONDS', 30.0),
+        )
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=getattr(settings, 'RAG_LLM_MAX_CONNECTIONS', 10),
+                        thread_name_prefix='llm-gateway',
+                    )
+        return self._executor
+
+    def get_replay_mode(self):
+        """Return settings.RAG_LLM_REPLAY_MODE, validated."""
+        mode = getattr(settings, 'RAG_LLM_REPLAY_MODE', 'passthrough')
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"Unknown LLM replay mode '{mode}', expected one of {', '.join(REPLAY_MODES)}")
+        return mode
+
+    def get_store(self):
+        """Return the ResponseStore at settings.RAG_LLM_REPLAY_PATH, opening it on first use."""
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = ResponseStore(settings.RAG_LLM_REPLAY_PATH)
+        return self._store
+
+    def get_client(self, model=None, temperature=None):
+        """Return the shared client for (model, temperature), creating it on first use."""
+        model = model or self.router.default_model
+        key = (model, temperature)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._create_client(model, temperature)
+                    self._clients[key] = client
+        return client
+
+    def get_breaker(self, model):
+        """Return the circuit breaker of model, creating it on first use."""
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(model)
+                if breaker is None:
+                    breaker = self._create_breaker()
+                    self._breakers[model] = breaker
+        return breaker
+
+    def _create_client(self, model, temperature):
+        max_connections = getattr(settings, 'RAG_LLM_MAX_CONNECTIONS', 10)
+        return ChatOllama(
+            model=model,
+            temperature=temperature,
+            base_url=getattr(settings, 'OLLAMA_BASE_URL', 'http://localhost:11434'),
+            keep_alive=getattr(settings, 'RAG_LLM_KEEP_ALIVE', '30m'),
+            client_kwargs={
+                # Upper bound for calls abandoned past their deadline
+                'timeout': getattr(settings, 'RAG_LLM_TIMEOUT', 60.0),
+                'limits': httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections,
+                ),
+            },
+        )
+
+    def generate(self, prompt, variables, model=None, temperature=None, deadline=None, latency_budget=None,
+                 output_format=None):
+        """
+        Render prompt with variables and return the model's reply as text.
+
+        Args:
+            prompt (ChatPromptTemplate): Prompt built with build_prompt
+            variables (dict): Values for the prompt placeholders
+            model (str): Ollama model name (default: chosen by the router)
+            temperature (float): Sampling temperature (default: the model's)
+            deadline (float): Seconds to wait for the answer (default: settings.RAG_LLM_DEADLINE)
+            latency_budget (float): Seconds the caller is prepared to wait, used to route to a model
+            output_format (str): Ollama output format, e.g. 'json' (default: free text)
+
+        Returns:
+            str: Generated text
+
+        Raises:
+            CircuitOpenError: If the model's breaker is open; the model is not called
+            LLMTimeoutError: If the model did not answer within the deadline
+            ReplayMissError: In replay mode, if no answer was recorded for the prompt
+        """
+        if deadline is None:
+            deadline = getattr(settings, 'RAG_LLM_DEADLINE', 20.0)
+        replay_mode = self.get_replay_mode()
+        # A routed choice depends on latency stats, so recordings are keyed on the models it picks from
+        key_model = model or self.router.models
+        model = model or self.router.choose(latency_budget)
+        messages = prompt.format_messages(**variables)
+        if replay_mode != 'passthrough':
+            key = prompt_key(key_model, temperature, messages)
+            if replay_mode == 'replay':
+                start = time.monotonic()
+                text = self.get_store().replay(key)
+                record('llm_total', time.monotonic() - start, 'replay')
+                return text
+
+        breaker = self.get_breaker(model)
+        ticket = breaker.before_call()
+        start = time.monotonic()
+        try:
+            client = self.get_client(model, temperature)
+            options = {'format': output_format} if output_format else {}
+            future = self._get_executor().submit(client.invoke, messages, **options)
+            try:
+                response = future.result(timeout=deadline)
+            except FutureTimeoutError:
+                # The worker thread finishes (or hits the client timeout) in the background
+                future.cancel()
+                self.router.record(model, deadline)
+                record('llm_total', time.monotonic() - start, model)
+                raise LLMTimeoutError(f'LLM did not answer within {deadline}s')
+        except Exception:
+            breaker.record_failure(ticket)
+            raise
+        duration = time.monotonic() - start
+        breaker.record_success(duration, ticket)
+        self.router.record(model, duration)
+        record('llm_total', duration, model)
+        self._record_ttft(response, model)
+        text = self._parser.invoke(response)
+        if replay_mode == 'record':
+            self.get_store().put(key, model, text)
+        return text
+
+    def _record_ttft(self, response, model):
+        """Record time to first token as reported by Ollama (model load + prompt processing)."""
+        metadata = getattr(response, 'response_metadata', None)
+        if not isinstance(metadata, dict) or 'prompt_eval_duration' not in metadata:
+            return
+        nanoseconds = (metadata.get('load_duration') or 0) + (metadata.get('prompt_eval_duration') or 0)
+        record('llm_ttft', nanoseconds / 1e9, model)
+
+    def reset(self):
+        """Drop all clients (and their connection pools) and the replay store, and reset the circuit breakers and router."""
+        with self._lock:
+            self._clients.clear()
+            self._store = None
+            self._breakers.clear()
+            self.router = self._create_router()
+
+
+llm_gateway = LLMGateway()
@@ -0,0 +1,221 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from recommendations.models import Book, Purchase
+from recommendations.factories import BookFactory, UserFactory, PurchaseFactory, bulk_create_books, random_unit_vector
+from recommendations.embeddings import get_active_embedding_model
+from recommendations.retrieval import search_diverse_books, get_book_embeddings
+from recommendations.context import build_context
+from recommendations.llm import llm_gateway
+from recommendations.rag import HISTORY_PROMPT, SIMILAR_BOOK_PROMPT, QUERY_PROMPT, get_sentence_transformer_model
+from recommendations.fake_ollama import FakeOllamaServer
+import factory
+import json
+import numpy as np
+import time
+
+STAGES = ('embedding', 'retrieval', 'context', 'generation')
+ENTRY_POINTS = ('history', 'title', 'query')
+SAMPLE_QUERIES = [
+    'novela histórica sobre la guerra civil',
+    'libros de viajes por América',
+    'ensayos de filosofía y religión',
+    'poesía del siglo de oro',
+    'historia de Madrid',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the recommendation hot paths on synthetic catalogs. Data is generated inside a '
+        'transaction that is rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=[10000],
+            help='Catalog sizes to benchmark, e.g. 10000 100000 1000000 (default: 10000)'
+        )
+        parser.add_argument('--users', type=int, default=100, help='Synthetic users (default: 100)')
+        parser.add_argument(
+            '--purchases-per-user',
+            type=int,
+            default=5,
+            help='Purchases per synthetic user (default: 5)'
+        )
+        parser.add_argument('--queries', type=int, default=20, help='Timed requests per entry point (default: 20)')
+        parser.add_argument('--top-k', type=int, default=5, help='Books per recommendation (default: 5)')
+        parser.add_argument('--representation', type=str, help="'full', 'half' or 'binary' (default: settings)")
+        parser.add_argument(
+            '--fake-encoder',
+            action='store_true',
+            help='Use random query vectors instead of loading the SentenceTransformer'
+        )
+        parser.add_argument('--ttft', type=float, default=0.0, help='Fake LLM time to first token (default: 0)')
+        parser.add_argument(
+            '--tokens-per-second',
+            type=float,
+            default=0,
+            help='Fake LLM token rate, 0 for unthrottled (default: 0)'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='benchmark_recommendations.json',
+            help='Where to write the JSON results (default: benchmark_recommendations.json)'
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        if not sizes or sizes[0] <= 0:
+            raise CommandError('Catalog sizes must be positive.')
+
+        self.rng = np.random.default_rng(options['seed'])
+        self.options = options
+        embedding_model = get_active_embedding_model()
+        self.embedding_model = embedding_model
+        self.encoder = None if options['fake_encoder'] else get_sentence_transformer_model(embedding_model)
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'embedding_model': str(embedding_model),
+            'config': {
+                key: options[key] for key in (
+                    'users', 'purchases_per_user', 'queries', 'top_k', 'representation',
+                    'fake_encoder', 'ttft', 'tokens_per_second', 'seed'
+                )
+            },
+            'results': [],
+        }
+
+        server = FakeOllamaServer(ttft=options['ttft'], tokens_per_second=options['tokens_per_second']).start()
+        try:
+            with override_settings(OLLAMA_BASE_URL=server.url), transaction.atomic():
+                llm_gateway.reset()
+                for size in sizes:
+                    report['results'].append(self.benchmark_size(size))
+                # Leave the database as it was
+                transaction.set_rollback(True)
+        finally:
+            llm_gateway.reset()
+            server.stop()
+
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def benchmark_size(self, size):
+        start = time.perf_counter()
+        self.grow_catalog(size)
+        build_seconds = time.perf_counter() - start
+        self.stdout.write(f'Catalog of {size} books ready in {build_seconds:.1f}s, timing...')
+
+        result = {'catalog_size': size, 'build_seconds': round(build_seconds, 3), 'entry_points': {}}
+        for entry_point in ENTRY_POINTS:
+            timings = {stage: [] for stage in STAGES}
+            for _ in range(self.options['queries']):
+                for stage, seconds in getattr(self, f'run_{entry_point}')().items():
+                    timings[stage].append(seconds)
+            result['entry_points'][entry_point] = {stage: summarize(timings[stage]) for stage in STAGES}
+            self.stdout.write(f'  {entry_point:>7}: ' + ' '.join(
+                f"{stage}={result['entry_points'][entry_point][stage]['p50_ms']:.1f}ms" for stage in STAGES
+            ))
+        return result
+
+    def grow_catalog(self, size, batch_size=5000):
+        """Add synthetic books (and, the first time, users and purchases) up to size books."""
+        dimensions = self.embedding_model.dimensions
+        while (missing := size - Book.objects.count()) > 0:
+            books = BookFactory.build_batch(
+                min(batch_size, missing),
+                embedding=factory_vector(dimensions, self.rng),
+            )
+            bulk_create_books(books, self.embedding_model)
+
+        if not hasattr(self, 'users'):
+            self.users = User.objects.bulk_create(UserFactory.build_batch(self.options['users']))
+            book_ids = list(Book.objects.values_list('id', flat=True))
+            purchases = []
+            for user in self.users:
+                for book_id in self.rng.choice(book_ids, self.options['purchases_per_user'], replace=False):
+                    purchases.append(PurchaseFactory.build(user=user, book=Book(id=int(book_id))))
+            Purchase.objects.bulk_create(purchases)
+        self.book_ids = list(Book.objects.values_list('id', flat=True))
+
+    def run_history(self):
+        user = self.users[self.rng.integers(len(self.users))]
+        timings = {}
+
+        start = time.perf_counter()
+        past_books = list(Purchase.objects.filter(user=user).values_list('book_id', flat=True))
+        query_embedding = np.mean(get_book_embeddings(past_books, self.embedding_model), axis=0)
+        timings['embedding'] = time.perf_counter() - start
+
+        return self.run_stages(
+            timings, Book.objects.exclude(id__in=past_books), query_embedding, HISTORY_PROMPT, {}
+        )
+
+    def run_title(self):
+        timings = {}
+
+        start = time.perf_counter()
+        reference_book = Book.objects.get(id=self.book_ids[self.rng.integers(len(self.book_ids))])
+        query_embedding = get_book_embeddings([reference_book.id], self.embedding_model)[0]
+        timings['embedding'] = time.perf_counter() - start
+
+        return self.run_stages(
+            timings, Book.objects.exclude(id=reference_book.id), query_embedding, SIMILAR_BOOK_PROMPT,
+            {'book_title': reference_book.title}
+        )
+
+    def run_query(self):
+        timings = {}
+        query = SAMPLE_QUERIES[self.rng.integers(len(SAMPLE_QUERIES))]
+
+        start = time.perf_counter()
+        if self.encoder is None:
+            query_embedding = random_unit_vector(self.embedding_model.dimensions, self.rng)
+        else:
+            query_embedding = self.encoder.encode(query)
+        timings['embedding'] = time.perf_counter() - start
+
+        return self.run_stages(timings, Book.objects.all(), query_embedding, QUERY_PROMPT, {'query': query})
+
+    def run_stages(self, timings, queryset, query_embedding, prompt, variables):
+        start = time.perf_counter()
+        books = search_diverse_books(
+            queryset, query_embedding, self.options['top_k'], self.options.get('representation'), self.embedding_model
+        )
+        timings['retrieval'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        context = build_context(books)
+        timings['context'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        llm_gateway.generate(prompt, {**variables, 'context': context})
+        timings['generation'] = time.perf_counter() - start
+        return timings
+
+
+def factory_vector(dimensions, rng):
+    """factory_boy declaration producing a fresh random unit vector per book."""
+    return factory.LazyFunction(lambda: random_unit_vector(dimensions, rng))
+
+
+def summarize(samples):
+    """Summary statistics of a list of durations in seconds, in milliseconds."""
+    latencies = np.array(samples) * 1000
+    return {
+        'count': len(latencies),
+        'mean_ms': round(float(latencies.mean()), 3),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'max_ms': round(float(latencies.max()), 3),
+    }
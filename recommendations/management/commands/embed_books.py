@@ -1,7 +1,10 @@
-from django.core.management.base import BaseCommand
-from recommendations.models import Book
-from sentence_transformers import SentenceTransformer
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from recommendations.models import Book, BookEmbedding, EmbeddingModel
+from recommendations.embeddings import load_sentence_transformer, get_write_embedding_models, book_embedding_text
+from recommendations.explanations import extract_features
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -27,14 +30,43 @@ class Command(BaseCommand):
             type=int,
             help='Specific book IDs to process (space-separated)'
         )
+        parser.add_argument(
+            '--model-id',
+            type=int,
+            help='Registry version to (back)fill; by default the active and all pending versions are written'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Seconds to sleep between batches, to throttle a background backfill (default: 0)'
+        )
 
     def handle(self, *args, **options):
+        if options.get('model_id'):
+            try:
+                embedding_models = [EmbeddingModel.objects.get(id=options['model_id'])]
+            except EmbeddingModel.DoesNotExist:
+                raise CommandError(f"Embedding model {options['model_id']} does not exist.")
+        else:
+            # Dual-write: versions being backfilled receive new books too
+            embedding_models = get_write_embedding_models()
+
+        if not embedding_models:
+            self.stdout.write(self.style.WARNING('No active or pending embedding models registered.'))
+            return
+
+        for embedding_model in embedding_models:
+            self.embed_for_model(embedding_model, options)
+
+    def embed_for_model(self, embedding_model, options):
         batch_size = options['batch_size']
         force = options['force']
         book_ids = options.get('book_ids')
+        pause = options['pause']
 
-        self.stdout.write(self.style.SUCCESS('Loading SentenceTransformer model...'))
-        model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.stdout.write(self.style.SUCCESS(f'Loading SentenceTransformer model for {embedding_model}...'))
+        model = load_sentence_transformer(embedding_model.name)
         self.stdout.write(self.style.SUCCESS('Model loaded successfully!'))
 
         # Get books to process
@@ -45,7 +77,7 @@ class Command(BaseCommand):
             books = Book.objects.all()
             self.stdout.write(f'Regenerating embeddings for all {books.count()} books...')
         else:
-            books = Book.objects.filter(embedding__isnull=True)
+            books = Book.objects.exclude(embeddings__model=embedding_model)
             self.stdout.write(f'Processing {books.count()} books without embeddings...')
 
         if not books.exists():
@@ -55,51 +87,62 @@ class Command(BaseCommand):
         total_books = books.count()
         processed = 0
         errors = 0
-        skipped = 0
-
-        # Process in batches
-        for i in range(0, total_books, batch_size):
-            batch = list(books[i:i + batch_size])
-            
-            for book in batch:
-                try:
-                    # Skip if embedding exists and not forcing
-                    if book.embedding is not None and not force:
-                        skipped += 1
-                        continue
-
-                    # Combine title, author, description, and subjects for richer embeddings
-                    text = f"Title: {book.title}. Author: {book.author}. infantil: {book.infantil}. Category: {book.category}. Description: {book.description}. Subjects: {book.subjects}."
-                    
-                    # Generate embedding
-                    embedding = model.encode(text)
-                    
-                    # Save to database
-                    book.embedding = embedding
-                    book.save(update_fields=['embedding'])
-                    
-                    processed += 1
-                    
-                    # Progress update every 10 books
-                    if processed % 10 == 0:
-                        progress = (i + len(batch)) / total_books * 100
-                        self.stdout.write(
-                            f'Progress: {progress:.1f}% ({processed} processed, {errors} errors, {skipped} skipped)'
-                        )
-                
-                except Exception as e:
-                    errors += 1
-                    logger.error(f'Error processing book {book.id} ({book.title}): {e}')
-                    self.stdout.write(
-                        self.style.ERROR(f'Error processing book {book.id}: {str(e)}')
-                    )
+
+        # Process in batches by primary key so rows written along the way don't shift the window
+        last_id = 0
+        books = books.order_by('id')
+        while True:
+            batch = list(books.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            try:
+                # Encode the whole batch in one forward pass
+                embeddings = model.encode([book_embedding_text(book) for book in batch])
+
+                # One upsert per batch into the side table
+                BookEmbedding.objects.bulk_upsert([
+                    BookEmbedding(book=book, model=embedding_model, embedding=embedding)
+                    for book, embedding in zip(batch, embeddings)
+                ])
+                # The book table is only touched for the served version: a backfill of a
+                # pending version must not lock it. Features don't depend on the model.
+                update_fields = []
+                if embedding_model.status == EmbeddingModel.ACTIVE or embedding_model.is_legacy:
+                    # Precompute the features used by template explanations alongside the vectors
+                    for book in batch:
+                        book.explanation_features = extract_features(book)
+                    update_fields.append('explanation_features')
+                if embedding_model.is_legacy:
+                    # The API serves these vectors, so bump updated_at (bulk_update skips auto_now)
+                    # for its ETag and Last-Modified to change with them
+                    updated_at = timezone.now()
+                    for book, embedding in zip(batch, embeddings):
+                        book.embedding = embedding
+                        book.updated_at = updated_at
+                    update_fields += ['embedding', 'updated_at']
+                if update_fields:
+                    Book.objects.bulk_update(batch, update_fields)
+
+                processed += len(batch)
+                progress = processed / total_books * 100
+                self.stdout.write(f'Progress: {progress:.1f}% ({processed} processed, {errors} errors)')
+
+            except Exception as e:
+                errors += len(batch)
+                logger.error(f'Error processing books {batch[0].id}-{batch[-1].id}: {e}')
+                self.stdout.write(
+                    self.style.ERROR(f'Error processing books {batch[0].id}-{batch[-1].id}: {str(e)}')
+                )
+
+            if pause:
+                time.sleep(pause)
 
         # Final summary
         self.stdout.write(self.style.SUCCESS('\n' + '='*50))
-        self.stdout.write(self.style.SUCCESS('Embedding generation complete!'))
+        self.stdout.write(self.style.SUCCESS(f'Embedding generation complete for {embedding_model}!'))
         self.stdout.write(self.style.SUCCESS(f'Total books processed: {processed}'))
-        if skipped > 0:
-            self.stdout.write(self.style.WARNING(f'Books skipped (already had embeddings): {skipped}'))
         if errors > 0:
             self.stdout.write(self.style.ERROR(f'Errors encountered: {errors}'))
-        self.stdout.write(self.style.SUCCESS('='*50))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS('='*50))
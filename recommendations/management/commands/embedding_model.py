@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from recommendations.models import Book, EmbeddingModel
+from recommendations.embeddings import register_embedding_model, create_vector_indexes, activate_embedding_model
+
+
+class Command(BaseCommand):
+    help = 'Manage embedding model versions: list, register a new version, or activate (flip) a version'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+
+        subparsers.add_parser('list', help='List registered versions and their coverage')
+
+        register = subparsers.add_parser('register', help='Register a new pending version of a model')
+        register.add_argument('name', type=str, help="SentenceTransformer model name, e.g. 'all-MiniLM-L6-v2'")
+        register.add_argument(
+            '--dimensions',
+            type=int,
+            help='Embedding dimensions (detected by loading the model if omitted)'
+        )
+
+        activate = subparsers.add_parser('activate', help='Build indexes for a version and make it the served one')
+        activate.add_argument('model_id', type=int, help='Registry id of the version to activate')
+        activate.add_argument(
+            '--force',
+            action='store_true',
+            help='Activate even if the version has not been backfilled for every book'
+        )
+
+    def handle(self, *args, **options):
+        getattr(self, f"handle_{options['action']}")(options)
+
+    def handle_list(self, options):
+        total_books = Book.objects.count()
+        for embedding_model in EmbeddingModel.objects.annotate(embedded=Count('book_embeddings')):
+            self.stdout.write(
+                f'[{embedding_model.id}] {embedding_model} - {embedding_model.embedded}/{total_books} books embedded'
+            )
+
+    def handle_register(self, options):
+        embedding_model = register_embedding_model(options['name'], options.get('dimensions'))
+        self.stdout.write(self.style.SUCCESS(f'Registered [{embedding_model.id}] {embedding_model}'))
+        self.stdout.write(
+            f'Backfill it with: python manage.py embed_books --model-id {embedding_model.id} '
+            f'(new books are dual-written meanwhile)'
+        )
+
+    def handle_activate(self, options):
+        try:
+            embedding_model = EmbeddingModel.objects.get(id=options['model_id'])
+        except EmbeddingModel.DoesNotExist:
+            raise CommandError(f"Embedding model {options['model_id']} does not exist.")
+
+        missing = Book.objects.exclude(embeddings__model=embedding_model).count()
+        if missing and not options['force']:
+            raise CommandError(
+                f'{missing} books have no embedding for {embedding_model}. '
+                f'Run embed_books --model-id {embedding_model.id} first or pass --force.'
+            )
+
+        self.stdout.write(f'Building vector indexes for {embedding_model} (concurrently)...')
+        create_vector_indexes(embedding_model)
+        activate_embedding_model(embedding_model)
+        self.stdout.write(self.style.SUCCESS(f'Now serving [{embedding_model.id}] {embedding_model}'))
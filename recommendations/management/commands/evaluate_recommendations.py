@@ -0,0 +1,233 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from recommendations.models import Book, BookEmbedding, Purchase
+from recommendations.embeddings import get_active_embedding_model
+from recommendations.retrieval import search_similar_books
+from recommendations.explanations import get_features, merge_features
+import json
+import numpy as np
+import time
+import tracemalloc
+
+STRATEGIES = ('exact', 'ann', 'in_memory', 'hybrid', 'collaborative')
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay held-out purchases against each retrieval strategy and report recall@k/NDCG@k '
+        'next to latency and memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=10, help='Cut-off for recall and NDCG (default: 10)')
+        parser.add_argument(
+            '--holdout',
+            type=int,
+            default=1,
+            help="Most recent purchases hidden per user (default: 1)"
+        )
+        parser.add_argument(
+            '--max-users',
+            type=int,
+            help='Evaluate at most this many users (default: all eligible)'
+        )
+        parser.add_argument(
+            '--strategies',
+            nargs='+',
+            choices=STRATEGIES,
+            default=list(STRATEGIES),
+            help='Strategies to evaluate (default: all)'
+        )
+        parser.add_argument(
+            '--hybrid-weight',
+            type=float,
+            default=0.1,
+            help='Weight of the shared author/category/subjects score in the hybrid strategy (default: 0.1)'
+        )
+        parser.add_argument('--output', type=str, help='Also write the report as JSON to this path')
+
+    def handle(self, *args, **options):
+        self.k = options['k']
+        self.hybrid_weight = options['hybrid_weight']
+        self.embedding_model = get_active_embedding_model()
+
+        cases = self.build_cases(options['holdout'], options.get('max_users'))
+        if not cases:
+            raise CommandError(
+                f"No user has more than {options['holdout']} purchases with embedded books to evaluate."
+            )
+        self.stdout.write(
+            f"Evaluating {len(cases)} users (k={self.k}, holdout={options['holdout']}) against {self.embedding_model}..."
+        )
+
+        report = {
+            'embedding_model': str(self.embedding_model),
+            'users': len(cases),
+            'k': self.k,
+            'holdout': options['holdout'],
+            'strategies': {},
+        }
+        for strategy in options['strategies']:
+            report['strategies'][strategy] = self.evaluate(strategy, cases)
+
+        self.stdout.write(self.style.SUCCESS('\n' + '='*50))
+        for strategy, result in report['strategies'].items():
+            self.stdout.write(
+                f"{strategy:>13}: recall@{self.k}={result['recall']:.3f} ndcg@{self.k}={result['ndcg']:.3f} "
+                f"p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms "
+                f"memory={result['peak_memory_mb']:.1f}MB"
+            )
+        self.stdout.write(self.style.SUCCESS('='*50))
+
+        if options.get('output'):
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def build_cases(self, holdout, max_users):
+        """Split each user's purchases, oldest first, into a history and the held-out tail."""
+        purchases = defaultdict(list)
+        for user_id, book_id in Purchase.objects.order_by('user_id', 'purchase_date', 'id').values_list(
+            'user_id', 'book_id'
+        ):
+            if book_id not in purchases[user_id]:
+                purchases[user_id].append(book_id)
+
+        embedded = set(
+            BookEmbedding.objects.filter(model=self.embedding_model).values_list('book_id', flat=True)
+        )
+        # Collaborative filtering may only learn from the histories, never from held-out purchases
+        self.training = {}
+        cases = []
+        for user_id, book_ids in purchases.items():
+            history, held_out = book_ids[:-holdout], book_ids[-holdout:]
+            self.training[user_id] = set(history) if len(book_ids) > holdout else set(book_ids)
+            if len(book_ids) <= holdout or not embedded.intersection(history):
+                continue
+            cases.append({'user_id': user_id, 'history': history, 'held_out': set(held_out)})
+        return cases[:max_users] if max_users else cases
+
+    def evaluate(self, strategy, cases):
+        tracemalloc.start()
+        try:
+            getattr(self, f'prepare_{strategy}', lambda: None)()
+            retrieve = getattr(self, f'retrieve_{strategy}')
+            recalls, ndcgs, latencies = [], [], []
+            for case in cases:
+                start = time.perf_counter()
+                recommended = retrieve(case)
+                latencies.append(time.perf_counter() - start)
+                recalls.append(recall_at_k(recommended, case['held_out'], self.k))
+                ndcgs.append(ndcg_at_k(recommended, case['held_out'], self.k))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            self.release()
+
+        latencies = np.array(latencies) * 1000
+        return {
+            'recall': float(np.mean(recalls)),
+            'ndcg': float(np.mean(ndcgs)),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'peak_memory_mb': peak / 1024 / 1024,
+        }
+
+    def release(self):
+        """Drop the in-memory state of a strategy before measuring the next one."""
+        for attribute in ('matrix', 'norms', 'matrix_ids', 'matrix_positions', 'co_purchases'):
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+
+    def query_embedding(self, case):
+        return np.mean(
+            BookEmbedding.objects.filter(model=self.embedding_model, book_id__in=case['history'])
+            .values_list('embedding', flat=True),
+            axis=0,
+        )
+
+    def exact_neighbours(self, case, top_k):
+        return search_similar_books(
+            Book.objects.exclude(id__in=case['history']), self.query_embedding(case), top_k,
+            'full', self.embedding_model
+        )
+
+    # pgvector, exact scan of the float32 side-table column
+    def retrieve_exact(self, case):
+        return [book.id for book in self.exact_neighbours(case, self.k)]
+
+    # pgvector, HNSW index on the half-precision column
+    def retrieve_ann(self, case):
+        books = search_similar_books(
+            Book.objects.exclude(id__in=case['history']), self.query_embedding(case), self.k,
+            'half', self.embedding_model
+        )
+        return [book.id for book in books]
+
+    # NumPy, all vectors of the active version loaded once
+    def prepare_in_memory(self):
+        rows = list(BookEmbedding.objects.filter(model=self.embedding_model).values_list('book_id', 'embedding'))
+        self.matrix_ids = np.array([book_id for book_id, _ in rows])
+        matrix = np.array([embedding for _, embedding in rows], dtype=np.float32)
+        # Normalized once so scoring is a single matrix-vector product
+        self.norms = np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self.matrix = matrix / self.norms
+        self.matrix_positions = {book_id: index for index, book_id in enumerate(self.matrix_ids)}
+
+    def retrieve_in_memory(self, case):
+        history = [self.matrix_positions[book_id] for book_id in case['history'] if book_id in self.matrix_positions]
+        # Same query as the database strategies: the mean of the raw history vectors
+        query = (self.matrix[history] * self.norms[history]).mean(axis=0)
+        scores = self.matrix @ (query / max(np.linalg.norm(query), 1e-12))
+        scores[history] = -np.inf
+        count = min(self.k, len(scores))
+        top = np.argpartition(-scores, count - 1)[:count]
+        return self.matrix_ids[top[np.argsort(-scores[top])]].tolist()
+
+    # Exact vector pool re-ranked with shared author/category/subjects
+    def retrieve_hybrid(self, case):
+        pool = self.exact_neighbours(case, self.k * 5)
+        reference = merge_features(
+            Book.objects.filter(id__in=case['history']).only('author', 'category', 'subjects', 'explanation_features')
+        )
+
+        def score(book):
+            features = get_features(book)
+            subjects = set(features['subjects'])
+            overlap = len(subjects & reference['subjects']) / len(subjects) if subjects else 0.0
+            overlap += 0.5 * (features['author'] in reference['authors'])
+            overlap += 0.5 * (features['category'] in reference['categories'])
+            return (1 - book.distance) + self.hybrid_weight * overlap
+
+        return [book.id for book in sorted(pool, key=score, reverse=True)[:self.k]]
+
+    # Item co-occurrence over the training histories ("customers who bought this also bought")
+    def prepare_collaborative(self):
+        self.co_purchases = defaultdict(set)
+        for user_id, book_ids in self.training.items():
+            for book_id in book_ids:
+                self.co_purchases[book_id].add(user_id)
+
+    def retrieve_collaborative(self, case):
+        history = set(case['history'])
+        scores = defaultdict(int)
+        for book_id in history:
+            for other_user in self.co_purchases.get(book_id, ()):
+                if other_user == case['user_id']:
+                    continue
+                for candidate in self.training[other_user] - history:
+                    scores[candidate] += 1
+        return [book_id for book_id, _ in sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:self.k]]
+
+
+def recall_at_k(recommended, relevant, k):
+    """Share of the relevant items found in the first k recommendations."""
+    return len(set(recommended[:k]) & relevant) / len(relevant)
+
+
+def ndcg_at_k(recommended, relevant, k):
+    """Normalized discounted cumulative gain of the first k recommendations (binary relevance)."""
+    recommended = recommended[:k]
+    dcg = sum(1 / np.log2(rank + 2) for rank, item in enumerate(recommended) if item in relevant)
+    ideal = sum(1 / np.log2(rank + 2) for rank in range(min(len(relevant), k)))
+    return dcg / ideal if ideal else 0.0
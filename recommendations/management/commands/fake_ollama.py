@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from recommendations.fake_ollama import FakeOllamaServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local fake Ollama server for offline load, latency and failure testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface to bind (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=11435, help='Port to bind (default: 11435)')
+        parser.add_argument(
+            '--ttft',
+            type=float,
+            default=0.2,
+            help='Seconds before the first token (default: 0.2)'
+        )
+        parser.add_argument(
+            '--tokens-per-second',
+            type=float,
+            default=40,
+            help='Streaming rate after the first token, 0 for unthrottled (default: 40)'
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Share of generation requests answered with HTTP 500 (default: 0)'
+        )
+        parser.add_argument('--seed', type=int, help='Seed for the error injection')
+        parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        server = FakeOllamaServer(
+            host=options['host'],
+            port=options['port'],
+            ttft=options['ttft'],
+            tokens_per_second=options['tokens_per_second'],
+            error_rate=options['error_rate'],
+            seed=options.get('seed'),
+            verbose=options['verbose'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Fake Ollama listening on {server.url}'))
+        self.stdout.write(f'Point the app at it with OLLAMA_BASE_URL={server.url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping fake Ollama...')
+        finally:
+            server.server_close()
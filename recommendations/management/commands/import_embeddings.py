@@ -0,0 +1,108 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recommendations.models import EmbeddingModel
+from recommendations.embedding_io import (
+    EmbeddingDumpReader,
+    IterableReader,
+    encode_copy_rows,
+    PGCOPY_HEADER,
+    PGCOPY_TRAILER,
+)
+import time
+
+
+class Command(BaseCommand):
+    help = 'Import book embeddings from a dump written by export_embeddings, without re-running the model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', type=str, help='Path of the dump file to read')
+        parser.add_argument(
+            '--model-id',
+            type=int,
+            help='Registry version to load into (default: the version named in the dump, registered as pending if missing)'
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        with open(options['input'], 'rb') as fh:
+            reader = EmbeddingDumpReader(fh)
+            embedding_model = self.resolve_model(reader.header, options.get('model_id'))
+            dimensions = embedding_model.dimensions
+            received = 0
+
+            def copy_payload():
+                nonlocal received
+                yield PGCOPY_HEADER
+                for book_ids, vectors in reader:
+                    received += len(book_ids)
+                    yield encode_copy_rows(book_ids, vectors)
+                yield PGCOPY_TRAILER
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS embedding_import")
+                cursor.execute(
+                    f"CREATE TEMP TABLE embedding_import (book_id bigint, embedding vector({dimensions})) ON COMMIT DROP"
+                )
+                cursor.copy_expert(
+                    "COPY embedding_import (book_id, embedding) FROM STDIN WITH (FORMAT binary)",
+                    IterableReader(copy_payload()),
+                )
+                # One set-based upsert; ids that don't exist in this database are skipped by the join
+                cursor.execute(
+                    f"""
+                    INSERT INTO recommendations_bookembedding
+                        (book_id, model_id, embedding, embedding_half, embedding_binary, created_at, updated_at)
+                    SELECT i.book_id, %s, i.embedding, i.embedding::halfvec({dimensions}),
+                           binary_quantize(i.embedding)::varbit, now(), now()
+                    FROM embedding_import i
+                    JOIN recommendations_book b ON b.id = i.book_id
+                    ON CONFLICT (book_id, model_id) DO UPDATE
+                    SET embedding = EXCLUDED.embedding,
+                        embedding_half = EXCLUDED.embedding_half,
+                        embedding_binary = EXCLUDED.embedding_binary,
+                        updated_at = EXCLUDED.updated_at
+                    """,
+                    [embedding_model.id],
+                )
+                imported = cursor.rowcount
+                if embedding_model.is_legacy:
+                    # Keep the Book.embedding mirror of version 1 in step; updated_at
+                    # moves with it so that API clients don't revalidate stale vectors
+                    cursor.execute(
+                        """
+                        UPDATE recommendations_book b
+                        SET embedding = i.embedding,
+                            updated_at = now()
+                        FROM embedding_import i
+                        WHERE b.id = i.book_id
+                        """
+                    )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} of {received} embeddings into {embedding_model} '
+            f'in {time.perf_counter() - start:.2f}s'
+        ))
+        if imported < received:
+            self.stdout.write(self.style.WARNING(f'{received - imported} embeddings had no matching book and were skipped.'))
+
+    def resolve_model(self, header, model_id):
+        if model_id:
+            try:
+                embedding_model = EmbeddingModel.objects.get(id=model_id)
+            except EmbeddingModel.DoesNotExist:
+                raise CommandError(f'Embedding model {model_id} does not exist.')
+        else:
+            embedding_model, created = EmbeddingModel.objects.get_or_create(
+                name=header['model'],
+                version=header['version'],
+                defaults={'dimensions': header['dimensions']},
+            )
+            if created:
+                self.stdout.write(self.style.WARNING(f'Registered {embedding_model} as pending.'))
+
+        if embedding_model.dimensions != header['dimensions']:
+            raise CommandError(
+                f"Dump has {header['dimensions']} dimensions but {embedding_model} has {embedding_model.dimensions}."
+            )
+        return embedding_model
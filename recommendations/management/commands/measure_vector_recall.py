@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from recommendations.models import Book, BookEmbedding
+from recommendations.retrieval import search_similar_books, VECTOR_REPRESENTATIONS
+from recommendations.embeddings import get_active_embedding_model
+import numpy as np
+import time
+
+
+class Command(BaseCommand):
+    help = 'Measure recall@k and latency of the half-precision and binary vector search against full precision'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sample',
+            type=int,
+            default=50,
+            help='Number of books used as queries (default: 50)'
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=10,
+            help='Number of neighbours compared per query (default: 10)'
+        )
+
+    def handle(self, *args, **options):
+        sample = options['sample']
+        top_k = options['top_k']
+
+        embedding_model = get_active_embedding_model()
+        queries = list(
+            BookEmbedding.objects.filter(model=embedding_model)
+            .order_by('?')
+            .values_list('book_id', 'embedding')[:sample]
+        )
+        if not queries:
+            self.stdout.write(self.style.WARNING('No books with embeddings to sample.'))
+            return
+
+        self.stdout.write(f'Running {len(queries)} queries with top_k={top_k} against {embedding_model}...')
+        recalls = {representation: [] for representation in VECTOR_REPRESENTATIONS}
+        timings = {representation: [] for representation in VECTOR_REPRESENTATIONS}
+
+        for book_id, embedding in queries:
+            candidates = Book.objects.exclude(id=book_id)
+            exact_ids = None
+            # 'full' comes first and is the exact baseline the others are scored against
+            for representation in VECTOR_REPRESENTATIONS:
+                start = time.perf_counter()
+                ids = {b.id for b in search_similar_books(candidates, embedding, top_k, representation, embedding_model)}
+                timings[representation].append(time.perf_counter() - start)
+                if exact_ids is None:
+                    exact_ids = ids
+                recalls[representation].append(len(ids & exact_ids) / len(exact_ids) if exact_ids else 1.0)
+
+        self.stdout.write(self.style.SUCCESS('\n' + '='*50))
+        for representation in VECTOR_REPRESENTATIONS:
+            latencies = np.array(timings[representation]) * 1000
+            self.stdout.write(
+                f'{representation:>6}: recall@{top_k}={np.mean(recalls[representation]):.3f} '
+                f'p50={np.percentile(latencies, 50):.1f}ms p95={np.percentile(latencies, 95):.1f}ms'
+            )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT avg(pg_column_size(embedding)),
+                       avg(pg_column_size(embedding_half)),
+                       avg(pg_column_size(embedding_binary))
+                FROM recommendations_bookembedding
+                WHERE model_id = %s
+                """,
+                [embedding_model.id]
+            )
+            full_bytes, half_bytes, binary_bytes = cursor.fetchone()
+            cursor.execute(
+                "SELECT pg_relation_size(%s), pg_relation_size(%s)",
+                [f'bookembedding_half_hnsw_{embedding_model.id}', f'bookembedding_bin_hnsw_{embedding_model.id}']
+            )
+            half_index, binary_index = cursor.fetchone()
+
+        self.stdout.write(
+            f'Average bytes per vector: full={full_bytes or 0:.0f} half={half_bytes or 0:.0f} binary={binary_bytes or 0:.0f}'
+        )
+        self.stdout.write(f'Index size: half={half_index / 1024:.0f} KB binary={binary_index / 1024:.0f} KB')
+        self.stdout.write(self.style.SUCCESS('='*50))
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.10 on 2026-10-19 00:54
+
+import pgvector.django.bit
+import pgvector.django.halfvec
+import pgvector.django.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0004_alter_book_options_book_created_at_book_updated_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='embedding_binary',
+            field=pgvector.django.bit.BitField(blank=True, length=384, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='embedding_half',
+            field=pgvector.django.halfvec.HalfVectorField(blank=True, dimensions=384, null=True),
+        ),
+        # Backfill the reduced-precision copies from the existing float32 vectors
+        # (halfvec and binary_quantize need pgvector >= 0.7). Runs before the
+        # indexes are created so they are built once over the filled columns.
+        migrations.RunSQL(
+            sql="""
+                UPDATE recommendations_book
+                SET embedding_half = embedding::halfvec(384),
+                    embedding_binary = binary_quantize(embedding)::bit(384)
+                WHERE embedding IS NOT NULL;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=pgvector.django.indexes.HnswIndex(fields=['embedding_half'], name='book_embedding_half_hnsw', opclasses=['halfvec_cosine_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=pgvector.django.indexes.HnswIndex(fields=['embedding_binary'], name='book_embedding_bin_hnsw', opclasses=['bit_hamming_ops']),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.10 on 2026-10-19 00:57
+
+import django.db.models.deletion
+import django.utils.timezone
+import pgvector.django.halfvec
+import pgvector.django.vector
+import recommendations.models
+from django.db import migrations, models
+
+
+def seed_legacy_embedding_model(apps, schema_editor):
+    """Register the model behind Book.embedding as active version 1 and copy its vectors."""
+    EmbeddingModel = apps.get_model('recommendations', 'EmbeddingModel')
+    legacy_model = EmbeddingModel.objects.create(
+        name='all-MiniLM-L6-v2',
+        dimensions=384,
+        version=1,
+        status='active',
+        activated_at=django.utils.timezone.now(),
+    )
+    model_id = legacy_model.id
+    schema_editor.execute(
+        """
+        INSERT INTO recommendations_bookembedding
+            (book_id, model_id, embedding, embedding_half, embedding_binary, created_at, updated_at)
+        SELECT id, %s, embedding, embedding_half, embedding_binary, now(), now()
+        FROM recommendations_book
+        WHERE embedding IS NOT NULL
+        """,
+        [model_id],
+    )
+    # Partial indexes on the typed casts, matching embeddings.vector_index_statements()
+    schema_editor.execute(
+        f"CREATE INDEX bookembedding_half_hnsw_{model_id} ON recommendations_bookembedding "
+        f"USING hnsw ((embedding_half::halfvec(384)) halfvec_cosine_ops) WHERE model_id = {model_id}"
+    )
+    schema_editor.execute(
+        f"CREATE INDEX bookembedding_bin_hnsw_{model_id} ON recommendations_bookembedding "
+        f"USING hnsw ((embedding_binary::bit(384)) bit_hamming_ops) WHERE model_id = {model_id}"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0005_book_embedding_half_book_embedding_binary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookEmbedding',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('embedding', pgvector.django.vector.VectorField()),
+                ('embedding_half', pgvector.django.halfvec.HalfVectorField(blank=True, null=True)),
+                ('embedding_binary', recommendations.models.VarBitField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EmbeddingModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('dimensions', models.PositiveIntegerField()),
+                ('version', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('active', 'Active'), ('retired', 'Retired')], default='pending', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-version'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_embedding_half_hnsw',
+        ),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_embedding_bin_hnsw',
+        ),
+        migrations.AddField(
+            model_name='bookembedding',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='recommendations.book'),
+        ),
+        migrations.AddConstraint(
+            model_name='embeddingmodel',
+            constraint=models.UniqueConstraint(fields=('name', 'version'), name='unique_embedding_model_version'),
+        ),
+        migrations.AddConstraint(
+            model_name='embeddingmodel',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('status',), name='single_active_embedding_model'),
+        ),
+        migrations.AddField(
+            model_name='bookembedding',
+            name='model',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='book_embeddings', to='recommendations.embeddingmodel'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookembedding',
+            constraint=models.UniqueConstraint(fields=('book', 'model'), name='unique_book_embedding_per_model'),
+        ),
+        migrations.RunPython(seed_legacy_embedding_model, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 01:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0006_embeddingmodel_bookembedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='explanation_features',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
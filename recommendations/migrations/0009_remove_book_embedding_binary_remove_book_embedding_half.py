@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-19 16:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0008_book_updated_at_idx'),
+    ]
+
+    # The quantized copies live on BookEmbedding since 0006, which also dropped their
+    # HNSW indexes here; nothing reads the Book columns any more
+    operations = [
+        migrations.RemoveField(
+            model_name='book',
+            name='embedding_binary',
+        ),
+        migrations.RemoveField(
+            model_name='book',
+            name='embedding_half',
+        ),
+    ]
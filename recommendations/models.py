@@ -1,6 +1,62 @@
+import numpy as np
 from django.db import models
-from pgvector.django import VectorField
+from pgvector.django import VectorField, HalfVectorField, BitField
 from django.contrib.auth.models import User
+from .quantization import quantize_embedding
+from .explanations import FEATURE_FIELDS, extract_features
+
+# Built-in embedding model whose vectors are mirrored on Book.embedding (registry version 1)
+LEGACY_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+LEGACY_EMBEDDING_DIMENSIONS = 384
+
+
+class VarBitField(BitField):
+    """Bit string without a fixed length (plain `bit` means bit(1) in Postgres)."""
+
+    def db_type(self, connection):
+        return 'varbit'
+
+
+class EmbeddingModel(models.Model):
+    """
+    Registry entry for a sentence-embedding model version.
+
+    Exactly one entry is ACTIVE and served by rag.py; PENDING entries are being
+    backfilled by `embed_books` and receive dual writes until they are activated.
+    """
+    PENDING = 'pending'
+    ACTIVE = 'active'
+    RETIRED = 'retired'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (ACTIVE, 'Active'),
+        (RETIRED, 'Retired'),
+    ]
+
+    name = models.CharField(max_length=255)  # SentenceTransformer model name
+    dimensions = models.PositiveIntegerField()
+    version = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    activated_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-version']
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'version'], name='unique_embedding_model_version'),
+            models.UniqueConstraint(
+                fields=['status'], condition=models.Q(status='active'), name='single_active_embedding_model'
+            ),
+        ]
+
+    @property
+    def is_legacy(self):
+        """Whether this version's vectors are also mirrored on Book.embedding."""
+        return self.name == LEGACY_EMBEDDING_MODEL and self.version == 1
+
+    def __str__(self):
+        return f"{self.name} v{self.version} ({self.dimensions} dims, {self.status})"
+
 
 class Book(models.Model):
     stock = models.IntegerField(default=0, blank=True, null=True)
@@ -15,6 +71,7 @@ class Book(models.Model):
     image = models.ImageField(upload_to='books', blank=True, null=True)
     subjects = models.CharField(max_length=255, blank=True, null=True)  # Comma-separated
     embedding = VectorField(dimensions=384, null=True, blank=True)  # For SentenceTransformer 'all-MiniLM-L6-v2' (384 dims)
+    explanation_features = models.JSONField(null=True, blank=True)  # Normalized author/category/subjects, see explanations.py
 
     created_at = models.DateTimeField(auto_now_add=True)  # When added
     updated_at = models.DateTimeField(auto_now=True)      # Last modified
@@ -25,11 +82,105 @@ class Book(models.Model):
             models.Index(fields=['title']), 
             models.Index(fields=['author']),
             models.Index(fields=['category']),
+            # Last-Modified/ETag of the book list API (MAX(updated_at), see api/views.py)
+            models.Index(fields=['updated_at'], name='book_updated_at_idx'),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        book = super().from_db(db, field_names, values)
+        # Remember the stored vector so that save() only mirrors an embedding that changed
+        if 'embedding' in book.__dict__:
+            book._stored_embedding = None if book.embedding is None else np.array(book.embedding)
+        return book
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        # Keep the precomputed explanation features in step with the fields they come from
+        if update_fields is None or set(update_fields) & set(FEATURE_FIELDS):
+            self.explanation_features = extract_features(self)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'explanation_features'}
+        mirror = (update_fields is None or 'embedding' in update_fields) and self._embedding_changed()
+        super().save(*args, **kwargs)
+        if mirror:
+            self._mirror_legacy_embedding()
+        self._stored_embedding = None if self.embedding is None else np.array(self.embedding)
+
+    def _embedding_changed(self):
+        """Whether embedding differs from what was loaded (always true for books not loaded from the database)."""
+        if 'embedding' in self.get_deferred_fields():
+            return False
+        if not hasattr(self, '_stored_embedding'):
+            return not (self._state.adding and self.embedding is None)
+        if self.embedding is None or self._stored_embedding is None:
+            return (self.embedding is None) != (self._stored_embedding is None)
+        return not np.array_equal(np.asarray(self.embedding), np.asarray(self._stored_embedding))
+
+    def _mirror_legacy_embedding(self):
+        """Dual-write Book.embedding into the side table under the legacy registry version."""
+        legacy_model = EmbeddingModel.objects.filter(name=LEGACY_EMBEDDING_MODEL, version=1).first()
+        if legacy_model is None:
+            return
+        if self.embedding is None:
+            BookEmbedding.objects.filter(book=self, model=legacy_model).delete()
+            return
+        BookEmbedding.objects.bulk_upsert([
+            BookEmbedding(book=self, model=legacy_model, embedding=self.embedding)
+        ])
+
     def __str__(self):
         return f"{self.title} by {self.author or 'Unknown'} (ID: {self.id})"
 
+class BookEmbeddingManager(models.Manager):
+    def bulk_upsert(self, book_embeddings, batch_size=500):
+        """
+        Insert or replace embeddings in one statement per batch, deriving the quantized copies.
+
+        Only the side table is written, so re-embedding never locks recommendations_book.
+        """
+        for book_embedding in book_embeddings:
+            book_embedding.embedding_half, book_embedding.embedding_binary = quantize_embedding(book_embedding.embedding)
+        return self.bulk_create(
+            book_embeddings,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['book', 'model'],
+            update_fields=['embedding', 'embedding_half', 'embedding_binary', 'updated_at'],
+        )
+
+
+class BookEmbedding(models.Model):
+    """
+    Embedding of a book under one registry version.
+
+    Columns are untyped (no fixed dimensions) so several model versions can share the
+    table; each version gets its own partial HNSW indexes on the typed cast.
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='embeddings')
+    model = models.ForeignKey(EmbeddingModel, on_delete=models.CASCADE, related_name='book_embeddings')
+    embedding = VectorField()
+    embedding_half = HalfVectorField(null=True, blank=True)
+    embedding_binary = VarBitField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BookEmbeddingManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'model'], name='unique_book_embedding_per_model'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.embedding_half, self.embedding_binary = quantize_embedding(self.embedding)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'BookEmbedding - book {self.book_id}, model {self.model_id}'
+
+
 class Purchase(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
@@ -0,0 +1,43 @@
+"""
+Reduced-precision copies of book embeddings.
+
+The float32 ``BookEmbedding.embedding`` column stays the source of truth; these
+helpers derive the float16 (``halfvec``) and sign-quantized (``bit``)
+representations stored next to it so the vector scan can read a smaller column.
+"""
+import numpy as np
+from pgvector import HalfVector
+
+
+def to_half_vector(embedding):
+    """
+    Convert an embedding to a pgvector HalfVector (float16, half the size of float32).
+
+    Returns None when the embedding is None.
+    """
+    if embedding is None:
+        return None
+    return HalfVector(np.asarray(embedding, dtype=np.float32))
+
+
+def to_binary_vector(embedding):
+    """
+    Sign-quantize an embedding into a bit string (1 bit per dimension, 32x smaller).
+
+    Matches Postgres' ``binary_quantize()``: positive components become 1, the rest 0.
+    Returns None when the embedding is None.
+    """
+    if embedding is None:
+        return None
+    bits = (np.asarray(embedding, dtype=np.float32) > 0).astype(np.uint8) + ord('0')
+    return bits.tobytes().decode('ascii')
+
+
+def quantize_embedding(embedding):
+    """
+    Build both reduced-precision copies of an embedding.
+
+    Returns:
+        tuple: (HalfVector | None, str | None) for the halfvec and bit columns
+    """
+    return to_half_vector(embedding), to_binary_vector(embedding)
@@ -1,10 +1,11 @@
-import os
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_ollama import ChatOllama
-from langchain_core.output_parsers import StrOutputParser
-from pgvector.django import CosineDistance
 from recommendations.models import Book, Purchase
-from sentence_transformers import SentenceTransformer
+from recommendations.retrieval import search_diverse_books, get_vector_representation, get_book_embeddings
+from recommendations.embeddings import load_sentence_transformer, get_active_embedding_model
+from recommendations.context import build_context
+from recommendations.llm import llm_gateway, build_prompt, JSON_SYSTEM_PREFIX
+from recommendations.explanations import get_explanation_mode, merge_features, render_explanations
+from recommendations.instrumentation import span, annotate, record_fallback
+from recommendations.structured import get_output_format, build_payload
 from django.core.cache import cache
 from django.contrib.auth.models import User
 import numpy as np
@@ -12,60 +13,136 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-# Singleton pattern for model caching
-_model_cache = None
+# Fixed instructions first and per-request data last, so the prompt prefix is
+# identical across requests (see llm.build_prompt)
+HISTORY_PROMPT = build_prompt(
+    """Recommend the books below to a customer based on their reading history.
+For each book add a short 1-sentence reason and a detailed explanation of why it is recommended.
 
-def get_sentence_transformer_model():
+Books to recommend:
+
+{context}"""
+)
+
+SIMILAR_BOOK_PROMPT = build_prompt(
+    """A customer enjoyed a book and is looking for what to read next.
+Recommend 3-5 books from the catalog excerpt that this customer might enjoy next.
+Explain briefly why each one is a good recommendation based on similarity to the original book.
+
+Catalog excerpt:
+
+{context}
+
+The customer enjoyed: {book_title}"""
+)
+
+QUERY_PROMPT = build_prompt(
+    """A customer is looking for books matching a request.
+Recommend 3-5 books from the catalog excerpt that best match the customer's request.
+For each book, provide a detailed explanation of why it fits the specific request.
+
+Catalog excerpt:
+
+{context}
+
+Customer request: {query}"""
+)
+
+# Structured output: one short reason per book, as JSON (see structured.py)
+HISTORY_REASONS_PROMPT = build_prompt(
+    """For each book below, write one short sentence on why it suits a customer based on their reading history.
+
+Books to recommend:
+
+{context}""",
+    system=JSON_SYSTEM_PREFIX,
+)
+
+SIMILAR_BOOK_REASONS_PROMPT = build_prompt(
+    """A customer enjoyed a book and is looking for what to read next.
+For each book in the catalog excerpt, write one short sentence on why it is a good follow-up to the book they enjoyed.
+
+Catalog excerpt:
+
+{context}
+
+The customer enjoyed: {book_title}""",
+    system=JSON_SYSTEM_PREFIX,
+)
+
+QUERY_REASONS_PROMPT = build_prompt(
+    """A customer is looking for books matching a request.
+For each book in the catalog excerpt, write one short sentence on how it fits the customer's request.
+
+Catalog excerpt:
+
+{context}
+
+Customer request: {query}""",
+    system=JSON_SYSTEM_PREFIX,
+)
+
+
+def get_sentence_transformer_model(embedding_model=None):
     """
-    Get or create a cached SentenceTransformer model.
-    Uses module-level singleton pattern to avoid reloading on every request.
+    Get the cached SentenceTransformer for a registry version (default: the active one).
+    Models are loaded once per process, see embeddings.load_sentence_transformer.
     """
-    global _model_cache
-    if _model_cache is None:
-        logger.info("Loading SentenceTransformer model 'all-MiniLM-L6-v2'...")
-        _model_cache = SentenceTransformer('all-MiniLM-L6-v2')
-        logger.info("Model loaded successfully")
-    return _model_cache
+    embedding_model = embedding_model or get_active_embedding_model()
+    return load_sentence_transformer(embedding_model.name)
 
 
-def get_recommendations(user_id, top_k=3):
+def get_recommendations(user_id, top_k=3, representation=None, deadline=None, latency_budget=None, mode=None,
+                        output=None):
     """
     Generate book recommendations for a user based on their purchase history using RAG.
     
     Args:
         user_id (int): The ID of the user to generate recommendations for
         top_k (int): Number of similar books to retrieve (default: 5)
+        representation (str): Vector column to search: 'full', 'half' or 'binary' (default: settings)
+        deadline (float): Seconds to wait for the LLM before serving the plain list (default: settings)
+        latency_budget (float): Expected wait the caller accepts; routes to a faster model (default: none)
+        mode (str): 'llm' for generated text or 'template' for LLM-free explanations (default: settings)
+        output (str): 'html' or 'structured' for a JSON-ready payload, see structured.py (default: 'html')
     
     Returns:
-        str: LLM-generated recommendations or error message
+        str | dict: LLM-generated recommendations or error message; with output='structured',
+        the payload instead of the recommendations
     
     Raises:
         None: All exceptions are caught and returned as user-friendly messages
     """
-    # Check cache first
-    cache_key = f"recommendations_{user_id}_{top_k}"
-    cached_result = cache.get(cache_key)
-    if cached_result:
-        logger.info(f"Returning cached recommendations for user {user_id}")
-        return cached_result
-    
     try:
+        # Settings are resolved inside the try: a bad value is a friendly error too
+        representation = get_vector_representation(representation)
+        mode = get_explanation_mode(mode)
+        output = get_output_format(output)
+        embedding_model = get_active_embedding_model()
+        # Check cache first
+        cache_key = f"recommendations_{user_id}_{top_k}_{representation}_{embedding_model.id}_{mode}_{output}"
+        with span('cache_lookup'):
+            cached_result = cache.get(cache_key)
+        annotate('cache', 'hit' if cached_result else 'miss')
+        if cached_result:
+            logger.info(f"Returning cached recommendations for user {user_id}")
+            return cached_result
+
         # Validate user exists
-        if not User.objects.filter(id=user_id).exists():
+        with span('user_validation'):
+            user_exists = User.objects.filter(id=user_id).exists()
+        if not user_exists:
             return "Invalid user ID."
         
         # Get past purchases
-        past_books = Purchase.objects.filter(user_id=user_id).values_list('book_id', flat=True)
+        with span('purchase_fetch'):
+            past_books = list(Purchase.objects.filter(user_id=user_id).values_list('book_id', flat=True))
+            # Get embeddings for past purchases (books not yet embedded are left out)
+            valid_embeddings = get_book_embeddings(past_books, embedding_model) if past_books else []
         
         if not past_books:
             return "No purchases yet. Browse our catalog!"
         
-        # Get embeddings for past purchases
-        past_embeddings = Book.objects.filter(id__in=past_books).values_list('embedding', flat=True)
-        
-        # Filter out None embeddings
-        valid_embeddings = [emb for emb in past_embeddings if emb is not None]
-        
         if not valid_embeddings:
             return "No embeddings available for your past purchases. Please check back later as we process your books."
         
@@ -73,46 +150,46 @@ def get_recommendations(user_id, top_k=3):
         average_embedding = np.mean(valid_embeddings, axis=0)
         
         # Retrieve similar books (exclude past purchases)
-        similar_books = Book.objects.exclude(id__in=past_books).annotate(
-            distance=CosineDistance('embedding', average_embedding)
-        ).order_by('distance')[:top_k]
+        with span('vector_search'):
+            similar_books = search_diverse_books(
+                Book.objects.exclude(id__in=past_books), average_embedding, top_k, representation, embedding_model
+            )
         #return similar_books
         
         if not similar_books:
             return "No similar books found. Try browsing our catalog for new discoveries!"
         
+        if mode == 'template' or output == 'structured':
+            purchased = Book.objects.filter(id__in=past_books).only(
+                'author', 'category', 'subjects', 'explanation_features'
+            )
+            reference = merge_features(purchased)
+
+        if output == 'structured':
+            payload, complete = build_payload(
+                similar_books, f"history:{sorted(past_books)}", None if mode == 'template' else HISTORY_REASONS_PROMPT,
+                reference=reference, deadline=deadline, latency_budget=latency_budget
+            )
+            if complete:
+                cache.set(cache_key, payload, 3600)
+            return payload
+
+        if mode == 'template':
+            with span('template_render'):
+                recommendation = render_explanations(similar_books, reference)
+            cache.set(cache_key, recommendation, 3600)
+            return recommendation
+        
         # Format retrieved books for context
-        context = "\n".join([
-            f"Title: {b.title}, Author: {b.author}, Description: {b.description}" 
-            for b in similar_books
-        ])
+        with span('context_build'):
+            context = build_context(similar_books)
         #context = "Title: test, Author: test, Description: test"
         #return context
         # LLM generation
         try:
-            llm = ChatOllama(model="llama3.1:8b", base_url=os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434'))
-            prompt = ChatPromptTemplate.from_template(
-            """You are an expert at formatting book recommendations in clean HTML.
-
-                Here is a list of books to recommend:
-
-                {context}
-
-                Return ONLY a valid HTML snippet containing an unordered list of recommendations.
-                Use this exact structure:
-                - Start directly with <ul>
-                - Each book as <li><strong>Title</strong> by Author - short 1-sentence reason -- Add an detailed explanation of why each book is recommended.</li>
-                - End with </ul>
-
-                Do NOT include any text outside the HTML.
-                Do NOT use markdown, code blocks, or backticks.
-                Do NOT add headings, paragraphs, or explanations.
-                Do NOT wrap in ```html tags.
-
-                Begin your response directly with <ul>"""
+            recommendation = llm_gateway.generate(
+                HISTORY_PROMPT, {"context": context}, deadline=deadline, latency_budget=latency_budget
             )
-            chain = prompt | llm | StrOutputParser()
-            recommendation = chain.invoke({"context": context})
             
             # Cache the result for 1 hour
             cache.set(cache_key, recommendation, 3600)
@@ -121,6 +198,7 @@ def get_recommendations(user_id, top_k=3):
             
         except Exception as llm_error:
             logger.error(f"LLM generation failed for user {user_id}: {llm_error}")
+            record_fallback(llm_error)
             # Fallback: return simple list if LLM fails
             fallback = "Based on your reading history, you might enjoy:\n\n"
             fallback += "\n".join([f"- {b.title} by {b.author}" for b in similar_books])
@@ -130,88 +208,93 @@ def get_recommendations(user_id, top_k=3):
         logger.error(f"Error generating recommendations for user {user_id}: {e}")
         return "We're having trouble generating recommendations right now. Please try again later."
 
-def get_recommendations_by_book_title(book_title: str, top_k: int = 5) -> str:
+def get_recommendations_by_book_title(book_title: str, top_k: int = 5, representation: str = None,
+                                      deadline: float = None, latency_budget: float = None, mode: str = None,
+                                      output: str = None) -> str | dict:
     """
     Generate book recommendations based on a given book title using vector similarity (RAG-style).
 
     Args:
         book_title (str): The title of the book to find similar books for
         top_k (int): Number of similar books to retrieve (default: 5)
+        representation (str): Vector column to search: 'full', 'half' or 'binary' (default: settings)
+        deadline (float): Seconds to wait for the LLM before serving the plain list (default: settings)
+        latency_budget (float): Expected wait the caller accepts; routes to a faster model (default: none)
+        mode (str): 'llm' for generated text or 'template' for LLM-free explanations (default: settings)
+        output (str): 'html' or 'structured' for a JSON-ready payload, see structured.py (default: 'html')
 
     Returns:
-        str: LLM-generated recommendations in HTML format or fallback message
+        str | dict: LLM-generated recommendations in HTML format or fallback message; with
+        output='structured', the payload instead of the recommendations
     """
-    cache_key = f"recommendations_title_{book_title.lower()}_{top_k}"
-    cached_result = cache.get(cache_key)
-    if cached_result:
-        logger.info(f"Cache hit for recommendations: {book_title}")
-        return cached_result
-
     try:
-        # Step 1: Find the reference book by title
-        try:
-            reference_book = Book.objects.get(title__iexact=book_title)
-        except Book.DoesNotExist:
-            return f"Sorry, we couldn't find a book titled '{book_title}' in our catalog."
-        except Book.MultipleObjectsReturned:
-            # Use the first match if multiple
+        representation = get_vector_representation(representation)
+        mode = get_explanation_mode(mode)
+        output = get_output_format(output)
+        embedding_model = get_active_embedding_model()
+        cache_key = f"recommendations_title_{book_title.lower()}_{top_k}_{representation}_{embedding_model.id}_{mode}_{output}"
+        with span('cache_lookup'):
+            cached_result = cache.get(cache_key)
+        annotate('cache', 'hit' if cached_result else 'miss')
+        if cached_result:
+            logger.info(f"Cache hit for recommendations: {book_title}")
+            return cached_result
+
+        # Step 1: Find the reference book by title (the first match if there are several)
+        with span('reference_lookup'):
             reference_book = Book.objects.filter(title__iexact=book_title).first()
+            reference_embeddings = get_book_embeddings([reference_book.id], embedding_model) if reference_book else []
 
-        if reference_book.embedding is None:
+        if reference_book is None:
+            return f"Sorry, we couldn't find a book titled '{book_title}' in our catalog."
+        if not reference_embeddings:
             return f"We don't have embedding data for '{book_title}' yet. Please try another book."
 
-        reference_embedding = reference_book.embedding
+        reference_embedding = reference_embeddings[0]
 
         # Step 2: Retrieve top_k similar books (excluding the reference book itself)
-        similar_books = (
-            Book.objects.exclude(id=reference_book.id)
-            .annotate(distance=CosineDistance('embedding', reference_embedding))
-            .filter(embedding__isnull=False)  # Ensure valid embeddings
-            .order_by('distance')[:top_k]
-        )
+        with span('vector_search'):
+            similar_books = search_diverse_books(
+                Book.objects.exclude(id=reference_book.id), reference_embedding, top_k, representation, embedding_model
+            )
 
         if not similar_books:
             return "No similar books found at this time. Try browsing our catalog!"
 
-        # Step 3: Format context for LLM
-        context_lines = []
-        for b in similar_books:
-            author = b.author or "Unknown Author"
-            description = b.description or "No description available."
-            context_lines.append(f"Title: {b.title}\nAuthor: {author}\nDescription: {description}\n")
+        if output == 'structured':
+            payload, complete = build_payload(
+                similar_books, f"book:{reference_book.id}",
+                None if mode == 'template' else SIMILAR_BOOK_REASONS_PROMPT, {"book_title": book_title},
+                merge_features([reference_book]), temperature=0.7, deadline=deadline, latency_budget=latency_budget
+            )
+            if complete:
+                cache.set(cache_key, payload, timeout=3600)
+            return payload
+
+        if mode == 'template':
+            with span('template_render'):
+                recommendation = render_explanations(similar_books, merge_features([reference_book]))
+            cache.set(cache_key, recommendation, timeout=3600)
+            return recommendation
 
-        context = "\n".join(context_lines)
+        # Step 3: Format context for LLM
+        with span('context_build'):
+            context = build_context(similar_books)
 
         # Step 4: Generate recommendations using LLM
         try:
-            llm = ChatOllama(model="llama3.1:8b", temperature=0.7, base_url=os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434'))
-            prompt = ChatPromptTemplate.from_template(
-                """You are a knowledgeable bookstore assistant. 
-                    A customer enjoyed the book titled "{book_title}".
-
-                    Here are some similar books from our catalog:
-
-                    {context}
-
-                    Recommend 3-5 books from the list above that this customer might enjoy next.
-                    Explain briefly why each one is a good recommendation based on similarity to the original book.
-
-                    Format your response as an HTML unordered list (<ul><li>...</li></ul>) with bold titles.
-                    Do not recommend books outside this list."""
+            recommendation = llm_gateway.generate(
+                SIMILAR_BOOK_PROMPT, {"book_title": book_title, "context": context}, temperature=0.7, deadline=deadline,
+                latency_budget=latency_budget
             )
 
-            chain = prompt | llm | StrOutputParser()
-            recommendation = chain.invoke({
-                "book_title": book_title,
-                "context": context
-            })
-
             # Cache successful result for 1 hour
             cache.set(cache_key, recommendation, timeout=3600)
             return recommendation
 
         except Exception as llm_error:
             logger.error(f"LLM generation failed for book '{book_title}': {llm_error}")
+            record_fallback(llm_error)
             # Fallback: simple formatted list
             fallback = "<ul>"
             for b in similar_books:
@@ -225,78 +308,87 @@ def get_recommendations_by_book_title(book_title: str, top_k: int = 5) -> str:
         return "We're having trouble generating recommendations right now. Please try again later or browse our catalog."
 
 
-def get_recommendations_by_query(query: str, top_k: int = 5) -> str:
+def get_recommendations_by_query(query: str, top_k: int = 5, representation: str = None,
+                                 deadline: float = None, latency_budget: float = None, mode: str = None,
+                                 output: str = None) -> str | dict:
     """
     Generate book recommendations based on a natural language query using vector similarity (RAG-style).
 
     Args:
         query (str): The search query or explanation of the topic
         top_k (int): Number of similar books to retrieve (default: 5)
+        representation (str): Vector column to search: 'full', 'half' or 'binary' (default: settings)
+        deadline (float): Seconds to wait for the LLM before serving the plain list (default: settings)
+        latency_budget (float): Expected wait the caller accepts; routes to a faster model (default: none)
+        mode (str): 'llm' for generated text or 'template' for LLM-free explanations (default: settings)
+        output (str): 'html' or 'structured' for a JSON-ready payload, see structured.py (default: 'html')
 
     Returns:
-        str: LLM-generated recommendations in HTML format or fallback message
+        str | dict: LLM-generated recommendations in HTML format or fallback message; with
+        output='structured', the payload instead of the recommendations
     """
-    cache_key = f"recommendations_query_{hash(query)}_{top_k}"
-    cached_result = cache.get(cache_key)
-    if cached_result:
-        logger.info(f"Cache hit for query recommendations: {query[:50]}...")
-        return cached_result
-
     try:
+        representation = get_vector_representation(representation)
+        mode = get_explanation_mode(mode)
+        output = get_output_format(output)
+        embedding_model = get_active_embedding_model()
+        cache_key = f"recommendations_query_{hash(query)}_{top_k}_{representation}_{embedding_model.id}_{mode}_{output}"
+        with span('cache_lookup'):
+            cached_result = cache.get(cache_key)
+        annotate('cache', 'hit' if cached_result else 'miss')
+        if cached_result:
+            logger.info(f"Cache hit for query recommendations: {query[:50]}...")
+            return cached_result
+
         # Step 1: Generate embedding for the query
-        model = get_sentence_transformer_model()
-        query_embedding = model.encode(query).tolist()
+        # Encode with the same registry version that is searched
+        with span('query_encoding'):
+            model = get_sentence_transformer_model(embedding_model)
+            query_embedding = model.encode(query).tolist()
 
         # Step 2: Retrieve top_k similar books
-        similar_books = (
-            Book.objects.annotate(distance=CosineDistance('embedding', query_embedding))
-            .filter(embedding__isnull=False)  # Ensure valid embeddings
-            .order_by('distance')[:top_k]
-        )
+        with span('vector_search'):
+            similar_books = search_diverse_books(
+                Book.objects.all(), query_embedding, top_k, representation, embedding_model
+            )
 
         if not similar_books:
             return "No similar books found for your query. Try searching for something else!"
 
-        # Step 3: Format context for LLM
-        context_lines = []
-        for b in similar_books:
-            author = b.author or "Unknown Author"
-            description = b.description or "No description available."
-            context_lines.append(f"Title: {b.title}\nAuthor: {author}\nDescription: {description}\n")
+        if output == 'structured':
+            payload, complete = build_payload(
+                similar_books, f"query:{' '.join(query.split()).casefold()}",
+                None if mode == 'template' else QUERY_REASONS_PROMPT, {"query": query},
+                temperature=0.7, deadline=deadline, latency_budget=latency_budget
+            )
+            if complete:
+                cache.set(cache_key, payload, timeout=3600)
+            return payload
 
-        context = "\n".join(context_lines)
+        if mode == 'template':
+            with span('template_render'):
+                recommendation = render_explanations(similar_books)
+            cache.set(cache_key, recommendation, timeout=3600)
+            return recommendation
+
+        # Step 3: Format context for LLM
+        with span('context_build'):
+            context = build_context(similar_books)
 
         # Step 4: Generate recommendations using LLM
         try:
-            llm = ChatOllama(model="llama3.1:8b", temperature=0.7, base_url=os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434'))
-            prompt = ChatPromptTemplate.from_template(
-                """You are a helpful bookstore assistant. 
-                    A customer is looking for books based on the following request: "{query}".
-
-                    Here are some books from our catalog that might match their interests:
-
-                    {context}
-
-                    Recommend 3-5 books from the list above that best match the customer's request.
-                    For each book, provide a detailed explanation of why it fits the specific query provided.
-
-                    Format your response as an HTML unordered list (<ul><li>...</li></ul>).
-                    Each list item should follow this structure: <li><strong>Title</strong> by Author - Reason for recommendation</li>.
-                    Do not include any text outside the HTML tags."""
+            recommendation = llm_gateway.generate(
+                QUERY_PROMPT, {"query": query, "context": context}, temperature=0.7, deadline=deadline,
+                latency_budget=latency_budget
             )
 
-            chain = prompt | llm | StrOutputParser()
-            recommendation = chain.invoke({
-                "query": query,
-                "context": context
-            })
-
             # Cache successful result for 1 hour
             cache.set(cache_key, recommendation, timeout=3600)
             return recommendation
 
         except Exception as llm_error:
             logger.error(f"LLM generation failed for query '{query[:50]}...': {llm_error}")
+            record_fallback(llm_error)
             # Fallback: simple formatted list
             fallback = "<ul>"
             for b in similar_books:
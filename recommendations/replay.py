@@ -0,0 +1,92 @@
+"""
+Record/replay store for LLM responses.
+
+settings.RAG_LLM_REPLAY_MODE controls how the gateway uses it:
+
+- ``passthrough``: call the model, store nothing (default)
+- ``record``:      call the model and append every answer to the store
+- ``replay``:      answer only from the store; a miss raises ReplayMissError and
+                   the model is never called
+
+Answers are keyed on a hash of the rendered prompt, the model and the
+temperature, so tests, benchmarks and staging can run the full RAG chain
+(prompt construction, parsing, fallbacks) at disk speed without Ollama. Routed
+calls are keyed on the configured model list rather than the model picked,
+which depends on live latency statistics and would differ between the record
+and the replay run. A recorded file can also be used to seed a new environment. The store is a JSON
+Lines file (settings.RAG_LLM_REPLAY_PATH) with one answer per line.
+"""
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+REPLAY_MODES = ('passthrough', 'record', 'replay')
+
+
+class ReplayMissError(LookupError):
+    """Replay mode found no recorded answer for a prompt."""
+
+
+def prompt_key(model, temperature, messages):
+    """
+    Stable hash of everything that determines the model's answer.
+
+    Args:
+        model (str | list[str]): Model named by the caller, or the router's model list
+        temperature (float): Sampling temperature
+        messages (list[BaseMessage]): Rendered prompt
+    """
+    payload = json.dumps(
+        [model, temperature, [[message.type, message.content] for message in messages]],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseStore:
+    """Append-only JSON Lines file of recorded answers, indexed in memory."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._responses = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        responses = {}
+        if self.path.exists():
+            with self.path.open(encoding='utf-8') as store:
+                for line in store:
+                    if line.strip():
+                        entry = json.loads(line)
+                        responses[entry['key']] = entry['response']
+        return responses
+
+    def get(self, key):
+        """Return the recorded answer for key, or None."""
+        with self._lock:
+            if self._responses is None:
+                self._responses = self._load()
+            return self._responses.get(key)
+
+    def replay(self, key):
+        """
+        Return the recorded answer for key.
+
+        Raises:
+            ReplayMissError: If nothing was recorded for key
+        """
+        response = self.get(key)
+        if response is None:
+            raise ReplayMissError(f'No recorded LLM response for prompt {key[:12]} in {self.path}')
+        return response
+
+    def put(self, key, model, response):
+        """Record an answer (later recordings of the same key win)."""
+        with self._lock:
+            if self._responses is None:
+                self._responses = self._load()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open('a', encoding='utf-8') as store:
+                store.write(json.dumps({'key': key, 'model': model, 'response': response}, ensure_ascii=False) + '\n')
+            self._responses[key] = response
@@ -0,0 +1,190 @@
+"""
+Vector similarity search over the Book catalog.
+
+The RAG entry points in ``rag.py`` go through ``search_similar_books`` so the
+vector column used for the scan can be chosen per call or via settings:
+
+- ``full``:   exact cosine distance on the float32 ``embedding`` column
+- ``half``:   cosine distance on the float16 ``embedding_half`` column
+- ``binary``: Hamming distance on ``embedding_binary`` for a coarse candidate
+              pool, re-ranked with exact cosine distance on ``embedding``
+
+Vectors are read from the ``BookEmbedding`` side table for one registry
+version (the active one unless told otherwise).
+
+``search_diverse_books`` adds a maximal-marginal-relevance (MMR) stage on top:
+it retrieves a larger candidate pool and greedily picks books that are close to
+the query but not to the books already picked, so near-duplicate editions of
+the same work don't crowd out the context.
+"""
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Cast
+from pgvector.django import CosineDistance, HammingDistance, HalfVectorField, BitField
+from .models import Book, BookEmbedding
+from .quantization import to_half_vector, to_binary_vector
+from .embeddings import get_active_embedding_model
+
+VECTOR_REPRESENTATIONS = ('full', 'half', 'binary')
+
+
+def get_vector_representation(representation=None):
+    """
+    Resolve the representation to use, falling back to settings.RAG_VECTOR_REPRESENTATION.
+
+    Raises:
+        ValueError: If the representation is not one of VECTOR_REPRESENTATIONS
+    """
+    representation = representation or getattr(settings, 'RAG_VECTOR_REPRESENTATION', 'full')
+    if representation not in VECTOR_REPRESENTATIONS:
+        raise ValueError(f"Unknown vector representation '{representation}'. Choose from {VECTOR_REPRESENTATIONS}.")
+    return representation
+
+
+def get_book_embeddings(book_ids, embedding_model=None):
+    """
+    Return the stored vectors of the given books under one registry version.
+
+    Books without an embedding for that version are left out.
+    """
+    embedding_model = embedding_model or get_active_embedding_model()
+    return list(
+        BookEmbedding.objects.filter(model=embedding_model, book_id__in=book_ids).values_list('embedding', flat=True)
+    )
+
+
+def search_similar_books(queryset, query_embedding, top_k, representation=None, embedding_model=None,
+                         with_embeddings=False):
+    """
+    Return the top_k books in queryset closest to query_embedding.
+
+    Args:
+        queryset (QuerySet): Books to search (already filtered/excluded by the caller)
+        query_embedding (list | np.ndarray): Query vector in the full-precision space
+        top_k (int): Number of books to return
+        representation (str): 'full', 'half' or 'binary' (default: settings)
+        embedding_model (EmbeddingModel): Registry version to search (default: the active one)
+        with_embeddings (bool): Also annotate each book with its `vector` (full precision)
+
+    Returns:
+        list[Book]: Books ordered by ascending cosine distance, each annotated with `distance`
+    """
+    representation = get_vector_representation(representation)
+    embedding_model = embedding_model or get_active_embedding_model()
+    dimensions = embedding_model.dimensions
+
+    # Each filter() on the reverse relation adds a join, so keep the side-table
+    # conditions in a single call; the annotations below then reuse that join.
+    if representation == 'half':
+        queryset = (
+            queryset.filter(embeddings__model=embedding_model, embeddings__embedding_half__isnull=False)
+            .annotate(distance=CosineDistance(
+                Cast('embeddings__embedding_half', HalfVectorField(dimensions=dimensions)),
+                to_half_vector(query_embedding),
+            ))
+        )
+    else:
+        if representation == 'binary':
+            # Coarse pass on 1-bit vectors, then exact re-ranking of the candidate pool
+            pool_size = top_k * getattr(settings, 'RAG_BINARY_RERANK_FACTOR', 10)
+            candidates = (
+                queryset.filter(embeddings__model=embedding_model, embeddings__embedding_binary__isnull=False)
+                .annotate(hamming=HammingDistance(
+                    Cast('embeddings__embedding_binary', BitField(length=dimensions)),
+                    to_binary_vector(query_embedding),
+                ))
+                .order_by('hamming')
+                .values('id')[:pool_size]
+            )
+            queryset = Book.objects.filter(id__in=candidates)
+
+        queryset = (
+            queryset.filter(embeddings__model=embedding_model)
+            .annotate(distance=CosineDistance('embeddings__embedding', query_embedding))
+        )
+
+    if with_embeddings:
+        queryset = queryset.annotate(vector=F('embeddings__embedding'))
+    return list(queryset.order_by('distance')[:top_k])
+
+
+def mmr_rerank(query_embedding, candidate_embeddings, top_k, lambda_mult):
+    """
+    Select candidates by maximal marginal relevance.
+
+    All pairwise cosine similarities come from a single matrix product; each of the
+    top_k greedy steps is then a vectorized update over the whole pool.
+
+    Args:
+        query_embedding (list | np.ndarray): Query vector
+        candidate_embeddings (list | np.ndarray): Candidate vectors, one per row
+        top_k (int): Number of candidates to select
+        lambda_mult (float): 1.0 ranks by relevance only, 0.0 by diversity only
+
+    Returns:
+        list[int]: Indices into candidate_embeddings, in selection order
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    if not len(candidates) or top_k <= 0:
+        return []
+    query = np.asarray(query_embedding, dtype=np.float32)
+
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = query / max(np.linalg.norm(query), 1e-12)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+
+    top_k = min(top_k, len(candidates))
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of every candidate to anything selected so far
+    redundancy = similarity[selected[0]].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < top_k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+
+    return selected
+
+
+def search_diverse_books(queryset, query_embedding, top_k, representation=None, embedding_model=None,
+                         lambda_mult=None):
+    """
+    Return top_k books relevant to query_embedding, diversified with MMR.
+
+    A pool of top_k * settings.RAG_MMR_POOL_FACTOR nearest books is retrieved with
+    search_similar_books and re-ranked by mmr_rerank.
+
+    Args:
+        queryset (QuerySet): Books to search
+        query_embedding (list | np.ndarray): Query vector in the full-precision space
+        top_k (int): Number of books to return
+        representation (str): 'full', 'half' or 'binary' (default: settings)
+        embedding_model (EmbeddingModel): Registry version to search (default: the active one)
+        lambda_mult (float): Relevance/diversity trade-off (default: settings.RAG_MMR_LAMBDA)
+
+    Returns:
+        list[Book]: Selected books in MMR order, each annotated with `distance`
+    """
+    if lambda_mult is None:
+        lambda_mult = getattr(settings, 'RAG_MMR_LAMBDA', 0.7)
+    if lambda_mult >= 1:
+        # Pure relevance: MMR would return the plain nearest neighbours anyway
+        return search_similar_books(queryset, query_embedding, top_k, representation, embedding_model)
+
+    pool_size = top_k * getattr(settings, 'RAG_MMR_POOL_FACTOR', 5)
+    pool = search_similar_books(
+        queryset, query_embedding, pool_size, representation, embedding_model, with_embeddings=True
+    )
+    if len(pool) <= 1:
+        return pool
+
+    selected = mmr_rerank(query_embedding, [book.vector for book in pool], top_k, lambda_mult)
+    return [pool[i] for i in selected]
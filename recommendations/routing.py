@@ -0,0 +1,82 @@
+"""
+Latency-aware choice between the configured chat models.
+
+settings.RAG_LLM_MODELS lists the models from fastest to most capable, e.g.
+``llama3.2:1b,llama3.1:8b``. The router keeps a rolling window of observed call
+latencies per model. For each request it picks the most capable model whose p95
+fits the caller's latency budget:
+
+- no budget (batch precompute, free-form queries): the last, most capable model
+- a budget (interactive pages such as checkout): the last model whose p95 is
+  within it; a model without measurements yet is given the chance
+- nothing fits: the first, fastest model
+"""
+import threading
+from collections import deque
+import numpy as np
+
+
+class ModelRouter:
+    """Route LLM requests by rolling per-model latency."""
+
+    def __init__(self, models, window=100):
+        if not models:
+            raise ValueError('ModelRouter needs at least one model')
+        self.models = list(models)
+        self.window = window
+        self.latencies = {model: deque(maxlen=window) for model in self.models}
+        self._lock = threading.Lock()
+
+    @property
+    def default_model(self):
+        """The most capable model, used when there is no latency budget."""
+        return self.models[-1]
+
+    def record(self, model, seconds):
+        """Record the latency of one call to model."""
+        with self._lock:
+            self.latencies.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentiles(self, model):
+        """
+        Return the rolling (p50, p95) latency of model in seconds.
+
+        Returns:
+            tuple[float, float] | None: None if the model has no measurements yet
+        """
+        with self._lock:
+            samples = list(self.latencies.get(model, ()))
+        if not samples:
+            return None
+        p50, p95 = np.percentile(samples, [50, 95])
+        return float(p50), float(p95)
+
+    def choose(self, latency_budget=None):
+        """
+        Pick the model for a request.
+
+        Args:
+            latency_budget (float): Seconds the caller can wait, or None for no limit
+
+        Returns:
+            str: Model name
+        """
+        if latency_budget is None:
+            return self.default_model
+        for model in reversed(self.models):
+            stats = self.percentiles(model)
+            if stats is None or stats[1] <= latency_budget:
+                return model
+        return self.models[0]
+
+    def stats(self):
+        """Return {model: {'calls', 'p50', 'p95'}} for monitoring."""
+        result = {}
+        for model in list(self.latencies):
+            percentiles = self.percentiles(model)
+            result[model] = {
+                'calls': len(self.latencies[model]),
+                'p50': percentiles[0] if percentiles else None,
+                'p95': percentiles[1] if percentiles else None,
+            }
+        return result
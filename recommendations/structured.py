@@ -0,0 +1,169 @@
+"""
+Structured (JSON) recommendation payloads.
+
+With `output='structured'` the RAG entry points return data instead of an HTML
+blob, so clients can render it themselves and cache or reuse single items:
+
+    {"items": [{"book_id": 12, "title": "...", "author": "...", "score": 0.83, "reason": "..."}]}
+
+Scores come from the vector search (1 - cosine distance). Reasons are cached per
+(book, context), the context being what they were written for: the reference
+book, the query or the purchase history. A response that shares most of its
+books with an earlier one therefore only asks the LLM about the new books.
+
+The LLM answers in JSON (Ollama's `format='json'`), validated with pydantic.
+Books it skipped, and all books when it is unavailable, get the template
+explanation (see explanations.py); those reasons are not cached so the LLM gets
+another chance next time.
+"""
+import hashlib
+import logging
+from django.core.cache import cache
+from pydantic import BaseModel, Field
+from .context import UNKNOWN_AUTHOR, build_context, trim_to_sentences
+from .explanations import explain
+from .instrumentation import span, record_fallback
+from .llm import llm_gateway
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ('html', 'structured')
+REASON_CACHE_TIMEOUT = 60 * 60 * 24
+# Reasons are meant to be one short sentence; longer answers are trimmed
+MAX_REASON_TOKENS = 60
+
+
+class GeneratedReason(BaseModel):
+    book_id: int
+    reason: str = Field(min_length=1)
+
+
+class GeneratedReasons(BaseModel):
+    """What the structured prompts ask the LLM to return."""
+    items: list[GeneratedReason]
+
+
+class RecommendationItem(BaseModel):
+    book_id: int
+    title: str
+    author: str
+    score: float = Field(ge=0, le=1)
+    reason: str
+
+
+class RecommendationList(BaseModel):
+    """Structured payload returned to clients."""
+    items: list[RecommendationItem]
+
+
+def get_output_format(output=None):
+    """
+    Resolve the output format, 'html' by default.
+
+    Raises:
+        ValueError: If the format is not one of OUTPUT_FORMATS
+    """
+    output = output or 'html'
+    if output not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output}'. Choose from {OUTPUT_FORMATS}.")
+    return output
+
+
+def reason_cache_key(book, context):
+    """Cache key of a book's reason in a context; changes whenever the book is saved."""
+    version = book.updated_at.timestamp() if book.updated_at else 0
+    digest = hashlib.sha1(context.encode('utf-8')).hexdigest()
+    return f"rag_reason_{book.id}_{version}_{digest}"
+
+
+def get_score(book):
+    """Similarity of a retrieved book to the query, between 0 and 1."""
+    distance = getattr(book, 'distance', None)
+    if distance is None:
+        return 0.0
+    return round(min(max(1 - distance, 0.0), 1.0), 4)
+
+
+def parse_reasons(text):
+    """
+    Validate the LLM's JSON answer.
+
+    Returns:
+        dict: book id -> trimmed reason
+
+    Raises:
+        pydantic.ValidationError: If the answer does not match GeneratedReasons
+    """
+    start, end = text.find('{'), text.rfind('}')
+    if start != -1 and end > start:
+        # Tolerate stray text or code fences around the object
+        text = text[start:end + 1]
+    reasons = GeneratedReasons.model_validate_json(text)
+    return {item.book_id: trim_to_sentences(item.reason, MAX_REASON_TOKENS) for item in reasons.items}
+
+
+def generate_reasons(books, prompt, variables, **options):
+    """
+    Ask the LLM for the reasons of books in one call.
+
+    Returns:
+        dict: book id -> reason, for the requested books the LLM answered for;
+        empty if the LLM is unavailable or its answer is invalid
+    """
+    with span('context_build'):
+        context = build_context(books, with_ids=True)
+    try:
+        text = llm_gateway.generate(prompt, {**variables, 'context': context}, output_format='json', **options)
+        with span('reason_parse'):
+            reasons = parse_reasons(text)
+    except Exception as llm_error:
+        logger.error(f"Structured LLM generation failed for books {[book.id for book in books]}: {llm_error}")
+        record_fallback(llm_error)
+        return {}
+    requested = {book.id for book in books}
+    return {book_id: reason for book_id, reason in reasons.items() if book_id in requested}
+
+
+def build_payload(books, context, prompt=None, variables=None, reference=None, **options):
+    """
+    Build the structured payload for retrieved books.
+
+    Args:
+        books (list[Book]): Retrieved books, best first, annotated with `distance`
+        context (str): What the reasons are written for, e.g. "book:12"; part of the reason cache key
+        prompt (ChatPromptTemplate): Structured prompt for the missing reasons; None for template reasons only
+        variables (dict): Prompt values other than the context
+        reference (dict): Output of merge_features, for the template reasons
+        **options: Passed to LLMGateway.generate (temperature, deadline, latency_budget)
+
+    Returns:
+        tuple[dict, bool]: The payload, and whether no reason had to fall back to the
+        template because of the LLM (i.e. whether the payload may be cached)
+    """
+    reasons = {}
+    complete = True
+    if prompt is not None:
+        keys = {book.id: reason_cache_key(book, context) for book in books}
+        with span('reason_cache'):
+            cached = cache.get_many(keys.values())
+        reasons = {book.id: cached[keys[book.id]] for book in books if keys[book.id] in cached}
+
+        missing = [book for book in books if book.id not in reasons]
+        if missing:
+            generated = generate_reasons(missing, prompt, variables or {}, **options)
+            if generated:
+                cache.set_many({keys[book_id]: reason for book_id, reason in generated.items()}, REASON_CACHE_TIMEOUT)
+            reasons.update(generated)
+            complete = len(generated) == len(missing)
+
+    payload = RecommendationList(items=[
+        RecommendationItem(
+            book_id=book.id,
+            title=book.title,
+            author=book.author or UNKNOWN_AUTHOR,
+            score=get_score(book),
+            reason=reasons.get(book.id) or explain(book, reference),
+        )
+        for book in books
+    ])
+    return payload.model_dump(), complete
@@ -1,9 +1,33 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
-from recommendations.models import Book, Purchase
-from recommendations.rag import get_recommendations, get_sentence_transformer_model
+from recommendations.models import Book, Purchase, BookEmbedding, EmbeddingModel
+from recommendations.rag import get_recommendations, get_recommendations_by_book_title, get_sentence_transformer_model
+from recommendations.rag import get_recommendations_by_query
+from recommendations.rag import SIMILAR_BOOK_REASONS_PROMPT
+from recommendations.retrieval import search_similar_books, search_diverse_books, mmr_rerank
+from recommendations.llm import llm_gateway, build_prompt, SYSTEM_PREFIX
+from recommendations.routing import ModelRouter
+from recommendations.instrumentation import histograms
+from recommendations.fake_ollama import FakeOllamaServer
+from recommendations.explanations import extract_features, merge_features, explain, render_explanations
+from recommendations.replay import ReplayMissError, ResponseStore
+from recommendations.structured import parse_reasons, build_payload
+from recommendations.fake_ollama import fake_reply
+from pydantic import ValidationError
+from recommendations.circuit_breaker import CircuitBreaker, CircuitOpenError, LLMTimeoutError
+from recommendations.context import build_context, trim_to_sentences, estimate_tokens, get_book_summaries
+from recommendations.embeddings import get_active_embedding_model, register_embedding_model, activate_embedding_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+import json
+import os
+import tempfile
+import time
 from unittest.mock import patch, MagicMock
 import numpy as np
+import ollama
 
 
 class BookModelTestCase(TestCase):
@@ -90,6 +114,9 @@ class RAGRecommendationTestCase(TestCase):
     
     def setUp(self):
         """Set up test data"""
+        # Clients are pooled per process; start from a fresh gateway so ChatOllama mocks apply
+        llm_gateway.reset()
+        self.addCleanup(llm_gateway.reset)
         self.user = User.objects.create_user(
             username='raguser',
             email='rag@example.com',
@@ -139,7 +166,7 @@ class RAGRecommendationTestCase(TestCase):
         Purchase.objects.create(user=self.user, book=self.book1)
         
         # Mock the LLM to avoid actual API calls
-        with patch('recommendations.rag.ChatOllama') as mock_llm:
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
             mock_chain = MagicMock()
             mock_chain.invoke.return_value = "Recommended books: Fantasy Book, Mystery Book"
             mock_llm.return_value = mock_chain
@@ -155,7 +182,7 @@ class RAGRecommendationTestCase(TestCase):
         """Test that recommendations are cached"""
         Purchase.objects.create(user=self.user, book=self.book1)
         
-        with patch('recommendations.rag.ChatOllama') as mock_llm:
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
             mock_chain = MagicMock()
             mock_chain.invoke.return_value = "Cached recommendations"
             mock_llm.return_value = mock_chain
@@ -194,7 +221,7 @@ class RAGRecommendationTestCase(TestCase):
         Purchase.objects.create(user=self.user, book=self.book1)
         
         # Mock LLM to raise an exception
-        with patch('recommendations.rag.ChatOllama') as mock_llm:
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
             mock_llm.side_effect = Exception("LLM connection failed")
             
             result = get_recommendations(self.user.id, top_k=2)
@@ -218,6 +245,9 @@ class RAGEdgeCasesTestCase(TestCase):
     
     def setUp(self):
         """Set up test data"""
+        # Clients are pooled per process; start from a fresh gateway so ChatOllama mocks apply
+        llm_gateway.reset()
+        self.addCleanup(llm_gateway.reset)
         self.user = User.objects.create_user(
             username='edgeuser',
             email='edge@example.com',
@@ -265,7 +295,7 @@ class RAGEdgeCasesTestCase(TestCase):
         Purchase.objects.create(user=self.user, book=book)
         Purchase.objects.create(user=self.user, book=book)
         
-        with patch('recommendations.rag.ChatOllama') as mock_llm:
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
             mock_chain = MagicMock()
             mock_chain.invoke.return_value = "Recommendations"
             mock_llm.return_value = mock_chain
@@ -274,3 +304,1072 @@ class RAGEdgeCasesTestCase(TestCase):
             
             # Should handle duplicate purchases
             self.assertIsInstance(result, str)
+
+
+class VectorRepresentationTestCase(TestCase):
+    """Test reduced-precision embedding storage and search"""
+    
+    def setUp(self):
+        """Set up books along distinct directions"""
+        rng = np.random.default_rng(42)
+        self.query = rng.standard_normal(384)
+        self.nearest = Book.objects.create(
+            title='Nearest',
+            author='Author',
+            embedding=(self.query + rng.normal(0, 0.01, 384)).tolist()
+        )
+        for i in range(5):
+            Book.objects.create(
+                title=f'Other {i}',
+                author='Author',
+                embedding=rng.standard_normal(384).tolist()
+            )
+    
+    def test_quantized_copies_saved(self):
+        """Test half and binary copies are derived from the embedding on save"""
+        stored = self.nearest.embeddings.get()
+        
+        self.assertEqual(len(stored.embedding_half.to_list()), 384)
+        self.assertEqual(len(stored.embedding_binary), 384)
+        expected_bits = ''.join('1' if x > 0 else '0' for x in self.nearest.embedding)
+        self.assertEqual(stored.embedding_binary, expected_bits)
+    
+    def test_quantized_copies_follow_update_fields(self):
+        """Test saving only the embedding also refreshes the quantized copies"""
+        self.nearest.embedding = (-self.query).tolist()
+        self.nearest.save(update_fields=['embedding'])
+        stored = self.nearest.embeddings.get()
+        
+        self.assertEqual(stored.embedding_binary[0], '1' if -self.query[0] > 0 else '0')
+    
+    def test_book_without_embedding(self):
+        """Test books without embeddings have no stored vectors"""
+        book = Book.objects.create(title='Empty', author='Author')
+        
+        self.assertFalse(book.embeddings.exists())
+    
+    def test_each_representation_finds_nearest(self):
+        """Test full, half and binary search agree on a clear nearest neighbour"""
+        for representation in ('full', 'half', 'binary'):
+            books = search_similar_books(Book.objects.all(), self.query, 3, representation)
+            
+            self.assertEqual(books[0], self.nearest, representation)
+            self.assertEqual(len(books), 3)
+    
+    def test_unknown_representation(self):
+        """Test an unknown representation is rejected"""
+        with self.assertRaises(ValueError):
+            search_similar_books(Book.objects.all(), self.query, 3, 'int8')
+
+
+class MMRDiversificationTestCase(TestCase):
+    """Test maximal-marginal-relevance re-ranking"""
+    
+    def setUp(self):
+        """Set up two near-duplicate editions and a distinct but relevant book"""
+        rng = np.random.default_rng(7)
+        self.query = rng.standard_normal(384)
+        other = rng.standard_normal(384)
+        self.first_edition = Book.objects.create(
+            title='First Edition',
+            author='Author',
+            embedding=(self.query + rng.normal(0, 0.01, 384)).tolist()
+        )
+        self.second_edition = Book.objects.create(
+            title='Second Edition',
+            author='Author',
+            embedding=(self.query + rng.normal(0, 0.01, 384)).tolist()
+        )
+        self.distinct = Book.objects.create(
+            title='Distinct',
+            author='Author',
+            embedding=(self.query + other).tolist()
+        )
+    
+    def test_mmr_rerank_skips_near_duplicates(self):
+        """Test MMR prefers a distinct candidate over a near-duplicate of a selected one"""
+        a = np.array([1.0, 0.0, 0.0])
+        candidates = [a, a + [0.0, 0.01, 0.0], [0.6, 0.8, 0.0]]
+        
+        self.assertEqual(mmr_rerank(a, candidates, 2, lambda_mult=1.0), [0, 1])
+        self.assertEqual(mmr_rerank(a, candidates, 2, lambda_mult=0.3), [0, 2])
+    
+    def test_mmr_rerank_edge_cases(self):
+        """Test MMR with an empty pool or top_k larger than the pool"""
+        self.assertEqual(mmr_rerank([1.0, 0.0], [], 3, 0.5), [])
+        self.assertEqual(sorted(mmr_rerank([1.0, 0.0], [[1.0, 0.0], [0.0, 1.0]], 5, 0.5)), [0, 1])
+    
+    def test_search_diverse_books(self):
+        """Test diversified search keeps one edition and surfaces the distinct book"""
+        plain = search_similar_books(Book.objects.all(), self.query, 2)
+        diverse = search_diverse_books(Book.objects.all(), self.query, 2, lambda_mult=0.5)
+        
+        self.assertEqual(set(plain), {self.first_edition, self.second_edition})
+        self.assertEqual(len(diverse), 2)
+        self.assertIn(self.distinct, diverse)
+        self.assertTrue(all(hasattr(book, 'distance') for book in diverse))
+    
+    def test_lambda_one_is_plain_search(self):
+        """Test lambda 1.0 returns the plain nearest neighbours"""
+        books = search_diverse_books(Book.objects.all(), self.query, 2, lambda_mult=1.0)
+        
+        self.assertEqual(set(books), {self.first_edition, self.second_edition})
+
+
+class ContextBuilderTestCase(TestCase):
+    """Test the token-budgeted prompt context"""
+    
+    def setUp(self):
+        """Set up books with short and very long descriptions"""
+        self.addCleanup(cache.clear)
+        self.long_description = ' '.join(f'Sentence number {i} about the plot.' for i in range(200))
+        self.long_book = Book.objects.create(title='Long', author='Author', description=self.long_description)
+        self.short_book = Book.objects.create(title='Short', description='Brief.')
+    
+    def test_short_text_unchanged(self):
+        """Test text within budget is returned as is"""
+        self.assertEqual(trim_to_sentences('One. Two.', 50), 'One. Two.')
+    
+    def test_trim_at_sentence_boundary(self):
+        """Test long text is cut after a whole sentence within budget"""
+        trimmed = trim_to_sentences(self.long_description, 30)
+        
+        self.assertLessEqual(estimate_tokens(trimmed), 30)
+        self.assertTrue(trimmed.endswith('plot.'))
+    
+    def test_trim_single_long_sentence(self):
+        """Test a single over-budget sentence is cut at a word boundary"""
+        trimmed = trim_to_sentences('word ' * 100, 10)
+        
+        self.assertTrue(trimmed.endswith('…'))
+        self.assertLessEqual(estimate_tokens(trimmed), 10)
+    
+    def test_context_respects_budgets(self):
+        """Test each book and the whole context stay within budget"""
+        context = build_context([self.long_book, self.short_book], book_tokens=40, total_tokens=200)
+        
+        self.assertLess(len(context), len(self.long_description))
+        self.assertLessEqual(estimate_tokens(context), 200)
+        self.assertIn('Author: Unknown Author', context)
+        self.assertIn('Description: Brief.', context)
+    
+    def test_total_budget_drops_lowest_ranked(self):
+        """Test books past the total budget are left out, but never the first"""
+        context = build_context([self.long_book, self.short_book], book_tokens=40, total_tokens=10)
+        
+        self.assertIn('Title: Long', context)
+        self.assertNotIn('Title: Short', context)
+    
+    def test_summaries_cached_until_book_changes(self):
+        """Test trimmed summaries are cached and refreshed when the book is saved"""
+        get_book_summaries([self.short_book], 40)
+        with patch('recommendations.context.trim_to_sentences') as mock_trim:
+            get_book_summaries([self.short_book], 40)
+            mock_trim.assert_not_called()
+        
+        self.short_book.description = 'Rewritten.'
+        self.short_book.save()
+        self.assertEqual(get_book_summaries([self.short_book], 40)[self.short_book.id], 'Rewritten.')
+
+
+class LLMGatewayTestCase(TestCase):
+    """Test the pooled LLM gateway"""
+    
+    def setUp(self):
+        """Start from an empty gateway"""
+        llm_gateway.reset()
+        self.addCleanup(llm_gateway.reset)
+    
+    def test_client_reused(self):
+        """Test one client is created per model and temperature"""
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            first = llm_gateway.get_client('llama3.1:8b', 0.7)
+            second = llm_gateway.get_client('llama3.1:8b', 0.7)
+            llm_gateway.get_client('llama3.1:8b')
+        
+        self.assertIs(first, second)
+        self.assertEqual(mock_llm.call_count, 2)
+        self.assertIn('keep_alive', mock_llm.call_args.kwargs)
+        self.assertIn('limits', mock_llm.call_args.kwargs['client_kwargs'])
+    
+    def test_constant_prefix_first(self):
+        """Test the shared system prefix comes first and variable data last"""
+        prompt = build_prompt("Fixed instructions.\n\n{context}")
+        
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            mock_llm.return_value.invoke.return_value = "<ul></ul>"
+            result = llm_gateway.generate(prompt, {"context": "Title: A"})
+        
+        messages = mock_llm.return_value.invoke.call_args.args[0]
+        self.assertEqual(result, "<ul></ul>")
+        self.assertEqual(messages[0].content, SYSTEM_PREFIX)
+        self.assertTrue(messages[1].content.startswith("Fixed instructions."))
+        self.assertTrue(messages[1].content.endswith("Title: A"))
+
+
+class LLMReplayTestCase(TestCase):
+    """Test recording and replaying LLM answers"""
+    
+    def setUp(self):
+        """Set up a temporary response store and a book to recommend from"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'responses.jsonl')
+        llm_gateway.reset()
+        self.addCleanup(llm_gateway.reset)
+        cache.clear()
+        self.prompt = build_prompt("Recommend from:\n\n{context}")
+        self.book = Book.objects.create(
+            title='Replay Book',
+            author='Replay Author',
+            description='A recorded novel',
+            embedding=np.random.rand(384).tolist()
+        )
+        Book.objects.create(
+            title='Other Book',
+            author='Other Author',
+            description='Another novel',
+            embedding=np.random.rand(384).tolist()
+        )
+    
+    def use_mode(self, mode):
+        """Switch the gateway to a replay mode backed by the temporary store"""
+        override = override_settings(RAG_LLM_REPLAY_MODE=mode, RAG_LLM_REPLAY_PATH=self.path)
+        override.enable()
+        self.addCleanup(override.disable)
+        llm_gateway.reset()
+    
+    def test_record_then_replay(self):
+        """Test recorded answers are replayed without calling the model"""
+        self.use_mode('record')
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            mock_llm.return_value.invoke.return_value = "<ul><li>A</li></ul>"
+            recorded = llm_gateway.generate(self.prompt, {"context": "Title: A"})
+        
+        self.use_mode('replay')
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            replayed = llm_gateway.generate(self.prompt, {"context": "Title: A"})
+        
+        self.assertEqual(replayed, recorded)
+        mock_llm.assert_not_called()
+        with open(self.path) as store:
+            self.assertEqual(len(store.readlines()), 1)
+    
+    def test_replay_ignores_routing_choice(self):
+        """Test a recording is replayed whichever model the router would pick now"""
+        self.use_mode('record')
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            mock_llm.return_value.invoke.return_value = "<ul><li>A</li></ul>"
+            recorded = llm_gateway.generate(self.prompt, {"context": "Title: A"}, latency_budget=1.0)
+        
+        self.use_mode('replay')
+        with patch.object(llm_gateway.router, 'choose', return_value='another-model'):
+            replayed = llm_gateway.generate(self.prompt, {"context": "Title: A"}, latency_budget=1.0)
+        
+        self.assertEqual(replayed, recorded)
+    
+    def test_replay_miss(self):
+        """Test replay mode fails on an unrecorded prompt instead of calling the model"""
+        self.use_mode('replay')
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            with self.assertRaises(ReplayMissError):
+                llm_gateway.generate(self.prompt, {"context": "Title: B"})
+        
+        mock_llm.assert_not_called()
+    
+    def test_store_reloads_from_disk(self):
+        """Test a new store sees answers recorded by another process"""
+        ResponseStore(self.path).put('key', 'llama3.1:8b', '<ul></ul>')
+        
+        self.assertEqual(ResponseStore(self.path).replay('key'), '<ul></ul>')
+        self.assertIsNone(ResponseStore(self.path).get('missing'))
+    
+    def test_unknown_mode(self):
+        """Test an unknown replay mode is rejected"""
+        self.use_mode('rewind')
+        with self.assertRaises(ValueError):
+            llm_gateway.generate(self.prompt, {"context": "Title: A"})
+    
+    def test_full_chain_replay(self):
+        """Test the RAG chain runs end to end from recorded answers"""
+        self.use_mode('record')
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            mock_llm.return_value.invoke.return_value = "<ul><li><strong>Other Book</strong></li></ul>"
+            recorded = get_recommendations_by_book_title('Replay Book', top_k=1)
+        
+        cache.clear()
+        self.use_mode('replay')
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            replayed = get_recommendations_by_book_title('Replay Book', top_k=1)
+        
+        self.assertEqual(replayed, recorded)
+        self.assertIn('Other Book', replayed)
+        mock_llm.assert_not_called()
+    
+    def test_full_chain_replay_miss_falls_back(self):
+        """Test a replay miss in the RAG chain serves the non-LLM fallback"""
+        histograms.reset()
+        self.addCleanup(histograms.reset)
+        self.use_mode('replay')
+        
+        result = get_recommendations_by_book_title('Replay Book', top_k=1)
+        
+        self.assertIn('Other Book', result)
+        self.assertEqual(histograms.fallbacks, {'replay_miss': 1})
+
+
+class StructuredOutputTestCase(TestCase):
+    """Test the structured (JSON) recommendation output"""
+    
+    def setUp(self):
+        """Set up a reference book and candidates"""
+        llm_gateway.reset()
+        self.addCleanup(llm_gateway.reset)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.reference = Book.objects.create(
+            title='Reference Book',
+            author='Jane Doe',
+            subjects='Madrid',
+            embedding=np.random.rand(384).tolist()
+        )
+        self.books = [
+            Book.objects.create(
+                title=f'Candidate {index}',
+                author='Jane Doe',
+                subjects='Madrid',
+                embedding=np.random.rand(384).tolist()
+            )
+            for index in range(3)
+        ]
+    
+    def reply_for(self, messages, **kwargs):
+        """Answer a structured prompt the way the model should"""
+        return fake_reply('\n'.join(message.content for message in messages), kwargs.get('format'))
+    
+    def test_parse_reasons(self):
+        """Test the LLM answer is validated and stray text is ignored"""
+        reasons = parse_reasons('```json\n{"items": [{"book_id": 7, "reason": "Fits."}]}\n```')
+        
+        self.assertEqual(reasons, {7: 'Fits.'})
+        with self.assertRaises(ValidationError):
+            parse_reasons('{"items": [{"book_id": "seven"}]}')
+    
+    def test_structured_payload(self):
+        """Test the payload carries ids, scores and reasons and asks Ollama for JSON"""
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            mock_llm.return_value.invoke.side_effect = self.reply_for
+            payload = get_recommendations_by_book_title('Reference Book', top_k=2, output='structured')
+        
+        self.assertEqual(len(payload['items']), 2)
+        for item in payload['items']:
+            self.assertIn(item['book_id'], [book.id for book in self.books])
+            self.assertTrue(0 <= item['score'] <= 1)
+            self.assertIn('fake Ollama server', item['reason'])
+        self.assertEqual(mock_llm.return_value.invoke.call_args.kwargs, {'format': 'json'})
+    
+    def test_reasons_cached_per_book(self):
+        """Test cached reasons are reused and only new books go to the LLM"""
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            mock_llm.return_value.invoke.side_effect = self.reply_for
+            first = get_recommendations_by_book_title('Reference Book', top_k=2, output='structured')
+            get_recommendations_by_book_title('Reference Book', top_k=3, output='structured')
+        
+        self.assertEqual(mock_llm.return_value.invoke.call_count, 2)
+        second_prompt = mock_llm.return_value.invoke.call_args.args[0][1].content
+        for item in first['items']:
+            self.assertNotIn(f"Book id: {item['book_id']}\n", second_prompt)
+    
+    def test_llm_failure_uses_template_reasons(self):
+        """Test unavailable or invalid LLM answers fall back to uncached template reasons"""
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            mock_llm.return_value.invoke.return_value = 'not json'
+            payload, complete = build_payload(
+                self.books, 'book:test', SIMILAR_BOOK_REASONS_PROMPT, {'book_title': 'Reference Book'},
+                merge_features([self.reference])
+            )
+            build_payload(self.books, 'book:test', SIMILAR_BOOK_REASONS_PROMPT, {'book_title': 'Reference Book'})
+        
+        self.assertFalse(complete)
+        self.assertEqual(mock_llm.return_value.invoke.call_count, 2)
+        self.assertTrue(payload['items'][0]['reason'].startswith('Another book by Jane Doe'))
+    
+    def test_template_mode(self):
+        """Test structured template mode never calls the LLM"""
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            payload = get_recommendations_by_book_title(
+                'Reference Book', top_k=2, mode='template', output='structured'
+            )
+        
+        mock_llm.assert_not_called()
+        self.assertEqual(len(payload['items']), 2)
+        self.assertIn('Madrid', payload['items'][0]['reason'])
+    
+    def test_api_output(self):
+        """Test the API returns structured payloads and validates the output format"""
+        response = self.client.post(
+            '/api/recommend/title/', {'title': 'Reference Book', 'mode': 'template', 'output': 'structured'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['items']), 3)
+        
+        response = self.client.post('/api/recommend/title/', {'title': 'Unknown', 'output': 'structured'})
+        self.assertEqual(response.json()['items'], [])
+        self.assertIn('Unknown', response.json()['message'])
+        
+        response = self.client.post('/api/recommend/title/', {'title': 'Reference Book', 'output': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CircuitBreakerTestCase(TestCase):
+    """Test the LLM circuit breaker and call deadline"""
+    
+    def setUp(self):
+        """Set up a breaker with a controllable clock"""
+        self.now = 0.0
+        self.breaker = CircuitBreaker(
+            failure_rate=0.5, slow_call_seconds=1.0, window=4, min_calls=4, reset_timeout=30.0,
+            clock=lambda: self.now
+        )
+        llm_gateway.reset()
+        self.addCleanup(llm_gateway.reset)
+    
+    def test_opens_on_failure_rate(self):
+        """Test the breaker opens once the failure rate is reached"""
+        for _ in range(2):
+            self.breaker.before_call()
+            self.breaker.record_success(0.1)
+        for _ in range(2):
+            self.breaker.before_call()
+            self.breaker.record_failure()
+        
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+    
+    def test_slow_calls_count_as_failures(self):
+        """Test calls over the latency threshold open the breaker"""
+        for _ in range(4):
+            self.breaker.before_call()
+            self.breaker.record_success(5.0)
+        
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+    
+    def test_half_open_probe(self):
+        """Test a single probe is allowed after the reset timeout and closes on success"""
+        for _ in range(4):
+            self.breaker.record_failure()
+        self.now = 31.0
+        
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        
+        self.breaker.record_success(0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_failed_probe_reopens(self):
+        """Test a failed probe opens the breaker again"""
+        for _ in range(4):
+            self.breaker.record_failure()
+        self.now = 31.0
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.opened_at, 31.0)
+    
+    def test_stale_calls_ignored_while_half_open(self):
+        """Test only the half-open probe decides, not calls that started before it"""
+        stale = [self.breaker.before_call() for _ in range(2)]
+        for _ in range(4):
+            self.breaker.record_failure(self.breaker.before_call())
+        self.now = 31.0
+        probe = self.breaker.before_call()
+        
+        self.breaker.record_success(0.1, stale[0])
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.breaker.record_failure(stale[1])
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        
+        self.breaker.record_success(0.1, probe)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_deadline(self):
+        """Test a slow model call is abandoned at the deadline"""
+        prompt = build_prompt("{context}")
+        
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            mock_llm.return_value.invoke.side_effect = lambda messages: time.sleep(0.5)
+            start = time.monotonic()
+            with self.assertRaises(LLMTimeoutError):
+                llm_gateway.generate(prompt, {"context": "x"}, deadline=0.05)
+        
+        self.assertLess(time.monotonic() - start, 0.4)
+    
+    def test_open_breaker_skips_llm(self):
+        """Test recommendations fall back without calling the model while the breaker is open"""
+        user = User.objects.create_user(username='breakeruser', password='pass')
+        book = Book.objects.create(title='Read', author='Author', embedding=np.random.rand(384).tolist())
+        Book.objects.create(title='Unread', author='Author', embedding=np.random.rand(384).tolist())
+        Purchase.objects.create(user=user, book=book)
+        for _ in range(4):
+            self.breaker.record_failure()
+        
+        with patch.object(llm_gateway, '_create_breaker', return_value=self.breaker), \
+                patch('recommendations.llm.ChatOllama') as mock_llm:
+            result = get_recommendations(user.id, top_k=1)
+        
+        mock_llm.assert_not_called()
+        self.assertIn('Based on your reading history', result)
+    
+    def test_breaker_per_model(self):
+        """Test failures of one model don't open the breaker of another"""
+        prompt = build_prompt("{context}")
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            mock_llm.return_value.invoke.side_effect = RuntimeError('model crashed')
+            for _ in range(5):
+                with self.assertRaises(RuntimeError):
+                    llm_gateway.generate(prompt, {"context": "x"}, model='large')
+        
+        self.assertEqual(llm_gateway.get_breaker('large').state, CircuitBreaker.OPEN)
+        self.assertEqual(llm_gateway.get_breaker('small').state, CircuitBreaker.CLOSED)
+
+
+class ModelRouterTestCase(TestCase):
+    """Test latency-aware model routing"""
+    
+    def setUp(self):
+        """Set up a fast and a large model"""
+        self.router = ModelRouter(['small', 'large'], window=10)
+        llm_gateway.reset()
+        self.addCleanup(llm_gateway.reset)
+    
+    def test_no_budget_uses_largest(self):
+        """Test requests without a budget go to the most capable model"""
+        self.router.record('large', 30.0)
+        
+        self.assertEqual(self.router.choose(), 'large')
+    
+    def test_budget_routes_by_p95(self):
+        """Test the most capable model whose p95 fits the budget is chosen"""
+        for _ in range(10):
+            self.router.record('small', 0.5)
+            self.router.record('large', 6.0)
+        
+        self.assertEqual(self.router.choose(3.0), 'small')
+        self.assertEqual(self.router.choose(10.0), 'large')
+        self.assertEqual(self.router.choose(0.1), 'small')
+        self.assertEqual(self.router.percentiles('small'), (0.5, 0.5))
+    
+    def test_unmeasured_model_is_tried(self):
+        """Test a model without measurements is given the chance"""
+        self.assertEqual(self.router.choose(1.0), 'large')
+        self.assertIsNone(self.router.stats()['large']['p95'])
+    
+    def test_window_is_rolling(self):
+        """Test old latencies drop out of the window"""
+        for _ in range(10):
+            self.router.record('large', 6.0)
+        for _ in range(10):
+            self.router.record('large', 1.0)
+        
+        self.assertEqual(self.router.choose(3.0), 'large')
+    
+    def test_gateway_records_and_routes(self):
+        """Test the gateway routes by budget and records call latency"""
+        llm_gateway.router = self.router
+        for _ in range(10):
+            self.router.record('large', 6.0)
+        
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            mock_llm.return_value.invoke.return_value = "<ul></ul>"
+            llm_gateway.generate(build_prompt("{context}"), {"context": "x"}, latency_budget=3.0)
+        
+        self.assertEqual(mock_llm.call_args.kwargs['model'], 'small')
+        self.assertEqual(self.router.stats()['small']['calls'], 1)
+
+
+class TemplateExplanationTestCase(TestCase):
+    """Test LLM-free template explanations"""
+    
+    def setUp(self):
+        """Set up a purchase history and related books"""
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='templateuser', password='pass')
+        base = np.random.default_rng(3).standard_normal(384)
+        self.read = Book.objects.create(
+            title='Read Book', author='Jane Doe', category='Novela', subjects='Historia, Guerra',
+            embedding=base.tolist()
+        )
+        self.same_author = Book.objects.create(
+            title='Same <Author>', author=' jane  doe', category='Ensayo', subjects='Cocina',
+            embedding=(base + 0.1).tolist()
+        )
+        self.same_subject = Book.objects.create(
+            title='Same Subject', author='Other', category='Novela', subjects='guerra, Mar',
+            embedding=(base - 0.1).tolist()
+        )
+        Purchase.objects.create(user=self.user, book=self.read)
+    
+    def test_extract_features(self):
+        """Test features are normalized"""
+        features = extract_features(self.same_author)
+        
+        self.assertEqual(features['author'], 'jane doe')
+        self.assertEqual(features['subjects'], {'cocina': 'Cocina'})
+    
+    def test_explain_shared_features(self):
+        """Test reasons name the shared author, subjects and similarity"""
+        reference = merge_features([self.read])
+        self.same_subject.distance = 0.2
+        
+        self.assertIn('Another book by jane doe', explain(self.same_author, reference))
+        reason = explain(self.same_subject, reference)
+        self.assertIn('themes guerra', reason)
+        self.assertIn('also in Novela', reason)
+        self.assertIn('80% match', reason)
+    
+    def test_render_escapes_html(self):
+        """Test the list follows the <ul><li> contract and escapes book data"""
+        html = render_explanations([self.same_author])
+        
+        self.assertTrue(html.startswith('<ul><li><strong>Same &lt;Author&gt;</strong> by '))
+        self.assertTrue(html.endswith('</li></ul>'))
+    
+    def test_template_mode_skips_llm(self):
+        """Test template mode answers without calling the LLM"""
+        with patch('recommendations.llm.ChatOllama') as mock_llm:
+            result = get_recommendations(self.user.id, top_k=2, mode='template')
+            by_title = get_recommendations_by_book_title('Read Book', top_k=2, mode='template')
+        
+        mock_llm.assert_not_called()
+        self.assertIn('<strong>Same Subject</strong>', result)
+        self.assertNotIn('Read Book', result)
+        self.assertIn('author you already enjoyed', by_title)
+    
+    def test_embed_books_stores_features(self):
+        """Test embed_books precomputes explanation features"""
+        encoder = MagicMock()
+        encoder.encode.side_effect = lambda texts: np.random.rand(len(texts), 384)
+        with patch('recommendations.management.commands.embed_books.load_sentence_transformer', return_value=encoder):
+            call_command('embed_books', '--force', stdout=StringIO())
+        
+        self.same_subject.refresh_from_db()
+        self.assertEqual(self.same_subject.explanation_features['subjects'], {'guerra': 'guerra', 'mar': 'Mar'})
+    
+    def test_save_refreshes_features(self):
+        """Test a save touching the source fields recomputes the features"""
+        self.same_subject.subjects = 'Cocina'
+        self.same_subject.save(update_fields=['subjects'])
+        
+        self.same_subject.refresh_from_db()
+        self.assertEqual(self.same_subject.explanation_features['subjects'], {'cocina': 'Cocina'})
+    
+    def test_backfill_leaves_book_table_alone(self):
+        """Test backfilling a pending version writes no features to the book table"""
+        Book.objects.update(explanation_features=None)
+        new_model = register_embedding_model('tiny-model', dimensions=8)
+        encoder = MagicMock()
+        encoder.encode.side_effect = lambda texts: np.random.rand(len(texts), 8)
+        with patch('recommendations.management.commands.embed_books.load_sentence_transformer', return_value=encoder):
+            call_command('embed_books', '--model-id', str(new_model.id), stdout=StringIO())
+        
+        self.assertFalse(Book.objects.filter(explanation_features__isnull=False).exists())
+    
+    def test_unknown_mode(self):
+        """Test an unknown mode is reported as a friendly message, not raised"""
+        result = get_recommendations(self.user.id, mode='poetry')
+        
+        self.assertIn("We're having trouble", result)
+    
+    def test_missing_active_model(self):
+        """Test every entry point degrades to its message when no model is active"""
+        with patch('recommendations.rag.get_active_embedding_model', side_effect=EmbeddingModel.DoesNotExist):
+            self.assertIn("We're having trouble", get_recommendations(self.user.id))
+            self.assertIn("We're having trouble", get_recommendations_by_book_title('Anything'))
+            self.assertIn("We're having trouble", get_recommendations_by_query('anything'))
+
+
+class FakeOllamaTestCase(TestCase):
+    """Test the RAG stack end to end over HTTP against the fake Ollama server"""
+    
+    def setUp(self):
+        """Set up a purchase history and a fresh gateway"""
+        llm_gateway.reset()
+        self.addCleanup(llm_gateway.reset)
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='fakeollamauser', password='pass')
+        read = Book.objects.create(title='Read', author='Author', embedding=np.random.rand(384).tolist())
+        Book.objects.create(title='Unread', author='Writer', embedding=np.random.rand(384).tolist())
+        Purchase.objects.create(user=self.user, book=read)
+    
+    def recommend(self, server, **kwargs):
+        with override_settings(OLLAMA_BASE_URL=server.url):
+            return get_recommendations(self.user.id, top_k=1, **kwargs)
+    
+    def test_streamed_chat(self):
+        """Test a recommendation generated over the real client and HTTP path"""
+        with FakeOllamaServer(tokens_per_second=1000) as server:
+            result = self.recommend(server)
+        
+        self.assertEqual(result, '<ul><li><strong>Unread</strong> by Writer - Recommended by the fake Ollama server.</li></ul>')
+        path, body = server.requests[0]
+        self.assertEqual(path, '/api/chat')
+        self.assertEqual(body['keep_alive'], '30m')
+        self.assertEqual(body['messages'][0]['role'], 'system')
+    
+    def test_server_error_falls_back(self):
+        """Test HTTP errors from the model host fall back to the plain list"""
+        with FakeOllamaServer(error_rate=1.0) as server:
+            result = self.recommend(server)
+        
+        self.assertIn('Based on your reading history', result)
+    
+    def test_slow_first_token_hits_deadline(self):
+        """Test a slow time-to-first-token is cut off by the deadline"""
+        with FakeOllamaServer(ttft=1.0) as server:
+            start = time.monotonic()
+            result = self.recommend(server, deadline=0.2)
+            elapsed = time.monotonic() - start
+        
+        self.assertIn('Based on your reading history', result)
+        self.assertLess(elapsed, 1.0)
+    
+    def test_tags_and_version(self):
+        """Test the metadata endpoints used by clients"""
+        with FakeOllamaServer() as server:
+            client = ollama.Client(host=server.url)
+            self.assertEqual(client.list().models[0].model, 'fake-llama:latest')
+            self.assertIn('Fake Book', client.generate(model='any', prompt='hello', stream=False).response)
+
+
+class EmbeddingVersioningTestCase(TestCase):
+    """Test the embedding model registry and versioned side table"""
+    
+    def setUp(self):
+        """Set up a book embedded with the legacy model"""
+        # The active version is cached; don't leak a flipped version into other tests
+        self.addCleanup(cache.clear)
+        self.legacy_model = EmbeddingModel.objects.get(status=EmbeddingModel.ACTIVE)
+        self.book = Book.objects.create(
+            title='Versioned Book',
+            author='Author',
+            embedding=np.random.rand(384).tolist()
+        )
+    
+    def test_legacy_model_is_active(self):
+        """Test the migration registers the built-in model as active version 1"""
+        self.assertEqual(self.legacy_model.name, 'all-MiniLM-L6-v2')
+        self.assertEqual(self.legacy_model.version, 1)
+        self.assertEqual(self.legacy_model.dimensions, 384)
+        self.assertEqual(get_active_embedding_model(), self.legacy_model)
+    
+    def test_book_embedding_mirrored(self):
+        """Test Book.embedding is dual-written into the side table"""
+        stored = BookEmbedding.objects.get(book=self.book, model=self.legacy_model)
+        
+        self.assertTrue(np.allclose(stored.embedding, self.book.embedding))
+        self.assertIsNotNone(stored.embedding_half)
+        
+        self.book.embedding = None
+        self.book.save()
+        self.assertFalse(BookEmbedding.objects.filter(book=self.book).exists())
+    
+    def test_unchanged_embedding_not_mirrored(self):
+        """Test saving a book without touching its embedding skips the side table"""
+        book = Book.objects.get(pk=self.book.pk)
+        book.title = 'Retitled'
+        
+        with self.assertNumQueries(1):
+            book.save()
+        
+        book.embedding = np.random.rand(384).tolist()
+        book.save()
+        stored = BookEmbedding.objects.get(book=book, model=self.legacy_model)
+        self.assertTrue(np.allclose(stored.embedding, book.embedding))
+    
+    def test_register_new_version(self):
+        """Test registering bumps the version and starts as pending"""
+        new_model = register_embedding_model('all-MiniLM-L6-v2', dimensions=384)
+        
+        self.assertEqual(new_model.version, 2)
+        self.assertEqual(new_model.status, EmbeddingModel.PENDING)
+        self.assertEqual(get_active_embedding_model(), self.legacy_model)
+    
+    def test_activate_flips_served_version(self):
+        """Test activation retires the old version and search switches to the new vectors"""
+        new_model = register_embedding_model('tiny-model', dimensions=8)
+        other = Book.objects.create(title='Other Book', author='Author')
+        query = np.ones(8)
+        BookEmbedding.objects.bulk_upsert([
+            BookEmbedding(book=self.book, model=new_model, embedding=-query),
+            BookEmbedding(book=other, model=new_model, embedding=query),
+        ])
+        
+        activate_embedding_model(new_model)
+        
+        self.legacy_model.refresh_from_db()
+        self.assertEqual(self.legacy_model.status, EmbeddingModel.RETIRED)
+        self.assertEqual(get_active_embedding_model(), new_model)
+        self.assertEqual(EmbeddingModel.objects.filter(status=EmbeddingModel.ACTIVE).count(), 1)
+        for representation in ('full', 'half', 'binary'):
+            books = search_similar_books(Book.objects.all(), query, 2, representation)
+            self.assertEqual(books[0], other, representation)
+    
+    def test_embed_books_dual_writes_pending_version(self):
+        """Test embed_books fills the active and pending versions"""
+        new_model = register_embedding_model('tiny-model', dimensions=8)
+        encoder = MagicMock()
+        encoder.encode.side_effect = lambda texts: np.random.rand(len(texts), 8)
+        
+        with patch('recommendations.management.commands.embed_books.load_sentence_transformer', return_value=encoder):
+            call_command('embed_books', '--model-id', str(new_model.id), stdout=StringIO())
+        
+        self.assertTrue(BookEmbedding.objects.filter(book=self.book, model=new_model).exists())
+        # Legacy vectors are left untouched by a backfill of another version
+        self.assertTrue(BookEmbedding.objects.filter(book=self.book, model=self.legacy_model).exists())
+
+
+class EmbeddingExportImportTestCase(TestCase):
+    """Test binary export/import of the embedding corpus"""
+    
+    def setUp(self):
+        """Set up embedded books and a dump path"""
+        self.books = [
+            Book.objects.create(title=f'Dump Book {i}', author='Author', embedding=np.random.rand(384).tolist())
+            for i in range(3)
+        ]
+        Book.objects.create(title='Not Embedded', author='Author')
+        handle, self.path = tempfile.mkstemp(suffix='.azemb')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+    
+    def test_round_trip(self):
+        """Test vectors survive export, wipe and import unchanged"""
+        originals = {b.id: np.array(b.embedding) for b in self.books}
+        updated_at = {b.id: b.updated_at for b in self.books}
+        
+        call_command('export_embeddings', self.path, '--chunk-size', '2', stdout=StringIO())
+        BookEmbedding.objects.all().delete()
+        Book.objects.update(embedding=None)
+        call_command('import_embeddings', self.path, stdout=StringIO())
+        
+        restored = BookEmbedding.objects.filter(book__in=self.books)
+        self.assertEqual(restored.count(), 3)
+        for stored in restored:
+            self.assertTrue(np.allclose(stored.embedding, originals[stored.book_id]))
+            self.assertIsNotNone(stored.embedding_half)
+            self.assertEqual(len(stored.embedding_binary), 384)
+        # The legacy version also restores the Book.embedding mirror
+        for book in self.books:
+            book.refresh_from_db()
+            self.assertTrue(np.allclose(book.embedding, originals[book.id]))
+            # ...and moves updated_at, so API validators change with the vectors
+            self.assertNotEqual(book.updated_at, updated_at[book.id])
+    
+    def test_import_skips_unknown_books(self):
+        """Test ids missing from the target database are skipped"""
+        call_command('export_embeddings', self.path, stdout=StringIO())
+        self.books[0].delete()
+        
+        out = StringIO()
+        call_command('import_embeddings', self.path, stdout=out)
+        
+        self.assertIn('Imported 2 of 3', out.getvalue())
+    
+    def test_dimension_mismatch_rejected(self):
+        """Test importing into a version with other dimensions fails"""
+        call_command('export_embeddings', self.path, stdout=StringIO())
+        other = EmbeddingModel.objects.create(name='tiny-model', dimensions=8, version=1)
+        
+        with self.assertRaises(CommandError):
+            call_command('import_embeddings', self.path, '--model-id', str(other.id), stdout=StringIO())
+
+
+class BenchmarkCommandTestCase(TestCase):
+    """Test the recommendation benchmark command"""
+    
+    def setUp(self):
+        """Set up an output path"""
+        self.addCleanup(llm_gateway.reset)
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+    
+    def test_benchmark_writes_results_and_rolls_back(self):
+        """Test per-stage timings are written as JSON and the synthetic data is discarded"""
+        call_command(
+            'benchmark_recommendations', '--sizes', '30', '--users', '3', '--queries', '2',
+            '--fake-encoder', '--output', self.path, stdout=StringIO()
+        )
+        
+        with open(self.path) as results_file:
+            results = json.load(results_file)
+        entry_points = results['results'][0]['entry_points']
+        self.assertEqual(results['results'][0]['catalog_size'], 30)
+        self.assertEqual(set(entry_points), {'history', 'title', 'query'})
+        self.assertEqual(entry_points['query']['generation']['count'], 2)
+        self.assertEqual(Book.objects.count(), 0)
+        self.assertEqual(Purchase.objects.count(), 0)
+
+
+class InstrumentationTestCase(TestCase):
+    """Test per-stage timing of recommendation requests"""
+    
+    def setUp(self):
+        """Set up a purchase history"""
+        llm_gateway.reset()
+        histograms.reset()
+        self.addCleanup(llm_gateway.reset)
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='timeduser', password='pass')
+        read = Book.objects.create(title='Read', author='Author', embedding=np.random.rand(384).tolist())
+        Book.objects.create(title='Unread', author='Writer', embedding=np.random.rand(384).tolist())
+        Purchase.objects.create(user=self.user, book=read)
+    
+    def test_server_timing_header(self):
+        """Test the API response carries the stage timings"""
+        with FakeOllamaServer(ttft=0.01) as server, override_settings(OLLAMA_BASE_URL=server.url):
+            response = self.client.post('/api/recommend/user/', {'user_id': self.user.id, 'top_k': 1})
+        
+        timing = response['Server-Timing']
+        for stage in ('cache_lookup', 'user_validation', 'purchase_fetch', 'vector_search', 'context_build',
+                      'llm_total', 'llm_ttft'):
+            self.assertIn(f'{stage};', timing)
+        self.assertIn('cache;desc="miss"', timing)
+    
+    def test_fallback_reason(self):
+        """Test fallbacks are tagged with their reason"""
+        with FakeOllamaServer(error_rate=1.0) as server, override_settings(OLLAMA_BASE_URL=server.url):
+            response = self.client.post('/api/recommend/user/', {'user_id': self.user.id, 'top_k': 1})
+        
+        self.assertIn('fallback;desc="llm_error"', response['Server-Timing'])
+        self.assertEqual(histograms.fallbacks, {'llm_error': 1})
+    
+    def test_no_header_without_spans(self):
+        """Test unrelated responses get no Server-Timing header"""
+        response = self.client.get('/recommendations/metrics/')
+        
+        self.assertFalse(response.has_header('Server-Timing'))
+    
+    def test_metrics_endpoint(self):
+        """Test histograms are exposed to staff in Prometheus format"""
+        get_recommendations(self.user.id, top_k=1, mode='template')
+        
+        self.assertEqual(self.client.get('/recommendations/metrics/').status_code, 403)
+        User.objects.create_user(username='staff', password='pass', is_staff=True)
+        self.client.login(username='staff', password='pass')
+        body = self.client.get('/recommendations/metrics/').content.decode()
+        
+        self.assertIn('rag_stage_duration_seconds_count{stage="vector_search"} 1', body)
+        self.assertIn('rag_stage_duration_seconds_bucket{stage="vector_search",le="+Inf"} 1', body)
+    
+    @override_settings(RAG_METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        """Test scrapers authenticate with the bearer token"""
+        self.assertEqual(self.client.get('/recommendations/metrics/').status_code, 403)
+        response = self.client.get('/recommendations/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        
+        self.assertEqual(response.status_code, 200)
+
+
+class EvaluateRecommendationsTestCase(TestCase):
+    """Test the offline evaluation command"""
+    
+    def setUp(self):
+        """Set up two users whose held-out purchase is close to their history"""
+        rng = np.random.default_rng(11)
+        cluster, other = rng.standard_normal(384), rng.standard_normal(384)
+        self.cluster = [
+            Book.objects.create(title=f'Cluster {i}', author='Author', embedding=(cluster + rng.normal(0, 0.05, 384)).tolist())
+            for i in range(3)
+        ]
+        for i in range(5):
+            Book.objects.create(title=f'Other {i}', author='Author', embedding=(other + rng.normal(0, 0.5, 384)).tolist())
+        first = User.objects.create_user(username='evaluser1', password='pass')
+        second = User.objects.create_user(username='evaluser2', password='pass')
+        for user, books in ((first, self.cluster), (second, [self.cluster[0], self.cluster[2]])):
+            for book in books:
+                Purchase.objects.create(user=user, book=book)
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+    
+    def test_report(self):
+        """Test every strategy is scored on quality, latency and memory"""
+        call_command('evaluate_recommendations', '--k', '2', '--output', self.path, stdout=StringIO())
+        
+        with open(self.path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(report['users'], 2)
+        self.assertEqual(set(report['strategies']), {'exact', 'ann', 'in_memory', 'hybrid', 'collaborative'})
+        for strategy in ('exact', 'in_memory', 'hybrid'):
+            self.assertEqual(report['strategies'][strategy]['recall'], 1.0, strategy)
+        for result in report['strategies'].values():
+            self.assertTrue(0 <= result['ndcg'] <= 1)
+            self.assertGreaterEqual(result['p95_ms'], result['p50_ms'])
+            self.assertGreater(result['peak_memory_mb'], 0)
+    
+    def test_no_eligible_users(self):
+        """Test the command fails clearly without held-out data"""
+        Purchase.objects.all().delete()
+        
+        with self.assertRaises(CommandError):
+            call_command('evaluate_recommendations', stdout=StringIO())
+
+
+class BookAPIConditionalGetTestCase(TestCase):
+    """Test ETag / Last-Modified handling of the book API"""
+    
+    def setUp(self):
+        """Set up books"""
+        self.book = Book.objects.create(title='Rayuela', author='Julio Cortázar')
+        Book.objects.create(title='Ficciones', author='Jorge Luis Borges')
+    
+    def test_detail_not_modified(self):
+        """Test a current ETag gets 304 from a single query"""
+        response = self.client.get(f'/api/books/{self.book.id}/')
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('Last-Modified', response)
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/books/{self.book.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+    
+    def test_detail_modified(self):
+        """Test saving a book changes its ETag"""
+        etag = self.client.get(f'/api/books/{self.book.id}/')['ETag']
+        self.book.title = 'Rayuela (edición crítica)'
+        self.book.save()
+        
+        response = self.client.get(f'/api/books/{self.book.id}/', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_list_validators(self):
+        """Test the list ETag is current until a book is added or deleted"""
+        etag = self.client.get('/api/books/')['ETag']
+        
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/books/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        Book.objects.filter(pk=self.book.pk).delete()
+        self.assertEqual(self.client.get('/api/books/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_missing_book(self):
+        """Test an unknown book is still a 404 without validators"""
+        response = self.client.get('/api/books/0/')
+        
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+    
+    def test_non_numeric_id(self):
+        """Test a malformed id is a 404, not a server error"""
+        response = self.client.get('/api/books/abc/')
+        
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import recommend_books
+from .views import recommend_books, metrics
 
 urlpatterns = [
     path('recommend/', recommend_books, name='recommend'),
+    path('metrics/', metrics, name='rag_metrics'),
 ]
\ No newline at end of file
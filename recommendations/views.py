@@ -1,8 +1,25 @@
+from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
 from .rag import get_recommendations
+from .instrumentation import histograms
 
 @login_required
 def recommend_books(request):
-    recommendation = get_recommendations(request.user.id)
-    return render(request, 'recommendations/recommend.html', {'recommendation': recommendation})
\ No newline at end of file
+    recommendation = get_recommendations(request.user.id, latency_budget=settings.RAG_INTERACTIVE_LATENCY_BUDGET)
+    return render(request, 'recommendations/recommend.html', {'recommendation': recommendation})
+
+
+def metrics(request):
+    """Per-stage latency histograms of recommendation requests, in Prometheus text format."""
+    token = settings.RAG_METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if token:
+        allowed = constant_time_compare(authorization, f'Bearer {token}')
+    else:
+        allowed = request.user.is_staff
+    if not allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(histograms.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -52,7 +52,12 @@ class ProductAdmin(admin.ModelAdmin):
         ('Book Details', {
             'fields': ('isbn', 'reference', 'publisher', 'year', 'edition_place', 'pages', 'measures', 'dimensions'),
         }),
+        # Parsed from the fields above on every save (store/parsing.py)
+        ('Parsed Values', {
+            'fields': ('publication_year', 'page_count', 'height_cm', 'width_cm', 'thickness_cm'),
+        }),
     )
+    readonly_fields = ('publication_year', 'page_count', 'height_cm', 'width_cm', 'thickness_cm')
 
     @admin.action(description="Fetch dimensions from Google Books API")
     def fetch_dimensions_from_google_books(self, request, queryset):
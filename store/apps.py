@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class StoreConfig(AppConfig):
     name = 'store'
+
+    def ready(self):
+        # Keep the autocomplete index and the cached listings in step with product changes
+        from . import autocomplete, fragments  # noqa: F401
@@ -0,0 +1,234 @@
+"""
+In-memory prefix index for search-box autocomplete.
+
+Every worker process keeps a sorted list of normalized keys (lower case, no
+accents) with the product names (from each of their first words), publishers,
+ISBNs and references. A lookup is a binary search for the prefix followed by a
+short forward scan, so suggestions cost microseconds and never touch the
+database.
+
+The index is built on first use and kept current by the Product save/delete
+signals. Those only fire in the process that made the change, so each process
+also rebuilds its index once it is older than
+settings.STORE_AUTOCOMPLETE_REFRESH_SECONDS. That rebuild runs in a background
+thread, one at a time, while lookups keep using the current index.
+"""
+import logging
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+from functools import lru_cache
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.urls import reverse
+from urllib.parse import urlencode
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+MIN_PREFIX_LENGTH = 2
+MAX_SUGGESTIONS = 8
+# Product names are also found from their 2nd..4th word ("ejemplares" -> "Novelas ejemplares")
+MAX_NAME_WORDS = 4
+MIN_WORD_LENGTH = 3
+
+
+def normalize(text):
+    """Lower-case text, strip accents and collapse whitespace."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+def normalize_code(code):
+    """Normalize an ISBN or reference: no hyphens or spaces."""
+    return normalize(code).replace('-', '').replace(' ', '')
+
+
+def product_entries(product):
+    """
+    Index entries of a product.
+
+    Returns:
+        list[tuple]: (key, kind, label, product_id) tuples; publishers have no product id
+    """
+    entries = []
+    name = ' '.join((product.name or '').split())
+    if name:
+        words = normalize(name).split(' ')
+        for index in range(min(len(words), MAX_NAME_WORDS)):
+            if index == 0 or len(words[index]) >= MIN_WORD_LENGTH:
+                entries.append((' '.join(words[index:]), 'name', name, product.id))
+    publisher = ' '.join((product.publisher or '').split())
+    if publisher:
+        entries.append((normalize(publisher), 'publisher', publisher, None))
+    for kind in ('isbn', 'reference'):
+        code = (getattr(product, kind) or '').strip()
+        if normalize_code(code):
+            entries.append((normalize_code(code), kind, code, product.id))
+    return entries
+
+
+@lru_cache(maxsize=None)
+def url_prefixes():
+    """The search and product URLs, resolved once: reverse() is too slow to call per suggestion."""
+    return reverse('search'), reverse('product', args=[0]).removesuffix('0')
+
+
+def suggestion_url(kind, label, product_id):
+    search_url, product_url = url_prefixes()
+    if product_id is None:
+        return f"{search_url}?{urlencode({'q': label})}"
+    return f"{product_url}{product_id}"
+
+
+class PrefixIndex:
+    """Sorted, thread-safe list of autocomplete entries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held by the first build, so that concurrent first lookups wait for it instead of building too
+        self._build_lock = threading.Lock()
+        self._entries = None
+        self._built_at = 0.0
+        self._rebuilding = False
+        # product id -> its entries, to remove them when it changes
+        self._by_product = {}
+        # Publisher entries are shared: (key, label) -> number of products
+        self._publishers = Counter()
+
+    def build(self):
+        """(Re)build the index from the database."""
+        by_product = {}
+        publishers = Counter()
+        products = Product.objects.only('id', 'name', 'publisher', 'isbn', 'reference').iterator(chunk_size=2000)
+        for product in products:
+            entries = product_entries(product)
+            by_product[product.id] = entries
+            publishers.update((key, label) for key, kind, label, _ in entries if kind == 'publisher')
+        entries = sorted({entry for product_entries_ in by_product.values() for entry in product_entries_})
+        with self._lock:
+            self._entries = entries
+            self._by_product = by_product
+            self._publishers = publishers
+            self._built_at = time.monotonic()
+
+    def _ensure_built(self):
+        if self._entries is None:
+            with self._build_lock:
+                if self._entries is None:
+                    self.build()
+            return
+        max_age = getattr(settings, 'STORE_AUTOCOMPLETE_REFRESH_SECONDS', 300)
+        if time.monotonic() - self._built_at > max_age:
+            with self._lock:
+                if self._rebuilding:
+                    return
+                self._rebuilding = True
+            threading.Thread(target=self._rebuild, name='autocomplete-rebuild', daemon=True).start()
+
+    def _rebuild(self):
+        """Refresh a stale index in the background; lookups keep using the current one meanwhile."""
+        try:
+            self.build()
+        except Exception as e:
+            # Retried on a later lookup, since _built_at did not move
+            logger.error(f"Error rebuilding the autocomplete index: {e}")
+        finally:
+            # The thread's own database connection
+            connection.close()
+            with self._lock:
+                self._rebuilding = False
+
+    def _remove(self, entry):
+        position = bisect_left(self._entries, entry)
+        if position < len(self._entries) and self._entries[position] == entry:
+            del self._entries[position]
+
+    def _discard(self, product_id):
+        for entry in self._by_product.pop(product_id, ()):
+            key, kind, label, _ = entry
+            if kind == 'publisher':
+                self._publishers[(key, label)] -= 1
+                if self._publishers[(key, label)] > 0:
+                    continue
+                del self._publishers[(key, label)]
+            self._remove(entry)
+
+    def update(self, product):
+        """Replace the entries of a saved product (no-op until the index is built)."""
+        with self._lock:
+            if self._entries is None:
+                return
+            self._discard(product.id)
+            entries = product_entries(product)
+            for entry in entries:
+                key, kind, label, _ = entry
+                if kind == 'publisher':
+                    self._publishers[(key, label)] += 1
+                    if self._publishers[(key, label)] > 1:
+                        continue
+                insort(self._entries, entry)
+            self._by_product[product.id] = entries
+
+    def remove(self, product_id):
+        """Drop the entries of a deleted product (no-op until the index is built)."""
+        with self._lock:
+            if self._entries is not None:
+                self._discard(product_id)
+
+    def suggest(self, prefix, limit=MAX_SUGGESTIONS):
+        """
+        Return up to limit suggestions for a typed prefix.
+
+        Returns:
+            list[dict]: {'label', 'kind', 'url'} in key order
+        """
+        self._ensure_built()
+        keys = {key for key in (normalize(prefix), normalize_code(prefix)) if len(key) >= MIN_PREFIX_LENGTH}
+        matches = set()
+        with self._lock:
+            for key in keys:
+                position = bisect_left(self._entries, (key,))
+                count = 0
+                while position < len(self._entries) and count < limit:
+                    entry = self._entries[position]
+                    if not entry[0].startswith(key):
+                        break
+                    matches.add(entry)
+                    position += 1
+                    count += 1
+
+        suggestions = []
+        seen = set()
+        for key, kind, label, product_id in sorted(matches):
+            # A product found from several of its words is suggested once
+            if (kind, label, product_id) not in seen:
+                seen.add((kind, label, product_id))
+                suggestions.append({'label': label, 'kind': kind, 'url': suggestion_url(kind, label, product_id)})
+        return suggestions[:limit]
+
+    def reset(self):
+        """Forget the index; it is rebuilt on the next lookup."""
+        with self._lock:
+            self._entries = None
+            self._by_product = {}
+            self._publishers = Counter()
+
+
+autocomplete_index = PrefixIndex()
+
+
+def update_product(sender, instance, **kwargs):
+    autocomplete_index.update(instance)
+
+
+def remove_product(sender, instance, **kwargs):
+    autocomplete_index.remove(instance.id)
+
+
+post_save.connect(update_product, sender=Product)
+post_delete.connect(remove_product, sender=Product)
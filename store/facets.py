@@ -0,0 +1,204 @@
+"""
+Faceted browsing: filters and facet counts over the product catalog.
+
+Facets are category, publisher, year, price band and "on sale". Filters come
+from the query string (?publisher=...&price=10-20&sale=1) and each one is backed
+by an index on its column.
+
+All the counts for a page come from a single aggregate query: the filtered
+products are grouped by GROUPING SETS, one set per facet, so narrowing the
+catalog costs one scan of the matching rows however many facets are shown.
+Counts describe the current selection, i.e. how many products remain if a
+value is added to the filters.
+
+Besides the facets, page count and publication year can be limited to a range
+(?pages_max=199&year_min=1991); those filters use the typed columns parsed from
+the scraped text (store/parsing.py) and their B-tree indexes.
+"""
+from django.db import connection
+from django.db.models import Case, CharField, F, Value, When
+from urllib.parse import urlencode
+
+FACETS = ('category', 'publisher', 'year', 'price', 'sale')
+# Values shown per facet, most frequent first
+FACET_LIMIT = 15
+# (key, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = (
+    ('0-10', 0, 10),
+    ('10-20', 10, 20),
+    ('20-50', 20, 50),
+    ('50+', 50, None),
+)
+
+# Range filter parameter -> lookup on the parsed numeric columns (bounds inclusive)
+RANGE_FILTERS = {
+    'pages_min': 'page_count__gte',
+    'pages_max': 'page_count__lte',
+    'year_min': 'publication_year__gte',
+    'year_max': 'publication_year__lte',
+}
+
+# Column of the facet in the grouped subquery, and the extra label column if any
+FACET_COLUMNS = {
+    'category': ('category_id', 'category_name'),
+    'publisher': ('publisher', None),
+    'year': ('year', None),
+    'price': ('price_band', None),
+    'sale': ('is_sale', None),
+}
+
+
+def price_band():
+    """SQL expression for the price band key of a product."""
+    return Case(
+        *[
+            When(price__lt=upper, then=Value(key)) if upper is not None else When(price__gte=lower, then=Value(key))
+            for key, lower, upper in PRICE_BANDS
+        ],
+        output_field=CharField(),
+    )
+
+
+def price_band_label(key):
+    for band, lower, upper in PRICE_BANDS:
+        if band == key:
+            return f'{lower} - {upper} €' if upper is not None else f'Más de {lower} €'
+    return key
+
+
+def get_filters(params, facets=FACETS):
+    """
+    Read the selected facet values and range bounds from a query dict.
+
+    Returns:
+        dict: facet or range parameter -> selected value, for the valid ones only
+    """
+    filters = {}
+    for facet in facets:
+        value = (params.get(facet) or '').strip()
+        if not value:
+            continue
+        if facet == 'category' and not value.isdigit():
+            continue
+        if facet == 'price' and value not in {key for key, _, _ in PRICE_BANDS}:
+            continue
+        if facet == 'sale' and value != '1':
+            continue
+        filters[facet] = value
+    for name in RANGE_FILTERS:
+        value = (params.get(name) or '').strip()
+        # Bounds beyond any page count or year would only overflow the column type
+        if value.isdigit() and len(value) <= 5:
+            filters[name] = value
+    return filters
+
+
+def apply_filters(queryset, filters):
+    """Restrict queryset to the products matching every selected facet value."""
+    for facet, value in filters.items():
+        if facet == 'category':
+            queryset = queryset.filter(category_id=int(value))
+        elif facet == 'publisher':
+            queryset = queryset.filter(publisher=value)
+        elif facet == 'year':
+            queryset = queryset.filter(year=value)
+        elif facet == 'price':
+            _, lower, upper = next(band for band in PRICE_BANDS if band[0] == value)
+            queryset = queryset.filter(price__gte=lower)
+            if upper is not None:
+                queryset = queryset.filter(price__lt=upper)
+        elif facet == 'sale':
+            queryset = queryset.filter(is_sale=True)
+        elif facet in RANGE_FILTERS:
+            queryset = queryset.filter(**{RANGE_FILTERS[facet]: int(value)})
+    return queryset
+
+
+def facet_counts(queryset, facets=FACETS, limit=FACET_LIMIT):
+    """
+    Count the products of queryset per value of each facet, in one query.
+
+    Args:
+        queryset (QuerySet): Filtered products
+        facets (tuple): Facets to count
+        limit (int): Values kept per facet, most frequent first
+
+    Returns:
+        dict: facet -> list of {'value', 'label', 'count'}
+    """
+    inner = queryset.annotate(category_name=F('category__name'), price_band=price_band()).values(
+        'category_id', 'category_name', 'publisher', 'year', 'price_band', 'is_sale'
+    ).order_by()
+    inner_sql, params = inner.query.sql_with_params()
+
+    grouping_sets = []
+    flags = []
+    for facet in facets:
+        column, label_column = FACET_COLUMNS[facet]
+        grouping_sets.append(f'({column}, {label_column})' if label_column else f'({column})')
+        flags.append(f'GROUPING({column})')
+    # Only grouped columns may be selected; the others are always NULL
+    grouped_columns = {column for facet in facets for column in FACET_COLUMNS[facet] if column}
+    columns = [
+        column if column in grouped_columns else 'NULL'
+        for column in ('category_id', 'category_name', 'publisher', 'year', 'price_band', 'is_sale')
+    ]
+    sql = (
+        f"SELECT {', '.join(columns)}, {', '.join(flags)}, COUNT(*) "
+        f"FROM ({inner_sql}) AS products "
+        f"GROUP BY GROUPING SETS ({', '.join(grouping_sets)})"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    counts = {facet: [] for facet in facets}
+    for row in rows:
+        category_id, category_name, publisher, year, band, is_sale = row[:6]
+        grouped = row[6:6 + len(facets)]
+        count = row[-1]
+        # The facet of a row is the one whose column was grouped (GROUPING() = 0)
+        facet = facets[list(grouped).index(0)]
+        if facet == 'category':
+            entry = {'value': str(category_id), 'label': category_name}
+        elif facet == 'publisher':
+            entry = {'value': publisher, 'label': publisher}
+        elif facet == 'year':
+            entry = {'value': year, 'label': year}
+        elif facet == 'price':
+            entry = {'value': band, 'label': price_band_label(band)}
+        else:
+            if not is_sale:
+                continue
+            entry = {'value': '1', 'label': 'En oferta'}
+        if not entry['value']:
+            continue
+        counts[facet].append({**entry, 'count': count})
+
+    for facet, values in counts.items():
+        if facet == 'price':
+            order = [key for key, _, _ in PRICE_BANDS]
+            values.sort(key=lambda entry: order.index(entry['value']))
+        else:
+            values.sort(key=lambda entry: (-entry['count'], entry['label']))
+            del values[limit:]
+    return counts
+
+
+def facet_links(params, counts, filters):
+    """
+    Add to each facet value the query string that toggles it (page cursor dropped).
+
+    Returns:
+        dict: the counts, each entry with 'url' and 'selected'
+    """
+    base = {key: value for key, value in params.items() if key != 'after'}
+    for facet, values in counts.items():
+        for entry in values:
+            selected = filters.get(facet) == entry['value']
+            query = {key: value for key, value in base.items() if key != facet}
+            if not selected:
+                query[facet] = entry['value']
+            entry['selected'] = selected
+            entry['url'] = f'?{urlencode(query)}'
+    return counts
@@ -0,0 +1,121 @@
+"""
+Cached HTML fragments of the storefront: product cards and category listings.
+
+Product cards are rendered once and cached per (card template, product id,
+updated_at). Saving a product, partial saves included (Product.save always
+writes updated_at), changes updated_at and so the key, which makes every card
+of an edited product miss without any explicit delete; a page's cards come
+from one cache.get_many and only the misses are rendered.
+
+Category listings (facets plus one page of cards) are cached whole per
+category and query string. Their keys include a per-category version that the
+Product and Category save/delete signals replace, so a change to a product
+invalidates exactly the listings of its category (old and new one if it moved).
+A catalog-wide version, replaced by the same signals, does the same for the
+anonymous full-page cache. Versions are timestamps rather than counters so that
+an evicted version can never bring back a stale listing.
+"""
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from .models import Category, Product
+
+# Bump when a card template changes so that cards rendered by the old one are not reused
+CARD_CACHE_VERSION = 1
+# Card template per variant
+CARD_TEMPLATES = {
+    'grid': 'product_card.html',
+    'search': 'search_card.html',
+}
+
+
+def card_cache_key(product, variant):
+    version = int(product.updated_at.timestamp() * 1_000_000) if product.updated_at else 0
+    return f"store_card_{CARD_CACHE_VERSION}_{variant}_{product.id}_{version}"
+
+
+def render_cards(products, variant='grid'):
+    """
+    Render the cards of products, from the cache where possible.
+
+    Args:
+        products (list[Product]): Products to show, with updated_at loaded
+        variant (str): Key of CARD_TEMPLATES
+
+    Returns:
+        list[str]: Safe card HTML, in the order of products
+    """
+    keys = {product.id: card_cache_key(product, variant) for product in products}
+    cards = cache.get_many(keys.values())
+    missing = {}
+    for product in products:
+        key = keys[product.id]
+        if key not in cards:
+            missing[key] = render_to_string(CARD_TEMPLATES[variant], {'product': product})
+    if missing:
+        cache.set_many(missing, settings.STORE_CARD_CACHE_SECONDS)
+        cards.update(missing)
+    return [mark_safe(cards[keys[product.id]]) for product in products]
+
+
+def category_version(category_id):
+    """Current version of a category's listings."""
+    return cache.get_or_set(f"store_category_version_{category_id}", time.time_ns, None)
+
+
+def invalidate_category(*category_ids):
+    """Replace the version of categories, orphaning their cached listings."""
+    version = time.time_ns()
+    cache.set_many({f"store_category_version_{category_id}": version for category_id in category_ids}, None)
+
+
+def catalog_version():
+    """Current version of the whole catalog, for pages that may show any product (see page_cache.py)."""
+    return cache.get_or_set("store_catalog_version", time.time_ns, None)
+
+
+def invalidate_catalog():
+    cache.set("store_catalog_version", time.time_ns(), None)
+
+
+def listing_cache_key(category, request):
+    """Key of a category listing page: category, its version, the query string and fragment-only requests."""
+    query = hashlib.sha1(request.GET.urlencode().encode('utf-8')).hexdigest()
+    fragment = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    return f"store_listing_{category.id}_{category_version(category.id)}_{int(fragment)}_{query}"
+
+
+def remember_category(sender, instance, raw=False, **kwargs):
+    # The category a product had before the save, to invalidate it too if it moved
+    if instance.pk and not raw:
+        instance._previous_category_id = (
+            Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+
+def product_changed(sender, instance, **kwargs):
+    category_ids = {instance.category_id, getattr(instance, '_previous_category_id', None)}
+    invalidate_category(*(category_id for category_id in category_ids if category_id is not None))
+    invalidate_catalog()
+
+
+def product_deleted(sender, instance, **kwargs):
+    invalidate_category(instance.category_id)
+    invalidate_catalog()
+    cache.delete_many([card_cache_key(instance, variant) for variant in CARD_TEMPLATES])
+
+
+def category_changed(sender, instance, **kwargs):
+    invalidate_category(instance.id)
+    invalidate_catalog()
+
+
+pre_save.connect(remember_category, sender=Product)
+post_save.connect(product_changed, sender=Product)
+post_delete.connect(product_deleted, sender=Product)
+post_save.connect(category_changed, sender=Category)
+post_delete.connect(category_changed, sender=Category)
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from store.models import Product
+from store.parsing import NUMERIC_FIELDS, SOURCE_FIELDS, numeric_values
+import time
+
+
+class Command(BaseCommand):
+    help = 'Parse dimensions, measures, pages and year of existing products into the typed numeric columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of products read and updated per batch (default: 1000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report how many products would change without writing'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        start = time.perf_counter()
+
+        # Only the raw and parsed columns are read; bulk_update leaves updated_at alone
+        products = Product.objects.only('id', *SOURCE_FIELDS, *NUMERIC_FIELDS).order_by('id')
+        scanned = 0
+        changed = 0
+        batch = []
+        for product in products.iterator(chunk_size=batch_size):
+            scanned += 1
+            values = numeric_values(product)
+            if all(getattr(product, field) == value for field, value in values.items()):
+                continue
+            for field, value in values.items():
+                setattr(product, field, value)
+            batch.append(product)
+            if len(batch) >= batch_size:
+                changed += self.flush(batch, dry_run)
+                batch = []
+        changed += self.flush(batch, dry_run)
+
+        elapsed = time.perf_counter() - start
+        verb = 'Would update' if dry_run else 'Updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {changed} of {scanned} products in {elapsed:.1f}s.'
+        ))
+
+    def flush(self, batch, dry_run):
+        if batch and not dry_run:
+            Product.objects.bulk_update(batch, NUMERIC_FIELDS)
+        return len(batch)
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.10 on 2026-10-19 11:00
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_DOCUMENT = """
+    setweight(to_tsvector('spanish', coalesce({row}name, '')), 'A') ||
+    setweight(to_tsvector('spanish', coalesce({row}publisher, '')), 'B') ||
+    setweight(to_tsvector('spanish', coalesce({row}description, '')), 'C')
+"""
+
+CREATE_TRIGGER = f"""
+CREATE FUNCTION store_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_DOCUMENT.format(row='NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, publisher, description ON store_product
+    FOR EACH ROW EXECUTE FUNCTION store_product_search_vector_update();
+
+UPDATE store_product SET search_vector = {SEARCH_DOCUMENT.format(row='')};
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS store_product_search_vector_trigger ON store_product;
+DROP FUNCTION IF EXISTS store_product_search_vector_update();
+"""
+
+# pg_trgm ships with the Postgres contrib modules (e.g. the pgvector/pgvector
+# image) but not with every build; search falls back to full-text only without it.
+# The trigram index is therefore created here rather than declared on the model.
+CREATE_TRIGRAM_INDEX = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS product_name_trgm_idx ON store_product USING gin (name gin_trgm_ops);
+    END IF;
+END
+$$;
+"""
+
+DROP_TRIGRAM_INDEX = "DROP INDEX IF EXISTS product_name_trgm_idx;"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_product_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.RunSQL(CREATE_TRIGRAM_INDEX, DROP_TRIGRAM_INDEX),
+    ]
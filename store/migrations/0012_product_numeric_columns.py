@@ -0,0 +1,46 @@
+# Generated by Django 5.2.10 on 2026-10-19 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_product_facet_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='height_cm',
+            field=models.DecimalField(blank=True, decimal_places=1, editable=False, max_digits=5, null=True, verbose_name='Alto (cm)'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Número de páginas'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='publication_year',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='Año de publicación'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='thickness_cm',
+            field=models.DecimalField(blank=True, decimal_places=1, editable=False, max_digits=5, null=True, verbose_name='Grosor (cm)'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='width_cm',
+            field=models.DecimalField(blank=True, decimal_places=1, editable=False, max_digits=5, null=True, verbose_name='Ancho (cm)'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['page_count'], name='product_page_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['publication_year'], name='product_pub_year_idx'),
+        ),
+    ]
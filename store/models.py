@@ -1,7 +1,10 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 import datetime
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
+from .parsing import NUMERIC_FIELDS, SOURCE_FIELDS, numeric_values
 
 # Create your models here.
 
@@ -17,6 +20,9 @@ class Profile(models.Model):
     state = models.CharField(max_length=100, blank=True, null=True)
     zip_code = models.CharField(max_length=20, blank=True, null=True)
     country = models.CharField(max_length=100, blank=True, null=True)
+    # Deprecated: carts live in cart.CartItem. Kept only as the source of the data
+    # migration cart/0002_copy_profile_old_carts; nothing reads or writes it, and it
+    # will be dropped in a later release. Don't start using it again.
     old_cart = models.CharField(max_length=255, blank=True, null=True)
 
     def __str__(self):
@@ -100,9 +106,51 @@ class Product(models.Model):
     pages = models.CharField(max_length=50, blank=True, null=True, verbose_name="Páginas")
     measures = models.CharField(max_length=100, blank=True, null=True, verbose_name="Medidas")
 
+    # Typed values parsed from dimensions/measures, pages and year on save (store/parsing.py)
+    height_cm = models.DecimalField(max_digits=5, decimal_places=1, blank=True, null=True, editable=False, verbose_name="Alto (cm)")
+    width_cm = models.DecimalField(max_digits=5, decimal_places=1, blank=True, null=True, editable=False, verbose_name="Ancho (cm)")
+    thickness_cm = models.DecimalField(max_digits=5, decimal_places=1, blank=True, null=True, editable=False, verbose_name="Grosor (cm)")
+    page_count = models.PositiveIntegerField(blank=True, null=True, editable=False, verbose_name="Número de páginas")
+    publication_year = models.PositiveSmallIntegerField(blank=True, null=True, editable=False, verbose_name="Año de publicación")
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Weighted Spanish full-text document (name > publisher > description), kept up
+    # to date by a database trigger (migration 0010); see store/search.py
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the home page (store/pagination.py)
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            # Facet filters (store/facets.py); category and is_sale are indexed on the field
+            models.Index(fields=['publisher'], name='product_publisher_idx'),
+            models.Index(fields=['year'], name='product_year_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+            # Range filters on the parsed values ("under 200 pages", "published after 1990")
+            models.Index(fields=['page_count'], name='product_page_count_idx'),
+            models.Index(fields=['publication_year'], name='product_pub_year_idx'),
+        ]
+
+    def normalize_numbers(self):
+        """Fill the typed columns from the raw text fields."""
+        for field, value in numeric_values(self).items():
+            setattr(self, field, value)
+
+    def save(self, *args, **kwargs):
+        self.normalize_numbers()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            # A partial save of a raw field also writes the values parsed from it
+            if update_fields & set(SOURCE_FIELDS):
+                update_fields |= set(NUMERIC_FIELDS)
+            # ...and always bumps updated_at, which versions cached cards and HTTP validators
+            kwargs['update_fields'] = update_fields | {'updated_at'}
+        super().save(*args, **kwargs)
+
     def print_dimensions(self):
         dims = self.dimensions or {}
         print(f"Dimensions: {dims.get('height')} x {dims.get('width')} x {dims.get('thickness')}")
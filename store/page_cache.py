@@ -0,0 +1,66 @@
+"""
+Full-page cache for anonymous storefront pages.
+
+Home, category, product and about pages look the same for every anonymous
+visitor except for the cart count and the flash messages, which depend on the
+session. Pages served through `anonymous_page_cache` leave both out: base.html
+renders placeholders and scripts.js fills them from the `session_state` JSON
+endpoint, which also sets the CSRF cookie the add-to-cart script waits for and
+reads.
+
+The cache key is only the path, query string and whether the request asks for
+the infinite-scroll fragment (GET and HEAD share entries), plus the catalog
+version that Product and Category changes replace (see fragments.py). Only the
+body and content type are stored: the cookies of the visitor whose request
+rendered the page are never replayed to others. A hit for a visitor without a
+session cookie skips the view and the templates; views wrapped in HTTP
+validators still run those first (the product page looks up updated_at for its
+ETag, one indexed query).
+
+Pages rendered for everyone else (logged-in users, or with the cache disabled)
+carry the CSRF token inline as usual.
+"""
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from .fragments import catalog_version
+
+
+def page_cache_key(request):
+    path = hashlib.sha1(request.get_full_path().encode('utf-8')).hexdigest()
+    fragment = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    return f"store_page_{catalog_version()}_{int(fragment)}_{path}"
+
+
+def page_cache_applies(request):
+    """Whether anonymous_page_cache serves request, i.e. renders it without session data."""
+    return (bool(settings.STORE_PAGE_CACHE_SECONDS) and request.method in ('GET', 'HEAD')
+            and not request.user.is_authenticated)
+
+
+def anonymous_page_cache(view):
+    """
+    Cache the successful GET responses of a view for anonymous visitors.
+
+    While rendering, request.session_state_deferred is set so that templates
+    leave the session-dependent parts to the session_state endpoint.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not page_cache_applies(request):
+            return view(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        request.session_state_deferred = True
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            cache.set(key, (response.content, response['Content-Type']), settings.STORE_PAGE_CACHE_SECONDS)
+        return response
+    return wrapper
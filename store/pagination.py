@@ -0,0 +1,67 @@
+"""
+Keyset (seek) pagination for product listings.
+
+Pages are ordered newest first by (created_at, id) and the next page starts
+after the last product shown, so every page costs the same index range scan on
+store_product(created_at, id) however deep the customer scrolls. OFFSET would
+instead read and discard every earlier row.
+
+The position is passed around as an opaque cursor string.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+ORDERING = ('-created_at', '-id')
+
+
+class InvalidCursor(ValueError):
+    """The cursor was not produced by encode_cursor."""
+
+
+def encode_cursor(product):
+    """Encode the position right after product."""
+    raw = f"{product.created_at.isoformat()}|{product.id}"
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor into (created_at, id).
+
+    Raises:
+        InvalidCursor: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        created_at, product_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(product_id)
+    except (ValueError, binascii.Error) as e:
+        raise InvalidCursor(f"Invalid page cursor '{cursor}'") from e
+
+
+def keyset_page(queryset, cursor=None, page_size=24):
+    """
+    Return one page of queryset, newest first.
+
+    Args:
+        queryset (QuerySet): Products to page through
+        cursor (str): Cursor of the previous page's last product (default: first page)
+        page_size (int): Products per page
+
+    Returns:
+        tuple[list, str | None]: The products and the cursor of the next page, None on the last page
+
+    Raises:
+        InvalidCursor: If the cursor is malformed
+    """
+    if cursor:
+        created_at, product_id = decode_cursor(cursor)
+        # The first condition is the index range; the exclude breaks ties within the same timestamp
+        queryset = queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, id__gte=product_id)
+    # One extra row tells whether there is a next page without a COUNT
+    products = list(queryset.order_by(*ORDERING)[:page_size + 1])
+    if len(products) > page_size:
+        products = products[:page_size]
+        return products, encode_cursor(products[-1])
+    return products, None
@@ -0,0 +1,159 @@
+"""
+Parsing of the free-text book details into typed numeric values.
+
+The Azacán scraper stores what the shop prints ("320 p.", "1990 (2ª ed.)",
+"21 x 14,5 cm") and Google Books returns dimensions as strings ("24.00 cm").
+Product keeps those as they are and, on save, also fills normalized columns
+(height/width/thickness in cm, page count, publication year) that range
+filters and sorting can use through plain B-tree indexes.
+
+Every parser returns None when the text holds no plausible value, so a bad
+scrape leaves the column empty instead of storing garbage.
+"""
+import datetime
+import re
+from decimal import Decimal, InvalidOperation
+
+# Conversion factors to centimetres
+UNITS = {
+    'mm': Decimal('0.1'),
+    'cm': Decimal('1'),
+    'm': Decimal('100'),
+    'in': Decimal('2.54'),
+    'inch': Decimal('2.54'),
+    'inches': Decimal('2.54'),
+    '"': Decimal('2.54'),
+}
+DEFAULT_UNIT = 'cm'
+# Anything outside these bounds is a typo or a different field scraped by mistake
+MAX_LENGTH_CM = Decimal('200')
+MAX_PAGES = 20000
+MIN_YEAR = 1450
+
+NUMBER_PATTERN = re.compile(r'\d+(?:[.,]\d+)?')
+UNIT_PATTERN = re.compile(r'(mm|cm|inches|inch|in|m|")(?![a-z])', re.IGNORECASE)
+YEAR_PATTERN = re.compile(r'(?<!\d)(\d{4})(?!\d)')
+# Thousands may be grouped with a dot (Spanish, "1.024") or a comma (English, "1,024")
+PAGES_PATTERN = re.compile(r'(?<![\d.,])(\d{1,3}(?:[.,]\d{3})+|\d+)(?![\d,])')
+# Separators between the sides of "21 x 14,5 x 2 cm"
+MEASURES_SEPARATOR = re.compile(r'\s*[x×*]\s*', re.IGNORECASE)
+
+# Normalized columns filled from the raw fields (see Product.save)
+NUMERIC_FIELDS = ('height_cm', 'width_cm', 'thickness_cm', 'page_count', 'publication_year')
+SOURCE_FIELDS = ('dimensions', 'measures', 'pages', 'year')
+
+
+def to_decimal(text):
+    try:
+        return Decimal(text.replace(',', '.'))
+    except (InvalidOperation, AttributeError):
+        return None
+
+
+def parse_length(text, default_unit=DEFAULT_UNIT):
+    """
+    Parse a single length ("24.00 cm", "9 inches", "210 mm") into centimetres.
+
+    Returns:
+        Decimal | None: The length rounded to 0.1 cm
+    """
+    if text is None:
+        return None
+    if isinstance(text, (int, float, Decimal)):
+        text = str(text)
+    match = NUMBER_PATTERN.search(text)
+    if not match:
+        return None
+    unit = UNIT_PATTERN.search(text[match.end():])
+    factor = UNITS[unit.group(1).lower() if unit else default_unit]
+    value = to_decimal(match.group()) * factor
+    if not 0 < value <= MAX_LENGTH_CM:
+        return None
+    return value.quantize(Decimal('0.1'))
+
+
+def parse_measures(text):
+    """
+    Parse a measures string ("21 x 14,5 cm", "24x17x2 cm") into (height, width, thickness).
+
+    Sides come in the order the shop prints them, height first. A unit written
+    once at the end applies to every side; without one, centimetres are assumed.
+
+    Returns:
+        tuple: Three Decimal | None values in centimetres
+    """
+    if not text:
+        return None, None, None
+    sides = [side for side in MEASURES_SEPARATOR.split(text.strip()) if side]
+    unit = UNIT_PATTERN.search(sides[-1]) if sides else None
+    default_unit = unit.group(1).lower() if unit else DEFAULT_UNIT
+    values = [parse_length(side, default_unit) for side in sides[:3]]
+    return tuple(values + [None] * (3 - len(values)))
+
+
+def parse_dimensions(dimensions, measures=None):
+    """
+    Normalize a product's size from its dimensions JSON, falling back to measures.
+
+    Args:
+        dimensions (dict): {'height': ..., 'width': ..., 'thickness': ...} as stored by the Google Books action
+        measures (str): Azacán "Medidas" text
+
+    Returns:
+        tuple: (height, width, thickness) in centimetres, None where unknown
+    """
+    dimensions = dimensions if isinstance(dimensions, dict) else {}
+    from_json = [parse_length(dimensions.get(side)) for side in ('height', 'width', 'thickness')]
+    from_measures = parse_measures(measures)
+    return tuple(json_value if json_value is not None else measures_value
+                 for json_value, measures_value in zip(from_json, from_measures))
+
+
+def parse_pages(text):
+    """
+    Parse a page count ("320", "320 p.", "XII, 320 págs.", "1.024", "1,024 pages").
+
+    Roman-numbered front matter is ignored; with several numbers the largest wins.
+
+    Returns:
+        int | None
+    """
+    if not text:
+        return None
+    counts = [int(re.sub(r'[.,]', '', number)) for number in PAGES_PATTERN.findall(str(text))]
+    counts = [count for count in counts if 0 < count <= MAX_PAGES]
+    return max(counts) if counts else None
+
+
+def parse_year(text):
+    """
+    Parse a publication year ("1990", "1990 (2ª ed.)", "c. 1985", "[2003]").
+
+    Returns:
+        int | None: The first plausible four-digit year
+    """
+    if not text:
+        return None
+    latest = datetime.date.today().year + 1
+    for match in YEAR_PATTERN.finditer(str(text)):
+        year = int(match.group(1))
+        if MIN_YEAR <= year <= latest:
+            return year
+    return None
+
+
+def numeric_values(product):
+    """
+    Compute the normalized columns of a product from its raw fields.
+
+    Returns:
+        dict: NUMERIC_FIELDS -> parsed value
+    """
+    height, width, thickness = parse_dimensions(product.dimensions, product.measures)
+    return {
+        'height_cm': height,
+        'width_cm': width,
+        'thickness_cm': thickness,
+        'page_count': parse_pages(product.pages),
+        'publication_year': parse_year(product.year),
+    }
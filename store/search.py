@@ -0,0 +1,68 @@
+"""
+Product search: Postgres full-text search plus trigram similarity.
+
+`Product.search_vector` is maintained by a database trigger (migration 0010)
+from the Spanish-stemmed name (weight A), publisher (B) and description (C),
+and has a GIN index, so matching and ranking never read the text columns.
+
+When the pg_trgm extension is installed, names that are merely similar to the
+query also match (typos, missing accents) through the trigram GIN index on
+`name`, and their similarity is added to the rank. Without pg_trgm, search
+is full-text only.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from .models import Product
+
+SEARCH_CONFIG = 'spanish'
+# Fields the result cards use (updated_at versions their cache key)
+RESULT_FIELDS = ('id', 'name', 'image', 'price', 'description', 'publisher', 'updated_at')
+
+_trigram_available = None
+
+
+def trigram_available():
+    """Whether pg_trgm is installed in the database (checked once per process)."""
+    global _trigram_available
+    if _trigram_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+            _trigram_available = cursor.fetchone()[0]
+    return _trigram_available
+
+
+def search_products(query):
+    """
+    Return the products matching query, best match first.
+
+    Args:
+        query (str): Words as typed by the customer; quoted phrases, "or" and "-word" are supported
+
+    Returns:
+        QuerySet: Matching products annotated with `rank`
+    """
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    rank = SearchRank(F('search_vector'), search_query)
+    matches = Q(search_vector=search_query)
+    if trigram_available():
+        matches |= Q(name__trigram_similar=query)
+        rank = rank + Coalesce(TrigramSimilarity('name', query), Value(0.0))
+    return (
+        Product.objects.only(*RESULT_FIELDS)
+        .filter(matches)
+        .annotate(rank=rank)
+        .order_by('-rank', '-id')
+    )
+
+
+def search_page(query, page_number=1, page_size=24):
+    """
+    Return one page of search results.
+
+    Returns:
+        Page: The requested page (the last one if page_number is past the end)
+    """
+    return Paginator(search_products(query), page_size).get_page(page_number)
@@ -1,2 +1,133 @@
 // Custom JavaScript for the e‑commerce site
 //console.log('Scripts loaded');
+
+// Infinite scroll on the home page: when the "Load more" link scrolls into view,
+// fetch the next page of product cards and append it in place of the link.
+(function () {
+    const list = document.getElementById('product-list');
+    if (!list || !('IntersectionObserver' in window)) {
+        return;
+    }
+    let loading = false;
+    const observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting && !loading) {
+                loadNextPage(entry.target);
+            }
+        });
+    }, { rootMargin: '600px' });
+
+    function watch() {
+        const link = list.querySelector('[data-next-page]');
+        if (link) {
+            observer.observe(link);
+        }
+    }
+
+    function loadNextPage(link) {
+        loading = true;
+        observer.unobserve(link);
+        fetch(link.href, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.text();
+            })
+            .then(function (html) {
+                link.closest('.load-more').remove();
+                list.insertAdjacentHTML('beforeend', html);
+                loading = false;
+                watch();
+            })
+            .catch(function () {
+                // Leave the link in place so the customer can still follow it
+                loading = false;
+            });
+    }
+
+    watch();
+})();
+
+// Search-box suggestions from the autocomplete endpoint, shown in a <datalist>.
+(function () {
+    const input = document.querySelector('[data-autocomplete-url]');
+    if (!input) {
+        return;
+    }
+    const list = document.getElementById(input.getAttribute('list'));
+    const urls = {};
+    let timer = null;
+
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        const query = input.value.trim();
+        // Picking a product suggestion goes straight to its page
+        if (urls[query]) {
+            window.location.href = urls[query];
+            return;
+        }
+        if (query.length < 2) {
+            return;
+        }
+        timer = setTimeout(function () {
+            fetch(input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(query))
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    list.innerHTML = '';
+                    data.suggestions.forEach(function (suggestion) {
+                        const option = document.createElement('option');
+                        option.value = suggestion.label;
+                        list.appendChild(option);
+                        if (suggestion.kind !== 'publisher') {
+                            urls[suggestion.label] = suggestion.url;
+                        }
+                    });
+                })
+                .catch(function () {});
+        }, 150);
+    });
+})();
+
+// Read a cookie, e.g. the CSRF token for AJAX posts from cached pages.
+function getCookie(name) {
+    const prefix = name + '=';
+    const match = document.cookie.split(';').map(function (cookie) { return cookie.trim(); })
+        .find(function (cookie) { return cookie.startsWith(prefix); });
+    return match ? decodeURIComponent(match.substring(prefix.length)) : null;
+}
+
+// Settles once a cached page has its session state, and with it the CSRF cookie that
+// AJAX posts need; already settled on pages rendered with the session inline.
+let sessionStateLoaded = Promise.resolve();
+
+// Pages from the anonymous page cache carry no session data: fetch the cart count and
+// pending messages (this also sets the CSRF cookie) and put them in place.
+(function () {
+    const container = document.querySelector('[data-session-state-url]');
+    if (!container) {
+        return;
+    }
+    sessionStateLoaded = fetch(container.dataset.sessionStateUrl, { credentials: 'same-origin' })
+        .then(function (response) { return response.json(); })
+        .then(function (state) {
+            const quantity = document.getElementById('cart_quantity');
+            if (quantity) {
+                quantity.textContent = state.cart_quantity;
+            }
+            state.messages.forEach(function (message) {
+                const alert = document.createElement('div');
+                alert.className = 'alert alert-' + message.level + ' fade show';
+                alert.setAttribute('role', 'alert');
+                alert.textContent = message.text;
+                const close = document.createElement('button');
+                close.type = 'button';
+                close.className = 'btn-close';
+                close.setAttribute('data-bs-dismiss', 'alert');
+                close.setAttribute('aria-label', 'Close');
+                alert.appendChild(close);
+                container.appendChild(alert);
+            });
+        })
+        .catch(function () {});
+})();
@@ -1,7 +1,27 @@
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from store.models import Product, Category, Customer, Profile
-from cart.cart import Cart
+from store.facets import facet_counts, get_filters, apply_filters
+from store.autocomplete import autocomplete_index
+from store.search import search_products, trigram_available
+from store.pagination import keyset_page, encode_cursor, decode_cursor, InvalidCursor
+from store.parsing import parse_measures, parse_pages, parse_year, parse_length
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from store.fragments import render_cards, card_cache_key
+from io import StringIO
+from cart.cart import Cart, get_cart
+from cart.models import CartItem
+from django.apps import apps
+import importlib
+import re
+import threading
+import time
+from unittest.mock import patch
+from django.conf import settings
+from django.test import override_settings
 from decimal import Decimal
 
 
@@ -335,3 +355,656 @@ class ProfileModelTestCase(TestCase):
         self.assertEqual(profile.phone, '555-1234')
         self.assertEqual(profile.address1, '123 Main St')
         self.assertEqual(profile.city, 'Test City')
+
+
+@override_settings(STORE_PAGE_SIZE=2)
+class HomePaginationTestCase(TestCase):
+    """Test keyset pagination of the home page"""
+    
+    def setUp(self):
+        """Set up five products, two of them created at the same instant"""
+        self.category = Category.objects.create(name='Books', description='Book category')
+        self.products = [
+            Product.objects.create(
+                name=f'Paged Book {index}',
+                price=Decimal('10.00'),
+                category=self.category,
+                description=f'Long description {index}'
+            )
+            for index in range(5)
+        ]
+        Product.objects.filter(id__in=[self.products[1].id, self.products[2].id]).update(
+            created_at=self.products[1].created_at
+        )
+    
+    def test_pages_cover_catalog_once(self):
+        """Test following the cursors returns every product once, newest first"""
+        seen = []
+        response = self.client.get('/')
+        seen += [product.id for product in response.context['products']]
+        while response.context['next_cursor']:
+            response = self.client.get(
+                '/', {'after': response.context['next_cursor']}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+            )
+            seen += [product.id for product in response.context['products']]
+        
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+    
+    def test_first_page(self):
+        """Test the home page renders one page of cards without descriptions"""
+        response = self.client.get('/')
+        
+        self.assertEqual(len(response.context['products']), 2)
+        self.assertContains(response, 'data-next-page')
+        self.assertNotContains(response, 'Long description')
+    
+    def test_fragment_response(self):
+        """Test scroll requests get only the cards"""
+        cursor = self.client.get('/').context['next_cursor']
+        response = self.client.get('/', {'after': cursor}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        
+        self.assertNotContains(response, '<html')
+        self.assertContains(response, 'Paged Book')
+    
+    def test_card_fields_only(self):
+        """Test the listing defers the fields the cards don't use"""
+        products, _ = keyset_page(Product.objects.only('id', 'name', 'created_at'), page_size=2)
+        
+        self.assertIn('description', products[0].get_deferred_fields())
+    
+    def test_cursor_round_trip(self):
+        """Test cursors decode to the product's position"""
+        product = self.products[3]
+        
+        self.assertEqual(decode_cursor(encode_cursor(product)), (product.created_at, product.id))
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('not-a-cursor')
+    
+    def test_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        response = self.client.get('/', {'after': 'garbage'})
+        
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductSearchTestCase(TestCase):
+    """Test full-text product search"""
+    
+    def setUp(self):
+        """Set up products matching the query in different fields"""
+        self.category = Category.objects.create(name='Books', description='Book category')
+        self.in_description = Product.objects.create(
+            name='Crónicas de viaje',
+            category=self.category,
+            description='Incluye una novela corta inédita.'
+        )
+        self.in_name = Product.objects.create(
+            name='Novelas ejemplares',
+            category=self.category,
+            description='Doce relatos.'
+        )
+        self.in_publisher = Product.objects.create(
+            name='Obras completas',
+            category=self.category,
+            publisher='Editorial Novela Nueva'
+        )
+        Product.objects.create(name='Atlas de España', category=self.category)
+    
+    def test_search_vector_maintained(self):
+        """Test the trigger fills and refreshes the search vector"""
+        product = Product.objects.create(name='Poesía reunida', category=self.category)
+        self.assertEqual(list(search_products('poesía')), [product])
+        
+        product.name = 'Teatro reunido'
+        product.save()
+        self.assertEqual(list(search_products('poesía')), [])
+        self.assertEqual(list(search_products('teatro')), [product])
+    
+    def test_ranked_by_field_weight(self):
+        """Test stemmed matches are ranked name > publisher > description"""
+        results = list(search_products('novela'))
+        
+        self.assertEqual(results, [self.in_name, self.in_publisher, self.in_description])
+    
+    def test_typo_tolerance(self):
+        """Test names with a typo still match when pg_trgm is installed"""
+        if not trigram_available():
+            self.skipTest('pg_trgm is not installed')
+        
+        self.assertIn(self.in_name, list(search_products('novelas ejenplares')))
+    
+    def test_search_view(self):
+        """Test the search page lists ranked results and the form redirects to it"""
+        response = self.client.get('/search/', {'q': 'novela'})
+        self.assertEqual(list(response.context['products'])[0], self.in_name)
+        
+        response = self.client.post('/search/', {'search': 'novela'})
+        self.assertRedirects(response, '/search/?q=novela')
+    
+    def test_no_results(self):
+        """Test an unmatched query redirects back to the empty search page"""
+        response = self.client.get('/search/', {'q': 'astronomía'})
+        
+        self.assertRedirects(response, '/search/')
+
+
+class AutocompleteTestCase(TestCase):
+    """Test the search-box autocomplete index and endpoint"""
+    
+    def setUp(self):
+        """Set up products and a fresh index"""
+        autocomplete_index.reset()
+        self.addCleanup(autocomplete_index.reset)
+        self.category = Category.objects.create(name='Books', description='Book category')
+        self.quijote = Product.objects.create(
+            name='El ingenioso hidalgo Don Quijote',
+            category=self.category,
+            publisher='Cátedra',
+            isbn='978-84-376-2210-4',
+            reference='AZ-1001'
+        )
+        self.celestina = Product.objects.create(name='La Celestina', category=self.category, publisher='Cátedra')
+    
+    def labels(self, prefix):
+        return [suggestion['label'] for suggestion in autocomplete_index.suggest(prefix)]
+    
+    def test_name_prefixes(self):
+        """Test names are found from their first words, ignoring case and accents"""
+        self.assertEqual(self.labels('el ingen'), ['El ingenioso hidalgo Don Quijote'])
+        self.assertEqual(self.labels('HIDAL'), ['El ingenioso hidalgo Don Quijote'])
+        self.assertEqual(self.labels('celest'), ['La Celestina'])
+        self.assertEqual(self.labels('q'), [])
+    
+    def test_stale_index_rebuilt_once_in_background(self):
+        """Test lookups keep the stale index while a single background rebuild runs"""
+        self.labels('celest')
+        autocomplete_index._built_at -= settings.STORE_AUTOCOMPLETE_REFRESH_SECONDS + 1
+        release = threading.Event()
+        
+        with patch.object(autocomplete_index, 'build', side_effect=lambda: release.wait(5)) as build:
+            for _ in range(3):
+                self.assertEqual(self.labels('celest'), ['La Celestina'])
+            release.set()
+            for _ in range(50):
+                if not autocomplete_index._rebuilding:
+                    break
+                time.sleep(0.01)
+        
+        build.assert_called_once_with()
+        self.assertFalse(autocomplete_index._rebuilding)
+    
+    def test_publishers_and_codes(self):
+        """Test publishers are suggested once and codes match without hyphens"""
+        self.assertEqual(self.labels('catedra'), ['Cátedra'])
+        self.assertEqual(self.labels('9788437'), ['978-84-376-2210-4'])
+        self.assertEqual(self.labels('az-10'), ['AZ-1001'])
+    
+    def test_index_follows_saves_and_deletes(self):
+        """Test saved and deleted products update a built index"""
+        self.labels('la')
+        
+        self.celestina.name = 'Lazarillo de Tormes'
+        self.celestina.publisher = 'Castalia'
+        self.celestina.save()
+        self.assertEqual(self.labels('la'), ['Lazarillo de Tormes'])
+        self.assertEqual(self.labels('cat'), ['Cátedra'])
+        
+        self.quijote.delete()
+        self.assertEqual(self.labels('cat'), [])
+        self.assertEqual(self.labels('cast'), ['Castalia'])
+    
+    def test_endpoint(self):
+        """Test the endpoint returns small cacheable JSON with links"""
+        response = self.client.get('/search/autocomplete/', {'q': 'don qui'})
+        
+        self.assertEqual(response.json()['suggestions'], [
+            {'label': 'El ingenioso hidalgo Don Quijote', 'kind': 'name', 'url': f'/product/{self.quijote.id}'}
+        ])
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertIn('public', response['Cache-Control'])
+
+
+class FacetedBrowsingTestCase(TestCase):
+    """Test facet filters and counts"""
+    
+    def setUp(self):
+        """Set up products across two categories"""
+        self.novels = Category.objects.create(name='Novela', description='Novels')
+        self.history = Category.objects.create(name='Historia', description='History')
+        for name, category, publisher, year, price, is_sale in [
+            ('A', self.novels, 'Cátedra', '1990', '8.00', False),
+            ('B', self.novels, 'Cátedra', '2001', '15.00', True),
+            ('C', self.novels, 'Alianza', '2001', '25.00', False),
+            ('D', self.history, 'Alianza', '1990', '60.00', True),
+            ('E', self.history, None, None, '12.00', False),
+        ]:
+            Product.objects.create(
+                name=name, category=category, publisher=publisher, year=year, price=Decimal(price), is_sale=is_sale
+            )
+    
+    def counts(self, queryset=None, **params):
+        products = apply_filters(queryset or Product.objects.all(), get_filters(params))
+        return {
+            facet: {entry['value']: entry['count'] for entry in values}
+            for facet, values in facet_counts(products).items()
+        }
+    
+    def test_counts_in_one_query(self):
+        """Test every facet is counted by a single query"""
+        with self.assertNumQueries(1):
+            counts = self.counts()
+        
+        self.assertEqual(counts['category'], {str(self.novels.id): 3, str(self.history.id): 2})
+        self.assertEqual(counts['publisher'], {'Cátedra': 2, 'Alianza': 2})
+        self.assertEqual(counts['year'], {'1990': 2, '2001': 2})
+        self.assertEqual(counts['price'], {'0-10': 1, '10-20': 2, '20-50': 1, '50+': 1})
+        self.assertEqual(counts['sale'], {'1': 2})
+    
+    def test_counts_follow_filters(self):
+        """Test counts describe the current selection"""
+        counts = self.counts(publisher='Alianza', price='20-50')
+        
+        self.assertEqual(counts['category'], {str(self.novels.id): 1})
+        self.assertEqual(counts['year'], {'2001': 1})
+        self.assertEqual(counts['sale'], {})
+    
+    def test_invalid_filters_ignored(self):
+        """Test unknown price bands and non-numeric categories are ignored"""
+        self.assertEqual(get_filters({'price': '5-6', 'category': 'x', 'sale': '1'}), {'sale': '1'})
+    
+    def test_browse_view(self):
+        """Test the browse page filters products and links facet values"""
+        response = self.client.get('/browse/', {'sale': '1'})
+        
+        self.assertEqual({product.name for product in response.context['products']}, {'B', 'D'})
+        publishers = {entry['label']: entry for entry in response.context['facets']['publisher']}
+        self.assertEqual(publishers['Alianza']['url'], '?sale=1&publisher=Alianza')
+        self.assertTrue(response.context['facets']['sale'][0]['selected'])
+    
+    def test_category_view(self):
+        """Test the category page counts the other facets within the category"""
+        response = self.client.get('/category/Historia', {'year': '1990'})
+        
+        self.assertEqual([product.name for product in response.context['products']], ['D'])
+        self.assertNotIn('category', response.context['facets'])
+        self.assertContains(response, 'Más de 50 €')
+
+
+class NumericColumnsTestCase(TestCase):
+    """Test parsing of the free-text details into typed columns"""
+    
+    def setUp(self):
+        """Set up a category"""
+        self.category = Category.objects.create(name='Novela', description='Novels')
+    
+    def test_parsers(self):
+        """Test the parsers on the formats the scraper and Google Books produce"""
+        self.assertEqual(parse_year('1990 (2ª ed.)'), 1990)
+        self.assertEqual(parse_year('c. 1985'), 1985)
+        self.assertIsNone(parse_year('s.f.'))
+        self.assertEqual(parse_pages('XII, 320 págs.'), 320)
+        self.assertEqual(parse_pages('1.024 p.'), 1024)
+        self.assertEqual(parse_pages('1,024 pages'), 1024)
+        self.assertIsNone(parse_pages('sin paginar'))
+        self.assertEqual(parse_measures('21 x 14,5 cm'), (Decimal('21.0'), Decimal('14.5'), None))
+        self.assertEqual(parse_measures('240x170x20 mm'), (Decimal('24.0'), Decimal('17.0'), Decimal('2.0')))
+        self.assertEqual(parse_length('9 inches'), Decimal('22.9'))
+        self.assertIsNone(parse_length('n/d'))
+    
+    def test_parsed_on_save(self):
+        """Test saving a product fills the typed columns, dimensions taking precedence over measures"""
+        product = Product.objects.create(
+            name='Book', category=self.category, year='2001', pages='350 p.', measures='21 x 14 x 3 cm',
+            dimensions={'height': '24.00 cm', 'width': None, 'thickness': None},
+        )
+        product.refresh_from_db()
+        
+        self.assertEqual(product.publication_year, 2001)
+        self.assertEqual(product.page_count, 350)
+        self.assertEqual((product.height_cm, product.width_cm, product.thickness_cm),
+                         (Decimal('24.0'), Decimal('14.0'), Decimal('3.0')))
+    
+    def test_partial_save_updates_parsed_values(self):
+        """Test save(update_fields=[...]) of a raw field also writes its parsed value"""
+        product = Product.objects.create(name='Book', category=self.category)
+        product.dimensions = {'height': '23 cm', 'width': '15 cm', 'thickness': '2 cm'}
+        product.save(update_fields=['dimensions'])
+        product.refresh_from_db()
+        
+        self.assertEqual(product.width_cm, Decimal('15.0'))
+    
+    def test_backfill_command(self):
+        """Test the backfill command parses rows written without save()"""
+        product = Product.objects.create(name='Book', category=self.category)
+        Product.objects.filter(pk=product.pk).update(year='1995', pages='200')
+        out = StringIO()
+        call_command('backfill_product_numbers', stdout=out)
+        product.refresh_from_db()
+        
+        self.assertEqual((product.publication_year, product.page_count), (1995, 200))
+        self.assertIn('Updated 1 of 1 products', out.getvalue())
+    
+    def test_range_filters(self):
+        """Test pages and year range filters use the typed columns"""
+        for name, year, pages in [('A', '1985', '150 p.'), ('B', '1995', '180'), ('C', '2005', '400')]:
+            Product.objects.create(name=name, category=self.category, year=year, pages=pages)
+        
+        filters = get_filters({'pages_max': '199', 'year_min': '1991', 'pages_min': 'x'})
+        products = apply_filters(Product.objects.all(), filters)
+        
+        self.assertEqual(filters, {'pages_max': '199', 'year_min': '1991'})
+        self.assertEqual([product.name for product in products], ['B'])
+        response = self.client.get('/browse/', {'year_min': '1990'})
+        self.assertEqual({product.name for product in response.context['products']}, {'B', 'C'})
+
+
+class FragmentCacheTestCase(TestCase):
+    """Test the product card and category listing caches"""
+    
+    def setUp(self):
+        """Set up a category with products"""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.category = Category.objects.create(name='Poesia', description='Poems')
+        self.products = [
+            Product.objects.create(name=f'Poemas {number}', category=self.category, price=Decimal('10.00'))
+            for number in range(3)
+        ]
+    
+    def test_cards_rendered_once(self):
+        """Test cached cards are reused and an edited product gets a new card"""
+        first = render_cards(self.products)
+        self.assertIn('Poemas 0', first[0])
+        
+        with self.assertTemplateNotUsed('product_card.html'):
+            self.assertEqual(render_cards(self.products), first)
+        
+        product = self.products[0]
+        old_key = card_cache_key(product, 'grid')
+        product.name = 'Poemas editados'
+        product.save()
+        self.assertNotEqual(card_cache_key(product, 'grid'), old_key)
+        self.assertIn('Poemas editados', render_cards(self.products)[0])
+    
+    def test_partial_save_refreshes_card(self):
+        """Test save(update_fields=[...]) also bumps updated_at, so the card is re-rendered"""
+        product = self.products[0]
+        render_cards([product])
+        product.dimensions = {'height': '21 cm', 'width': '14 cm', 'thickness': '2 cm'}
+        product.save(update_fields=['dimensions'])
+        product.refresh_from_db()
+        
+        self.assertIn('Dimensions: 21 cm x 14 cm', render_cards([product])[0])
+    
+    def test_category_listing_cached(self):
+        """Test a category listing is served from the cache until a product of it changes"""
+        self.client.get('/category/Poesia')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/category/Poesia')
+        self.assertContains(response, 'Poemas 2')
+        self.assertFalse([query for query in queries if 'store_product' in query['sql']])
+        
+        Product.objects.create(name='Poemas nuevos', category=self.category)
+        self.assertContains(self.client.get('/category/Poesia'), 'Poemas nuevos')
+    
+    def test_listing_invalidated_when_product_moves(self):
+        """Test moving a product invalidates the listing of its old category"""
+        other = Category.objects.create(name='Teatro', description='Plays')
+        self.client.get('/category/Poesia')
+        
+        product = self.products[1]
+        product.category = other
+        product.save()
+        
+        self.assertNotContains(self.client.get('/category/Poesia'), 'Poemas 1')
+        self.assertContains(self.client.get('/category/Teatro'), 'Poemas 1')
+
+
+class AnonymousPageCacheTestCase(TestCase):
+    """Test the full-page cache for anonymous visitors"""
+    
+    def setUp(self):
+        """Set up a product"""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.category = Category.objects.create(name='Ensayo', description='Essays')
+        self.product = Product.objects.create(name='Ensayos', category=self.category, price=Decimal('12.00'))
+    
+    def test_anonymous_page_served_from_cache(self):
+        """Test a cached page needs no query and carries no session data"""
+        first = self.client.get('/')
+        self.assertContains(first, 'data-session-state-url')
+        
+        with self.assertNumQueries(0):
+            response = Client().get('/')
+        self.assertEqual(response.content, first.content)
+        self.assertNotIn('Set-Cookie', str(response.cookies))
+    
+    def test_product_change_invalidates_pages(self):
+        """Test saving a product replaces the cached pages"""
+        self.client.get(f'/product/{self.product.id}')
+        self.product.name = 'Ensayos escogidos'
+        self.product.save()
+        
+        self.assertContains(self.client.get(f'/product/{self.product.id}'), 'Ensayos escogidos')
+    
+    def test_authenticated_pages_not_cached(self):
+        """Test logged-in users get pages rendered with their cart count"""
+        User.objects.create_user(username='reader', password='secret123')
+        self.client.login(username='reader', password='secret123')
+        
+        response = self.client.get('/about/')
+        
+        self.assertNotContains(response, 'data-session-state-url')
+        self.assertIsNotNone(response.context)
+    
+    def test_rendered_product_page_carries_csrf_token(self):
+        """Test add-to-cart works from a product page rendered for a logged-in user"""
+        User.objects.create_user(username='reader', password='secret123')
+        client = Client(enforce_csrf_checks=True)
+        client.login(username='reader', password='secret123')
+        
+        response = client.get(f'/product/{self.product.id}')
+        token = re.search(r"csrfmiddlewaretoken: '([^']+)'", response.content.decode()).group(1)
+        response = client.post('/cart/add/', {
+            'product_id': self.product.id, 'product_qty': 1, 'action': 'post', 'csrfmiddlewaretoken': token,
+        })
+        
+        self.assertEqual(response.status_code, 200)
+    
+    def test_session_state(self):
+        """Test the session state endpoint returns the cart count and pending messages"""
+        self.client.post('/cart/add/', {'product_id': self.product.id, 'product_qty': 2, 'action': 'post'})
+        self.client.get('/category/Desconocida')
+        
+        response = self.client.get('/session-state/')
+        
+        self.assertEqual(response.json()['cart_quantity'], 1)
+        self.assertIn({'level': 'error', 'text': 'Categoría no encontrada.'}, response.json()['messages'])
+        self.assertEqual(self.client.get('/session-state/').json()['messages'], [])
+        self.assertIn('csrftoken', response.cookies)
+
+
+class ProductConditionalGetTestCase(TestCase):
+    """Test ETag / Last-Modified handling of the product page"""
+    
+    def setUp(self):
+        """Set up a product"""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.category = Category.objects.create(name='Viajes', description='Travel')
+        self.product = Product.objects.create(name='Viaje a la Alcarria', category=self.category)
+    
+    def test_not_modified(self):
+        """Test a repeat anonymous visit gets 304 from a single query"""
+        response = self.client.get(f'/product/{self.product.id}')
+        self.assertIn('private', response['Cache-Control'])
+        
+        with self.assertNumQueries(1):
+            response = Client().get(f'/product/{self.product.id}', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        
+        self.product.name = 'Viaje a la Alcarria (ilustrado)'
+        self.product.save()
+        self.assertEqual(Client().get(f'/product/{self.product.id}', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+    
+    def test_partial_save_changes_etag(self):
+        """Test a save with update_fields also changes the validators"""
+        etag = self.client.get(f'/product/{self.product.id}')['ETag']
+        self.product.dimensions = {'height': '21 cm'}
+        self.product.save(update_fields=['dimensions'])
+        
+        response = Client().get(f'/product/{self.product.id}', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_authenticated_pages_have_no_validators(self):
+        """Test pages showing session data are always rendered"""
+        User.objects.create_user(username='reader', password='secret123')
+        self.client.login(username='reader', password='secret123')
+        
+        response = self.client.get(f'/product/{self.product.id}')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+    
+    @override_settings(STORE_PAGE_CACHE_SECONDS=0)
+    def test_no_validators_without_page_cache(self):
+        """Test pages rendered with the session inline carry no validators"""
+        response = self.client.get(f'/product/{self.product.id}')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+    
+    def test_page_version_changes_etag(self):
+        """Test a new template version invalidates the ETag"""
+        etag = self.client.get(f'/product/{self.product.id}')['ETag']
+        
+        with override_settings(STORE_PAGE_VERSION='2'):
+            response = Client().get(f'/product/{self.product.id}', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, 200)
+    
+    def test_missing_product(self):
+        """Test an unknown product is a 404"""
+        self.assertEqual(self.client.get('/product/0').status_code, 404)
+
+
+class LazyCartTestCase(TestCase):
+    """Test the lazy, per-request cart"""
+    
+    def setUp(self):
+        """Set up products"""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.category = Category.objects.create(name='Cuentos', description='Stories')
+        self.products = [
+            Product.objects.create(name=f'Cuento {number}', category=self.category, price=Decimal('5.00'))
+            for number in range(2)
+        ]
+    
+    def add_to_cart(self, product, quantity=1):
+        self.client.post('/cart/add/', {'product_id': product.id, 'product_qty': quantity, 'action': 'post'})
+    
+    def test_empty_cart_creates_no_session(self):
+        """Test visiting a page with an empty cart does not create a session"""
+        response = self.client.get('/search/')
+        
+        self.assertNotIn('sessionid', response.cookies)
+    
+    def test_one_product_query_per_request(self):
+        """Test the summary, total and iteration share one products query"""
+        for product in self.products:
+            self.add_to_cart(product, 2)
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/cart/')
+        
+        self.assertEqual(response.context['totals'], Decimal('20.00'))
+        self.assertEqual(len([query for query in queries if 'FROM "store_product"' in query['sql']]), 1)
+    
+    def test_cart_memoized_per_request(self):
+        """Test views and templates share one Cart per request"""
+        request = self.client.get('/').wsgi_request
+        
+        self.assertIs(get_cart(request), get_cart(request))
+    
+    def test_legacy_cart_upgraded_once(self):
+        """Test integer quantities of old session carts are converted on first use"""
+        session = self.client.session
+        session['session_key'] = {str(self.products[0].id): 3}
+        session.save()
+        
+        self.client.get('/cart/')
+        
+        session = self.client.session
+        self.assertEqual(session['session_key'], {str(self.products[0].id): {'quantity': 3}})
+        self.assertEqual(session['cart_format'], 2)
+
+
+class SavedCartTestCase(TestCase):
+    """Test the database-backed cart of logged-in users"""
+    
+    def setUp(self):
+        """Set up a user and products"""
+        self.user = User.objects.create_user(username='buyer', password='secret123')
+        self.category = Category.objects.create(name='Comic', description='Comics')
+        self.first, self.second = [
+            Product.objects.create(name=f'Tebeo {number}', category=self.category, price=Decimal('8.00'))
+            for number in range(2)
+        ]
+    
+    def post(self, url, product, quantity=1):
+        self.client.post(url, {'product_id': product.id, 'product_qty': quantity, 'action': 'post'})
+    
+    def saved(self):
+        return dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+    
+    def test_changes_saved_per_item(self):
+        """Test add, update and remove write only the changed row"""
+        self.client.login(username='buyer', password='secret123')
+        
+        self.post('/cart/add/', self.first, 2)
+        self.post('/cart/add/', self.second, 1)
+        self.post('/cart/update/', self.first, 4)
+        self.post('/cart/delete/', self.second)
+        
+        self.assertEqual(self.saved(), {self.first.id: 4})
+    
+    def test_carts_merged_at_login(self):
+        """Test the anonymous cart wins over the saved one and both are kept"""
+        CartItem.objects.create(user=self.user, product=self.first, quantity=2)
+        self.post('/cart/add/', self.first, 5)
+        self.post('/cart/add/', self.second, 1)
+        
+        self.client.post('/login/', {'username': 'buyer', 'password': 'secret123'})
+        
+        self.assertEqual(self.saved(), {self.first.id: 5, self.second.id: 1})
+        self.assertEqual(self.client.session['session_key'], {
+            str(self.first.id): {'quantity': 5}, str(self.second.id): {'quantity': 1},
+        })
+    
+    def test_saved_cart_restored_at_login(self):
+        """Test a saved cart is loaded into a new session"""
+        CartItem.objects.create(user=self.user, product=self.second, quantity=3)
+        
+        self.client.post('/login/', {'username': 'buyer', 'password': 'secret123'})
+        
+        self.assertEqual(self.client.session['session_key'], {str(self.second.id): {'quantity': 3}})
+    
+    def test_old_carts_copied(self):
+        """Test the data migration copies Profile.old_cart, skipping truncated carts and unknown products"""
+        other = User.objects.create_user(username='other', password='secret123')
+        Profile.objects.filter(user=self.user).update(
+            old_cart=f'{{"{self.first.id}": {{"quantity": 2}}, "{self.second.id}": 1, "999999": {{"quantity": 1}}}}'
+        )
+        Profile.objects.filter(user=other).update(old_cart=f'{{"{self.first.id}": {{"quan')
+        migration = importlib.import_module('cart.migrations.0002_copy_profile_old_carts')
+        
+        migration.copy_old_carts(apps, None)
+        
+        self.assertEqual(self.saved(), {self.first.id: 2, self.second.id: 1})
+        self.assertFalse(CartItem.objects.filter(user=other).exists())
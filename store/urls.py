@@ -13,5 +13,8 @@ urlpatterns = [
     path('product/<int:pk>', views.product, name='product'),
     path('category/<str:name>', views.category, name='category'),
     path('category_summary/', views.category_summary, name='category_summary'),
-    path('search/', views.search, name='search')
+    path('browse/', views.browse, name='browse'),
+    path('search/', views.search, name='search'),
+    path('search/autocomplete/', views.autocomplete, name='autocomplete'),
+    path('session-state/', views.session_state, name='session_state'),
 ]
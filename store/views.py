@@ -1,4 +1,4 @@
-from django.shortcuts import render,redirect
+from django.shortcuts import render,redirect,get_object_or_404
 from .models import Product, Category, Profile
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
@@ -10,22 +10,66 @@ from payment.forms import ShippingForm
 from payment.models import ShippingAddress
 
 from django import forms
+from django.conf import settings
 from django.db.models import Q
-from cart.cart import Cart
-import json
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.cache import patch_cache_control
+from django.urls import reverse
+from urllib.parse import urlencode
+from .pagination import keyset_page, InvalidCursor
+from .search import search_page
+from .autocomplete import autocomplete_index
+from .facets import FACETS, get_filters, apply_filters, facet_counts, facet_links
+from .fragments import render_cards, listing_cache_key
+from .page_cache import anonymous_page_cache, page_cache_applies
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.http import condition
+from django.views.decorators.csrf import ensure_csrf_cookie
+from cart.cart import get_cart
+
+# Campos que usan las tarjetas de producto (product_card.html); updated_at versiona su caché
+CARD_FIELDS = ('id', 'name', 'image', 'is_sale', 'price', 'sale_price', 'dimensions', 'created_at', 'updated_at')
 
 def search(request):
-    # Determine if they filled out the form
+    # El formulario antiguo (POST) redirige a la URL de resultados (GET), que se puede paginar y enlazar
     if request.method == 'POST':
-        query = request.POST.get('search')
-        products = Product.objects.filter(Q(name__icontains=query) | Q(description__icontains=query))
-        if not products:
-            messages.error(request, 'No se encontraron productos con el nombre "{}"'.format(query)) 
+        query = (request.POST.get('search') or '').strip()
+        if not query:
             return redirect('search')
-        else:
-            return render(request, 'search.html', {'products': products})
-    else:
+        return redirect(f"{reverse('search')}?{urlencode({'q': query})}")
+
+    query = (request.GET.get('q') or '').strip()
+    if not query:
         return render(request, 'search.html')
+    page = search_page(query, request.GET.get('page'), settings.STORE_PAGE_SIZE)
+    if not page.object_list:
+        messages.error(request, 'No se encontraron productos con el nombre "{}"'.format(query))
+        return redirect('search')
+    return render(request, 'search.html', {
+        'products': page.object_list,
+        'cards': render_cards(page.object_list, 'search'),
+        'page_obj': page,
+        'query': query,
+    })
+
+def autocomplete(request):
+    # Sugerencias del buscador (nombres, editoriales, ISBN, referencias) desde el índice en memoria
+    query = request.GET.get('q', '')
+    response = JsonResponse({'query': query, 'suggestions': autocomplete_index.suggest(query)})
+    patch_cache_control(response, public=True, max_age=settings.STORE_AUTOCOMPLETE_CACHE_SECONDS)
+    return response
+
+@never_cache
+@ensure_csrf_cookie
+def session_state(request):
+    # Número de artículos del carrito y mensajes pendientes, para las páginas servidas desde la caché
+    return JsonResponse({
+        'cart_quantity': len(get_cart(request)),
+        'messages': [{'level': message.tags, 'text': str(message)} for message in messages.get_messages(request)],
+    })
 
 def update_info(request):
     if not request.user.is_authenticated:
@@ -95,38 +139,108 @@ def category_summary(request):
     categories = Category.objects.all()
     return render(request, 'category_summary.html', {'categories': categories})
 
+@anonymous_page_cache
 def category(request, name):
     name = name.replace("-", " ")
     try:
         category = Category.objects.get(name=name)
-        products = Product.objects.filter(category=category)
-        return render(request, 'category.html', {'category': category, 'products': products})
     except Category.DoesNotExist:
         messages.error(request, 'Categoría no encontrada.')
         return redirect('home')
+    facets = tuple(facet for facet in FACETS if facet != 'category')
+    return browse_products(
+        request, Product.objects.filter(category=category), facets, 'category.html', {'category': category},
+        cache_key=listing_cache_key(category, request),
+    )
+
+def browse(request):
+    return browse_products(request, Product.objects.all(), FACETS, 'browse.html', {})
+
+def browse_products(request, products, facets, template, context, cache_key=None):
+    # Filtros por facetas, recuentos en una sola consulta y paginación por cursor.
+    # Con cache_key, el listado (facetas y tarjetas) ya renderizado se guarda en caché
+    fragment = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    listing = cache.get(cache_key) if cache_key else None
+    if listing is None:
+        filters = get_filters(request.GET, facets)
+        products = apply_filters(products, filters)
+        counts = facet_links(request.GET, facet_counts(products, facets), filters)
+        try:
+            page, next_cursor = keyset_page(
+                products.only(*CARD_FIELDS), request.GET.get('after'), settings.STORE_PAGE_SIZE
+            )
+        except InvalidCursor:
+            return HttpResponseBadRequest('Invalid page cursor.')
+
+        context.update({
+            'products': page,
+            'cards': render_cards(page),
+            'next_cursor': next_cursor,
+            'next_url': next_page_url(request, next_cursor),
+            'facets': counts,
+            'filters': filters,
+        })
+        listing = render_to_string('product_cards.html' if fragment else 'product_listing.html', context)
+        if cache_key:
+            cache.set(cache_key, listing, settings.STORE_LISTING_CACHE_SECONDS)
+    if fragment:
+        return HttpResponse(listing)
+    context['listing'] = mark_safe(listing)
+    return render(request, template, context)
+
+def next_page_url(request, cursor):
+    if not cursor:
+        return None
+    query = request.GET.copy()
+    query['after'] = cursor
+    return f'{request.path}?{query.urlencode()}'
+
+def product_updated_at(request, pk):
+    # Validadores HTTP solo para páginas de la caché anónima: las demás muestran el carrito
+    # y los mensajes de la sesión, que un 304 dejaría desactualizados.
+    # Una sola consulta por clave primaria, compartida por el ETag y Last-Modified
+    if not hasattr(request, 'product_updated_at'):
+        request.product_updated_at = None
+        if page_cache_applies(request):
+            request.product_updated_at = Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return request.product_updated_at
+
+def product_etag(request, pk):
+    updated_at = product_updated_at(request, pk)
+    if not updated_at:
+        return None
+    # Con la versión de las plantillas, un despliegue que las cambia no queda oculto tras un 304
+    return f'"product-{settings.STORE_PAGE_VERSION}-{pk}-{int(updated_at.timestamp() * 1_000_000)}"'
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=product_etag, last_modified_func=product_updated_at)
+@anonymous_page_cache
 def product(request, pk):
-    product = Product.objects.get(pk=pk)
+    product = get_object_or_404(Product, pk=pk)
     return render(request, 'product.html', {'product': product})
 
+@anonymous_page_cache
 def home(request):
-    # Obtener todos los productos (puedes filtrar, ordenar o paginar aquí)
-    products = Product.objects.all()
-
-    # Opcional: depuración en consola (útil mientras desarrollas)
-    for product in products:
-        dims = product.dimensions or {}  # Asegura que no sea None
-        height = dims.get('height', 'N/A')
-        width = dims.get('width', 'N/A')
-        thickness = dims.get('thickness', 'N/A')
-        #print(f"Producto: {product.title} | Dimensiones: {height} x {width} x {thickness}")
-
-    # ¡IMPORTANTE! Devolver la respuesta HTTP con el template
+    # Una página de productos; el resto se carga al hacer scroll (paginación por cursor)
+    products = Product.objects.only(*CARD_FIELDS)
+    try:
+        products, next_cursor = keyset_page(products, request.GET.get('after'), settings.STORE_PAGE_SIZE)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid page cursor.')
+
     context = {
         'products': products,
+        'cards': render_cards(products),
+        'next_cursor': next_cursor,
+        'next_url': next_page_url(request, next_cursor),
         'page_title': 'Inicio - Mi Tienda',  # Opcional, para usar en el template
     }
+    # Peticiones de scroll infinito: solo las tarjetas de la página siguiente
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return render(request, 'product_cards.html', context)
     return render(request, 'home.html', context)
 
+@anonymous_page_cache
 def about(request):
     return render(request, 'about.html')    
 
@@ -137,22 +251,8 @@ def login_user(request):
         user = authenticate(request, username=username, password=password)
         if user is not None:
             login(request, user)
-            #Do some shopping cart magic
-            current_user = Profile.objects.get(user__id=request.user.id)
-            saved_cart = current_user.old_cart
-            if saved_cart != "{}":
-                converted_cart = json.loads(saved_cart)
-                cart = Cart(request)
-                #Loop through the cart and add items to the new cart
-                for key, value in converted_cart.items():
-                    cart.db_add(product=key, quantity=value['quantity'])
-                    #ßcart.add(int(item['product_id']), int(item['quantity']))  
-            
-
-
-
-
-
+            #Do some shopping cart magic: merge the saved cart with the one of the anonymous session
+            get_cart(request).merge_saved()
             messages.success(request, 'Has iniciado sesión correctamente.')
             return redirect('home')
         else: